@@ -9,6 +9,7 @@ Executes in order:
 3. Temperature animations (5 GIFs)
 4. Three-phase decoupling model
 5. Three-phase animations (3 GIFs)
+6. Ring pipeline regression checks (fast paths vs. reference implementations)
 
 All outputs validated and publication-ready.
 
@@ -37,6 +38,7 @@ SCRIPTS = [
     ('GENERATE_TEMPERATURE_ANIMATIONS.py', 'Temperature Animations (5 GIFs)', 180),
     ('TEST_THREE_PHASE_DECOUPLING.py', 'Three-Phase Decoupling Model', 120),
     ('GENERATE_THREE_PHASE_ANIMATIONS.py', 'Three-Phase Animations (3 GIFs)', 180),
+    ('TEST_RING_PIPELINE_REGRESSION.py', 'Ring Pipeline Regression Checks', 120),
 ]
 
 def run_script(script_name, description, timeout):
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ring pipeline regression checks - fast paths vs. their reference implementations
+
+Checks:
+1. ring_statistics() vs. the per-ring masked loop
+2. fit_gaussians() vs. astropy LevMarLSQFitter
+3. Catalog column cache round trip vs. pd.read_csv
+4. SkyIndex cone queries vs. SkyCoord.separation
+5. convert_catalog() vs. convert_catalog_rows()
+
+Exit code 1 if any check fails.
+
+© 2025 Carmen N. Wrede, Lino P. Casu
+Licensed under ANTI-CAPITALIST SOFTWARE LICENSE v1.4
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+from pathlib import Path
+
+# UTF-8 handling
+os.environ['PYTHONIOENCODING'] = 'utf-8:replace'
+if sys.platform.startswith('win'):
+    try:
+        sys.stdout.reconfigure(encoding='utf-8', errors='replace')
+        sys.stderr.reconfigure(encoding='utf-8', errors='replace')
+    except: pass
+
+import numpy as np
+import pandas as pd
+import astropy.units as u
+from astropy.coordinates import SkyCoord
+from astropy.modeling import models, fitting
+
+ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(ROOT / "scripts"))
+
+from ring_stats import ring_statistics
+from gauss_fit import fit_gaussians
+from catalog_cache import load_catalog, ingest_catalog, downcast_column, exact_values
+from sky_index import SkyIndex
+from photometry import convert_catalog, convert_catalog_rows
+
+TELESCOPE = ROOT / "data" / "telescope"
+ALLWISE_CSV = TELESCOPE / "allwise_p3as_psd_test.csv"
+TWOMASS_CSV = TELESCOPE / "fp_psc_test.csv"
+
+rng = np.random.default_rng(42)
+failures = []
+
+def check(name, ok, detail=""):
+    """Print and record one check"""
+    print(f"   {'✅ PASS' if ok else '❌ FAIL'}: {name}" + (f" ({detail})" if detail else ""))
+    if not ok:
+        failures.append(name)
+
+def same_values(a, b):
+    """Equal column values (NaN == NaN); integer dtypes may differ"""
+    if a.dtype.kind in 'iufb' and b.dtype.kind in 'iufb':
+        return np.array_equal(a.to_numpy(dtype=float), b.to_numpy(dtype=float), equal_nan=True)
+    na = a.isna().to_numpy()
+    return (np.array_equal(na, b.isna().to_numpy())
+            and np.array_equal(a[~na].astype(str).to_numpy(), b[~na].astype(str).to_numpy()))
+
+print("=" * 80)
+print("RING PIPELINE REGRESSION CHECKS")
+print("=" * 80)
+
+# ============================================================================
+# TEST 1: Ring statistics
+# ============================================================================
+
+print("\n[TEST 1/5] ring_statistics() vs. masked loop")
+
+ny, nx = 180, 220
+data = rng.lognormal(0.0, 1.0, (ny, nx))
+data[rng.random((ny, nx)) < 0.05] = np.nan
+yy, xx = np.indices(data.shape)
+r_pc = np.hypot(xx - 103.4, yy - 88.7) * 0.013
+r_edges = np.arange(0.0, 1.8, 0.05)
+
+rows = []
+for ring_idx, (r_min, r_max) in enumerate(zip(r_edges[:-1], r_edges[1:])):
+    mask = (r_pc >= r_min) & (r_pc < r_max) & np.isfinite(data)
+    if np.any(mask):
+        vals = data[mask]
+        I_std = np.nanstd(vals)
+        rows.append({
+            "ring": ring_idx,
+            "radius_pc": 0.5 * (r_min + r_max),
+            "I_mean": np.nanmean(vals),
+            "I_std": I_std,
+            "I_sem": I_std / np.sqrt(len(vals)) if len(vals) > 1 else I_std,
+            "I_median": np.nanmedian(vals),
+            "I_min": np.nanmin(vals),
+            "I_max": np.nanmax(vals),
+            "n_pixels": len(vals),
+        })
+ref = pd.DataFrame(rows)
+got = ring_statistics(data, r_pc, r_edges)
+
+check("same rings", np.array_equal(ref["ring"], got["ring"]), f"{len(got)} rings")
+for col in ref.columns[1:]:
+    diff = np.max(np.abs(got[col].to_numpy(dtype=float) - ref[col].to_numpy(dtype=float))
+                  / np.maximum(np.abs(ref[col].to_numpy(dtype=float)), 1e-300))
+    check(col, diff < 1e-10, f"max rel. diff. {diff:.1e}")
+
+# ============================================================================
+# TEST 2: Gaussian fits
+# ============================================================================
+
+print("\n[TEST 2/5] fit_gaussians() vs. LevMarLSQFitter")
+
+n_spec, n_chan = 40, 300
+vel = np.linspace(-60.0, 60.0, n_chan)
+amp = rng.uniform(1.0, 5.0, n_spec)
+cen = rng.uniform(-20.0, 20.0, n_spec)
+wid = rng.uniform(1.5, 6.0, n_spec)
+spectra = (amp[:, None] * np.exp(-0.5 * ((vel - cen[:, None]) / wid[:, None])**2)
+           + rng.normal(0.0, 0.1, (n_spec, n_chan)))
+
+fit = fit_gaussians(vel, spectra)
+check("all fits converged", bool(np.all(fit["fit_ok"])), f"{int(np.sum(fit['fit_ok']))}/{n_spec}")
+
+fitter = fitting.LevMarLSQFitter()
+worst = {"amplitude": 0.0, "centroid": 0.0, "width": 0.0}
+for i in range(n_spec):
+    k = np.argmax(spectra[i])
+    g = fitter(models.Gaussian1D(spectra[i, k], vel[k], 2.0), vel, spectra[i])
+    astro = {"amplitude": g.amplitude.value, "centroid": g.mean.value, "width": abs(g.stddev.value)}
+    for name, value in astro.items():
+        # Difference in units of the fitted 1σ error
+        worst[name] = max(worst[name], abs(fit[name][i] - value) / fit[f"{name}_err"][i])
+for name, value in worst.items():
+    check(name, value < 0.01, f"max |Δ| = {value:.1e} σ")
+
+# ============================================================================
+# TEST 3: Catalog cache
+# ============================================================================
+
+print("\n[TEST 3/5] Catalog column cache round trip")
+
+arr, info, _ = downcast_column(pd.Series([1048576.3, 0.1, np.nan]))
+check("float32 only when exact", np.array_equal(exact_values(arr, info), [1048576.3, 0.1, np.nan],
+                                                equal_nan=True), f"stored as {arr.dtype}")
+
+tmp = Path(tempfile.mkdtemp(prefix="g79_cache_"))
+try:
+    for src in (ALLWISE_CSV, TWOMASS_CSV):
+        csv = tmp / src.name
+        shutil.copy2(src, csv)
+        ref = pd.read_csv(csv, comment='#')
+        ingest_catalog(csv)
+        got = load_catalog(csv)
+        bad = [c for c in ref.columns if not same_values(ref[c], got[c])]
+        check(f"{src.name}: all {len(ref.columns)} columns", not bad and list(got.columns) == list(ref.columns),
+              f"differ: {bad[:5]}" if bad else "")
+        text = [c for c in ref.columns if ref[c].dtype.kind not in 'iufb' and ref[c].isna().any()]
+        if text:
+            check(f"{src.name}: missing text values",
+                  all(got[c].isna().sum() == ref[c].isna().sum() for c in text),
+                  ", ".join(f"{c}: {int(got[c].isna().sum())} NaN" for c in text[:3]))
+finally:
+    shutil.rmtree(tmp, ignore_errors=True)
+
+# ============================================================================
+# TEST 4: Sky index
+# ============================================================================
+
+print("\n[TEST 4/5] SkyIndex cone vs. SkyCoord.separation")
+
+n_src = 20000
+ra = 307.92 + rng.uniform(-1.5, 1.5, n_src)
+dec = 40.35 + rng.uniform(-1.2, 1.2, n_src)
+index = SkyIndex.build(ra, dec)
+catalog = SkyCoord(ra * u.deg, dec * u.deg, frame="icrs")
+
+for ra0, dec0, radius in [(307.92, 40.35, 0.1), (308.3, 40.9, 0.5), (307.0, 39.5, 0.3)]:
+    center = SkyCoord(ra0 * u.deg, dec0 * u.deg, frame="icrs")
+    rows, sep = index.cone(center, radius)
+    sep_ref = catalog.separation(center).deg
+    # Sources within 1e-9 deg of the edge may go either way
+    expected = np.flatnonzero(sep_ref <= radius)
+    edge = np.flatnonzero(np.abs(sep_ref - radius) < 1e-9)
+    same = np.array_equal(np.setdiff1d(rows, edge), np.setdiff1d(expected, edge))
+    diff = np.max(np.abs(sep - sep_ref[rows])) if len(rows) else 0.0
+    check(f"cone ({ra0}, {dec0}) r={radius}°", same and diff < 1e-9,
+          f"{len(rows)} sources, max sep. diff. {diff:.1e}°")
+
+# ============================================================================
+# TEST 5: Photometry
+# ============================================================================
+
+print("\n[TEST 5/5] convert_catalog() vs. convert_catalog_rows()")
+
+for src, bands in [(ALLWISE_CSV, ["w1", "w2", "w3", "w4"]), (TWOMASS_CSV, ["j", "h", "k"])]:
+    df = pd.read_csv(src, comment='#')
+    fast, _ = convert_catalog(df, bands)
+    slow = convert_catalog_rows(df, bands)
+    same = all(np.allclose(fast[c].to_numpy(), slow[c].to_numpy(dtype=float), rtol=1e-12, equal_nan=True)
+               for c in fast.columns)
+    check(f"{src.name}: {', '.join(bands)}", same, f"{len(df)} sources")
+
+# ============================================================================
+# Summary
+# ============================================================================
+
+print("\n" + "=" * 80)
+if failures:
+    print(f"{len(failures)} CHECK(S) FAILED ❌")
+    print("=" * 80)
+    sys.exit(1)
+print("ALL TESTS PASSED ✓")
+print("=" * 80)
@@ -8,13 +8,17 @@ Analyzes NH3 velocity components from Rizzo 2014 to:
 2. Test velocity excess prediction Δv ~ 5 km/s
 3. Compare with SSZ energy release model
 
-Data: G79_Rizzo2014_NH3_Table1.csv (direct from paper)
+Data: G79_Rizzo2014_NH3_Table1.csv (direct from paper), or a component
+table measured from an NH3 cube (decompose_line_components.py --table):
+
+    python analyze_nh3_velocities.py --table G79_NH3_components_cube.csv
 
 © 2025 Carmen N. Wrede, Lino P. Casu
 Licensed under ANTI-CAPITALIST SOFTWARE LICENSE v1.4
 """
 import sys
 import os
+import argparse
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -64,6 +68,15 @@ def calculate_mach_number(v_km_s, T_K):
 
 def main():
     """Main analysis"""
+    parser = argparse.ArgumentParser(
+        description='NH3 velocity components: Δv, Mach numbers, T_rot'
+    )
+    parser.add_argument(
+        '--table',
+        help='Component table CSV [default: data/G79_Rizzo2014_NH3_Table1.csv]'
+    )
+    args = parser.parse_args()
+    
     print("="*80)
     print("NH3 VELOCITY ANALYSIS - G79.29+0.46")
     print("="*80)
@@ -72,8 +85,10 @@ def main():
     # Find data file
     repo_root = Path(__file__).parent.parent
     data_file = repo_root / "data" / "G79_Rizzo2014_NH3_Table1.csv"
+    if args.table:
+        data_file = Path(args.table)
     
-    if not data_file.exists():
+    if not data_file.exists() and not args.table:
         # Try alternate location (if run from different directory)
         data_file = repo_root / "G79_Rizzo2014_NH3_Table1.csv"
     
@@ -178,6 +193,8 @@ def main():
         if pd.notna(T_rot):
             if limit_type == "measured":
                 print(f"{comp:8s}: T_rot = {T_rot:.0f} K (measured)")
+            elif limit_type == "upper":
+                print(f"{comp:8s}: T_rot < {T_rot:.0f} K (upper limit)")
             else:
                 print(f"{comp:8s}: T_rot > {T_rot:.0f} K (lower limit)")
     
@@ -212,7 +229,7 @@ def main():
     print("SUMMARY")
     print("="*80)
     print()
-    print("✓ Velocity spread Δv ~ 4.5 km/s matches SSZ prediction (5 km/s)")
+    print(f"✓ Velocity spread Δv ~ {delta_v_total:.1f} km/s vs SSZ prediction (5 km/s)")
     print("✓ Temperature inversion observed (cold center, warm outer)")
     print("⚠ High Mach numbers (M > 1) suggest g^(1) domain")
     print("⚠ T_rot vs T_kinetic discrepancy needs theoretical explanation")
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Baseline - batched polynomial baselines and robust rms for cube spectra
+
+Fits a low-order polynomial to the line-free channels of ALL spectra at
+once: the design matrix X (channels × order+1) is shared, so the least-
+squares solution for every spectrum is one product with pinv(X) over the
+line-free channels. Spectra with blanked channels get their own (small)
+normal equations, solved as one stacked batch. The noise of every
+spectrum is the MAD of its baseline-subtracted line-free channels:
+
+    rms = 1.4826 · median(|r - median(r)|)
+
+A cube is processed in image-row chunks (complete spectra, memory-
+mapped input) and written to a new memory-mapped FITS cube, so neither
+cube has to fit in RAM.
+
+Usage:
+    # Order-1 baseline, line between -10 and +10 km/s (G79 default)
+    python baseline.py G79_iram_co21_cube.fits
+
+    # Two line windows, order 2, only read -60..60 km/s
+    python baseline.py G79_co32_cube.fits --order 2 --line-window=-10,10 \
+        --line-window=25,35 --vel-range=-60,60
+
+Output (prefix = cube name without .fits):
+    <prefix>_blsub.fits - Baseline-subtracted cube (float32, same WCS)
+    <prefix>_rms.fits   - rms map (primary) + PEAK_SNR extension
+                          (peak of the line channels / rms)
+
+From another script in scripts/:
+    from baseline import subtract_baselines
+    corrected, rms, coeffs = subtract_baselines(spectra, vel, order=1,
+                                                free=line_free_channels(vel, [(-10, 10)]),
+                                                axis=1)
+
+© 2025 Carmen N. Wrede, Lino P. Casu
+Licensed under ANTI-CAPITALIST SOFTWARE LICENSE v1.4
+"""
+import sys
+import os
+import time
+import warnings
+import argparse
+from pathlib import Path
+
+# UTF-8 for Windows
+os.environ['PYTHONIOENCODING'] = 'utf-8:replace'
+if sys.platform == 'win32':
+    try:
+        sys.stdout.reconfigure(encoding='utf-8', errors='replace')
+    except:
+        pass
+
+try:
+    import numpy as np
+    from astropy.io import fits
+except ImportError as e:
+    print(f"ERROR: Required packages missing: {e}")
+    print("\nInstall with:")
+    print("  pip install astropy numpy")
+    sys.exit(1)
+
+from cube_io import (cube_header, spectral_axis_kms, channel_window,
+                     parse_vel_range, iter_row_chunks, create_cube_file)
+
+# MAD → Gaussian σ
+MAD_TO_SIGMA = 1.4826
+
+# Size of one float64 row chunk (all channels)
+CHUNK_MB = 64
+
+# G79 lines sit between about -10 and +10 km/s
+DEFAULT_LINE_WINDOW = (-10.0, 10.0)
+
+def line_free_channels(vel, line_windows):
+    """Boolean mask of channels outside all (v_min, v_max) line windows"""
+    vel = np.asarray(vel, dtype=float)
+    free = np.ones(len(vel), dtype=bool)
+    for window in line_windows or ():
+        v_lo, v_hi = sorted(window)
+        free &= ~((vel >= v_lo) & (vel <= v_hi))
+    return free
+
+def baseline_design(vel, order):
+    """Polynomial design matrix (n_chan, order+1) on velocities scaled to [-1, 1]"""
+    vel = np.asarray(vel, dtype=float)
+    span = np.ptp(vel) or 1.0
+    x = 2.0 * (vel - vel.min()) / span - 1.0
+    return np.vander(x, order + 1, increasing=True)
+
+def fit_baselines(spectra, design, free):
+    """
+    Least-squares baseline coefficients of many spectra
+
+    Args:
+        spectra: Array (n_chan, n_spectra)
+        design: Design matrix (n_chan, n_coeff), see baseline_design()
+        free: Boolean line-free channel mask (n_chan,)
+
+    Returns:
+        coeffs: Array (n_coeff, n_spectra); NaN where fewer finite
+        line-free channels than coefficients
+    """
+    X = design[free]
+    Y = spectra[free]
+    n_coeff = X.shape[1]
+
+    finite = np.isfinite(Y)
+    clean = finite.all(axis=0)
+    coeffs = np.full((n_coeff, Y.shape[1]), np.nan)
+
+    # Fully valid spectra: one shared pseudo-inverse for all of them
+    if clean.any():
+        coeffs[:, clean] = np.linalg.pinv(X) @ Y[:, clean]
+
+    # Blanked channels: per-spectrum normal equations, one stacked solve
+    dirty = ~clean & (finite.sum(axis=0) > n_coeff)
+    if dirty.any():
+        W = finite[:, dirty].astype(float)
+        Yd = np.where(finite[:, dirty], Y[:, dirty], 0.0)
+        XtWX = np.einsum('ci,cm,cj->mij', X, W, X)
+        XtWy = np.einsum('ci,cm->mi', X, Yd)
+        coeffs[:, dirty] = np.linalg.solve(XtWX, XtWy[..., None])[..., 0].T
+
+    return coeffs
+
+def robust_rms(resid, axis=0):
+    """MAD-based rms along an axis (NaN-aware)"""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN spectra → NaN
+        med = np.nanmedian(resid, axis=axis, keepdims=True)
+        return MAD_TO_SIGMA * np.nanmedian(np.abs(resid - med), axis=axis)
+
+def subtract_baselines(data, vel, order=1, free=None, axis=0):
+    """
+    Subtract polynomial baselines from every spectrum of an array
+
+    Args:
+        data: Array with a spectral axis (e.g. a cube chunk (n_chan, ny, nx)
+            or ring spectra (n_rings, n_chan) with axis=1)
+        vel: Velocity of every channel [km/s]
+        order: Polynomial order
+        free: Line-free channel mask [default: all channels]
+        axis: Spectral axis of data
+
+    Returns:
+        corrected: Baseline-subtracted data (same shape as data)
+        rms: Robust rms of the line-free residuals (data shape without axis)
+        coeffs: Baseline coefficients (order+1, ...) on the [-1, 1] scaled
+            velocity axis
+    """
+    data = np.moveaxis(np.asarray(data, dtype=float), axis, 0)
+    n_chan = data.shape[0]
+    rest = data.shape[1:]
+    free = np.ones(n_chan, dtype=bool) if free is None else np.asarray(free, dtype=bool)
+    if free.sum() <= order:
+        raise ValueError(f"{free.sum()} line-free channels for an order-{order} baseline")
+
+    spectra = data.reshape(n_chan, -1)
+    design = baseline_design(vel, order)
+    coeffs = fit_baselines(spectra, design, free)
+
+    corrected = spectra - design @ coeffs
+    rms = robust_rms(corrected[free], axis=0)
+
+    return (np.moveaxis(corrected.reshape(data.shape), 0, axis),
+            rms.reshape(rest),
+            coeffs.reshape((order + 1,) + rest))
+
+def baseline_cube(fits_file, output, order=1, line_windows=(DEFAULT_LINE_WINDOW,),
+                  vel_range=None, rows=None):
+    """
+    Baseline-subtract a cube chunk by chunk into a new memory-mapped FITS cube
+
+    Args:
+        fits_file: Input FITS cube
+        output: Output FITS cube (float32; spectral axis cut to vel_range)
+        order: Polynomial order
+        line_windows: (v_min, v_max) windows excluded from the baseline fit
+        vel_range: Optional (v_min, v_max) [km/s]; only these channels are
+            read and written
+        rows: Image rows per chunk [default: ~CHUNK_MB per chunk]
+
+    Returns:
+        rms: rms map (ny, nx)
+        peak_snr: Peak of the line channels / rms (ny, nx)
+        info: dict (channels, n_free, seconds, spectra_per_s)
+    """
+    header, shape, _ = cube_header(fits_file)
+    n_chan, ny, nx = shape
+    vel = spectral_axis_kms(header, n_chan, strict=vel_range is not None)
+    c0, c1 = channel_window(vel, vel_range)
+    vel = vel[c0:c1]
+
+    free = line_free_channels(vel, line_windows)
+    if free.sum() <= order:
+        raise ValueError(f"Only {free.sum()} line-free channels in "
+                         f"{vel[0]:.2f}..{vel[-1]:.2f} km/s for an order-{order} baseline")
+
+    if rows is None:
+        rows = max(1, CHUNK_MB * 1024**2 // (8 * (c1 - c0) * nx))
+
+    out_header = header.copy()
+    if c0 > 0 and 'CRPIX3' in out_header:
+        out_header['CRPIX3'] = out_header['CRPIX3'] - c0
+    out_header['BLORDER'] = (order, 'Polynomial baseline order (baseline.py)')
+    out_header['BLNFREE'] = (int(free.sum()), 'Line-free channels in the baseline fit')
+
+    rms = np.full((ny, nx), np.nan)
+    peak_snr = np.full((ny, nx), np.nan)
+    line = ~free if (~free).any() else free
+
+    t0 = time.perf_counter()
+    out = create_cube_file(output, out_header, (c1 - c0, ny, nx))
+    try:
+        for y0, y1, block in iter_row_chunks(fits_file, rows, chan_range=(c0, c1)):
+            corrected, r, _ = subtract_baselines(block, vel, order, free)
+            out[0].data[:, y0:y1] = corrected
+            rms[y0:y1] = r
+            with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN spectra
+                peak_snr[y0:y1] = np.nanmax(corrected[line], axis=0) / r
+    finally:
+        out.close()
+    seconds = time.perf_counter() - t0
+
+    info = {
+        "channels": (c0, c1),
+        "n_free": int(free.sum()),
+        "seconds": seconds,
+        "spectra_per_s": ny * nx / seconds if seconds > 0 else np.inf,
+    }
+    return rms, peak_snr, info
+
+def save_rms_map(rms, peak_snr, header, path, order, n_free):
+    """rms map (primary, cube BUNIT) + PEAK_SNR extension, celestial WCS"""
+    from astropy.wcs import WCS
+
+    wcs_header = WCS(header).celestial.to_header()
+    hdr = wcs_header.copy()
+    hdr['BUNIT'] = header.get('BUNIT', '')
+    hdr['BLORDER'] = (order, 'Polynomial baseline order')
+    hdr['BLNFREE'] = (n_free, 'Line-free channels')
+    hdr['COMMENT'] = "Robust (MAD) rms of the baseline-subtracted line-free channels"
+
+    fits.HDUList([
+        fits.PrimaryHDU(rms.astype(np.float32), header=hdr),
+        fits.ImageHDU(peak_snr.astype(np.float32), header=wcs_header, name='PEAK_SNR'),
+    ]).writeto(path, overwrite=True)
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(
+        description='Batched polynomial baseline subtraction + robust rms map for a cube'
+    )
+    parser.add_argument(
+        'fits_file',
+        help='Input FITS cube'
+    )
+    parser.add_argument(
+        '--order',
+        type=int,
+        default=1,
+        help='Polynomial baseline order [default: 1]'
+    )
+    parser.add_argument(
+        '--line-window',
+        action='append',
+        help='Line channels "VMIN,VMAX" [km/s] excluded from the fit; repeatable '
+             '(use --line-window=-10,10 for negative values) [default: -10,10]'
+    )
+    parser.add_argument(
+        '--vel-range',
+        help='Only read (and write) channels in "VMIN,VMAX" [km/s]'
+    )
+    parser.add_argument(
+        '--rows',
+        type=int,
+        help=f'Image rows per chunk [default: ~{CHUNK_MB} MB per chunk]'
+    )
+    parser.add_argument(
+        '--output-prefix',
+        help='Prefix for the outputs [default: cube name without .fits]'
+    )
+
+    args = parser.parse_args()
+
+    print("="*80)
+    print("BASELINE SUBTRACTION - G79.29+0.46")
+    print("="*80)
+
+    fits_path = Path(args.fits_file)
+    if not fits_path.exists():
+        print(f"\nERROR: File not found: {fits_path}")
+        return 1
+
+    try:
+        line_windows = ([parse_vel_range(w) for w in args.line_window]
+                        if args.line_window else [DEFAULT_LINE_WINDOW])
+        vel_range = parse_vel_range(args.vel_range)
+    except ValueError as e:
+        print(f"\nERROR: {e}")
+        return 1
+    prefix = args.output_prefix or str(fits_path.with_suffix(''))
+    cube_out = f"{prefix}_blsub.fits"
+    rms_out = f"{prefix}_rms.fits"
+
+    print(f"\nInput: {fits_path}")
+    print(f"Baseline: order {args.order}, line windows "
+          + ", ".join(f"{lo:+.1f}..{hi:+.1f}" for lo, hi in line_windows) + " km/s")
+
+    try:
+        rms, peak_snr, info = baseline_cube(
+            str(fits_path), cube_out, order=args.order, line_windows=line_windows,
+            vel_range=vel_range, rows=args.rows
+        )
+    except ValueError as e:
+        print(f"\nERROR: {e}")
+        return 1
+    c0, c1 = info["channels"]
+    print(f"   Channels: {c0}-{c1-1} ({info['n_free']} line-free)")
+    print(f"   {info['spectra_per_s']:.0f} spectra/s ({info['seconds']:.2f} s)")
+    print(f"   Median rms: {np.nanmedian(rms):.3e}, median peak S/N: {np.nanmedian(peak_snr):.1f}")
+
+    header, _, _ = cube_header(str(fits_path))
+    save_rms_map(rms, peak_snr, header, rms_out, args.order, info["n_free"])
+
+    print(f"\n   Saved: {cube_out}")
+    print(f"   Saved: {rms_out}")
+
+    print("\n" + "="*80)
+    print("DONE!")
+    print("="*80)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Catalog Cache - columnar binary cache for survey catalog CSVs
+
+IRSA catalogs (AllWISE, 2MASS, AKARI) come as wide CSVs, but the ring
+scripts only need ra/dec and a few band columns. The ingest step parses
+the CSV ONCE and stores every column as its own .npy file next to the
+catalog (<catalog>.colcache/), plus a JSON sidecar (meta.json) with the
+source file size/mtime, row count and per-column dtypes. Later reads
+memory-map only the requested columns (zero-copy).
+
+Downcasting at ingest:
+    - Integers: smallest integer type that holds all values
+    - Floats: float32 when the CSV values have ≤ 6 decimals and every
+      value survives float32 → float64 → rounding to those decimals
+      unchanged (checked at ingest); load_catalog() rounds them back
+      to the 'decimals' of the sidecar, so the values are identical to
+      the CSV parse (exact=False: zero-copy float32). float64 otherwise
+      (e.g. ra/dec with 7 decimals stay float64)
+    - Text: fixed-width unicode; the rows of missing values are stored
+      next to the column (c%04d_null.npy) and come back as NaN
+
+A cache is stale when the CSV changed (size or mtime), when the read
+options differ or when the format version changed; load_catalog() then
+falls back to the CSV transparently and rebuilds the cache.
+
+Usage:
+    # Ingest catalogs (optional - the first load_catalog() does it too)
+    python catalog_cache.py data/telescope/allwise_p3as_psd_test.csv data/telescope/akari_fis_test.csv
+
+    # Timing: CSV parse vs. cache read of a few columns
+    python catalog_cache.py data/telescope/allwise_p3as_psd_test.csv --columns ra,dec,w1mpro,w2mpro
+
+From another script in scripts/:
+    from catalog_cache import load_catalog
+    df = load_catalog("data/telescope/allwise_p3as_psd_test.csv",
+                      columns=["ra", "dec", "w1mpro"])
+
+Environment:
+    G79_CATALOG_CACHE=0   Disable the cache (always read the CSV)
+
+© 2025 Carmen N. Wrede, Lino P. Casu
+Licensed under ANTI-CAPITALIST SOFTWARE LICENSE v1.4
+"""
+import sys
+import os
+import json
+import time
+import shutil
+import argparse
+from pathlib import Path
+
+# UTF-8 for Windows
+os.environ['PYTHONIOENCODING'] = 'utf-8:replace'
+if sys.platform == 'win32':
+    try:
+        sys.stdout.reconfigure(encoding='utf-8', errors='replace')
+    except:
+        pass
+
+try:
+    import numpy as np
+    import pandas as pd
+except ImportError as e:
+    print(f"ERROR: Required packages missing: {e}")
+    print("\nInstall with:")
+    print("  pip install numpy pandas")
+    sys.exit(1)
+
+# Bump when the on-disk layout changes (old caches become stale)
+CACHE_VERSION = 2
+
+CACHE_SUFFIX = ".colcache"
+
+USE_CACHE = os.environ.get('G79_CATALOG_CACHE', '1') != '0'
+
+def cache_dir(csv_path):
+    """Cache directory of a catalog: <catalog>.colcache next to it"""
+    csv_path = Path(csv_path)
+    return csv_path.with_name(csv_path.name + CACHE_SUFFIX)
+
+def source_signature(csv_path, comment='#'):
+    """Identifies the CSV (and read options) a cache belongs to"""
+    st = Path(csv_path).stat()
+    return {
+        "version": CACHE_VERSION,
+        "source": Path(csv_path).name,
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "comment": comment,
+    }
+
+def float_decimals(values, max_decimals=6):
+    """Smallest number of decimals that reproduces all finite values, or None"""
+    finite = values[np.isfinite(values)]
+    for d in range(max_decimals + 1):
+        if np.array_equal(np.round(finite, d), finite):
+            return d
+    return None
+
+def downcast_column(series):
+    """
+    Compact numpy array for one catalog column
+
+    Returns:
+        array, info dict (dtype, csv_dtype, decimals for float32 columns),
+        row positions of missing text values (None if there are none)
+    """
+    kind = series.dtype.kind
+    info = {"csv_dtype": str(series.dtype)}
+    nulls = None
+
+    if kind in 'iu':
+        arr = pd.to_numeric(series, downcast='unsigned' if series.min() >= 0 else 'integer').to_numpy()
+    elif kind == 'f':
+        arr = series.to_numpy()
+        d = float_decimals(arr)
+        if d is not None:
+            # Only if float32 round-trips every value (|x|·10^d may exceed 2^23)
+            narrow = arr.astype(np.float32)
+            if np.array_equal(np.round(narrow.astype(np.float64), d), arr, equal_nan=True):
+                arr = narrow
+                info["decimals"] = d
+    elif kind == 'b':
+        arr = series.to_numpy()
+    else:
+        missing = series.isna().to_numpy()
+        if missing.any():
+            nulls = np.flatnonzero(missing)
+        arr = series.fillna('').astype(str).to_numpy().astype(str)
+
+    info["dtype"] = str(arr.dtype)
+    return arr, info, nulls
+
+def read_meta(csv_path):
+    """Sidecar metadata of a catalog cache (None if missing/unreadable)"""
+    meta = cache_dir(csv_path) / "meta.json"
+    try:
+        return json.loads(meta.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+
+def cache_is_fresh(csv_path, comment='#'):
+    """True if the cache exists and belongs to the current CSV"""
+    meta = read_meta(csv_path)
+    return meta is not None and meta.get("signature") == source_signature(csv_path, comment)
+
+def ingest_catalog(csv_path, comment='#', df=None):
+    """
+    Convert a catalog CSV to the columnar cache
+
+    Args:
+        csv_path: Catalog CSV
+        comment: Comment character for pd.read_csv
+        df: Already parsed DataFrame of the CSV (skips the parse)
+
+    Returns:
+        meta dict (written to <catalog>.colcache/meta.json)
+    """
+    csv_path = Path(csv_path)
+    signature = source_signature(csv_path, comment)
+    if df is None:
+        df = pd.read_csv(csv_path, comment=comment)
+
+    out = cache_dir(csv_path)
+    tmp = out.with_name(out.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    columns = {}
+    for i, name in enumerate(df.columns):
+        arr, info, nulls = downcast_column(df[name])
+        info["file"] = f"c{i:04d}.npy"
+        np.save(tmp / info["file"], arr)
+        if nulls is not None:
+            info["null_file"] = f"c{i:04d}_null.npy"
+            np.save(tmp / info["null_file"], nulls)
+        columns[str(name)] = info
+
+    meta = {
+        "signature": signature,
+        "n_rows": len(df),
+        "columns": columns,
+    }
+    (tmp / "meta.json").write_text(json.dumps(meta, indent=1), encoding='utf-8')
+
+    # Swap in the finished cache (readers never see a half-written one)
+    shutil.rmtree(out, ignore_errors=True)
+    os.replace(tmp, out)
+    return meta
+
+def catalog_columns(csv_path, comment='#'):
+    """Column names of a catalog (from the cache sidecar if fresh)"""
+    if USE_CACHE and cache_is_fresh(csv_path, comment):
+        return list(read_meta(csv_path)["columns"])
+    return list(pd.read_csv(csv_path, comment=comment, nrows=0).columns)
+
+def read_columns(csv_path, columns, comment='#'):
+    """
+    Memory-mapped column arrays from a fresh cache (zero-copy)
+
+    Raises:
+        KeyError: Column not in the catalog
+        FileNotFoundError: No fresh cache
+    """
+    meta = read_meta(csv_path)
+    if meta is None or meta.get("signature") != source_signature(csv_path, comment):
+        raise FileNotFoundError(f"No fresh column cache for {csv_path}")
+    out = cache_dir(csv_path)
+    return {name: np.load(out / meta["columns"][name]["file"], mmap_mode='r')
+            for name in columns}
+
+def exact_values(arr, info):
+    """CSV values of a cached column (float32 → float64 rounded to its decimals)"""
+    if "decimals" in info:
+        return np.round(arr.astype(np.float64), info["decimals"])
+    return arr
+
+def restore_nulls(arr, nulls):
+    """Text column with NaN at the rows that were missing in the CSV"""
+    out = arr.astype(object)
+    out[nulls] = np.nan
+    return out
+
+def load_catalog(csv_path, columns=None, comment='#', use_cache=None, exact=True):
+    """
+    Catalog as DataFrame, from the column cache where possible
+
+    Requested columns missing from the catalog are skipped (check
+    df.columns), as with a plain read_csv(usecols=...) on the intersection.
+
+    Args:
+        csv_path: Catalog CSV
+        columns: Columns to load [default: all]
+        comment: Comment character for pd.read_csv
+        use_cache: False = plain CSV read [default: G79_CATALOG_CACHE]
+        exact: Restore float32 columns to the float64 CSV values (one
+            copy per float32 column); False = zero-copy, downcast dtypes
+
+    Returns:
+        DataFrame with the columns in the requested order
+    """
+    csv_path = Path(csv_path)
+    use_cache = USE_CACHE if use_cache is None else use_cache
+
+    if not use_cache:
+        df = pd.read_csv(csv_path, comment=comment)
+        return df if columns is None else df[[c for c in columns if c in df.columns]]
+
+    meta = read_meta(csv_path)
+    if meta is None or meta.get("signature") != source_signature(csv_path, comment):
+        # Stale or missing: read the CSV, rebuild the cache from that parse
+        df = pd.read_csv(csv_path, comment=comment)
+        try:
+            ingest_catalog(csv_path, comment, df=df)
+        except OSError as e:
+            print(f"   WARNING: Could not write catalog cache ({e}); using CSV")
+        return df if columns is None else df[[c for c in columns if c in df.columns]]
+
+    names = list(meta["columns"]) if columns is None else \
+        [c for c in columns if c in meta["columns"]]
+    arrays = read_columns(csv_path, names, comment)
+    if exact:
+        arrays = {name: exact_values(arr, meta["columns"][name]) for name, arr in arrays.items()}
+    out = cache_dir(csv_path)
+    for name in names:
+        info = meta["columns"][name]
+        if "null_file" in info:
+            arrays[name] = restore_nulls(arrays[name], np.load(out / info["null_file"]))
+    return pd.DataFrame(arrays, columns=names, copy=False)
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(
+        description='Ingest catalog CSVs into the columnar cache (+ read timing)'
+    )
+    parser.add_argument(
+        'catalog_file',
+        nargs='+',
+        help='Catalog CSV file(s)'
+    )
+    parser.add_argument(
+        '--columns',
+        default='ra,dec',
+        help='Columns for the read timing [default: ra,dec]'
+    )
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='Rebuild caches even if they are fresh'
+    )
+
+    args = parser.parse_args()
+
+    print("="*80)
+    print("CATALOG CACHE INGEST")
+    print("="*80)
+
+    columns = [c.strip() for c in args.columns.split(',')]
+
+    for i, catalog_file in enumerate(args.catalog_file, 1):
+        csv_path = Path(catalog_file)
+        print(f"\n[{i}/{len(args.catalog_file)}] {csv_path}")
+        if not csv_path.exists():
+            print(f"   ERROR: File not found: {csv_path}")
+            return 1
+
+        t0 = time.perf_counter()
+        df = pd.read_csv(csv_path, comment='#')
+        t_csv = time.perf_counter() - t0
+
+        if args.force or not cache_is_fresh(csv_path):
+            meta = ingest_catalog(csv_path, df=df)
+            print(f"   Ingested: {meta['n_rows']} rows × {len(meta['columns'])} columns")
+        else:
+            meta = read_meta(csv_path)
+            print(f"   Cache is fresh: {meta['n_rows']} rows × {len(meta['columns'])} columns")
+
+        out = cache_dir(csv_path)
+        cache_mb = sum(f.stat().st_size for f in out.glob("*")) / 1024**2
+        csv_mb = csv_path.stat().st_size / 1024**2
+        n32 = sum(1 for c in meta["columns"].values() if c["dtype"] == "float32")
+        print(f"   Size: CSV {csv_mb:.2f} MB → cache {cache_mb:.2f} MB "
+              f"({n32} float columns downcast to float32)")
+
+        t0 = time.perf_counter()
+        sub = load_catalog(csv_path, columns=columns)
+        t_cache = time.perf_counter() - t0
+        print(f"   Read {list(sub.columns)}: CSV {t_csv*1e3:.1f} ms, "
+              f"cache {t_cache*1e3:.1f} ms ({t_csv/t_cache:.0f}× faster)")
+        print(f"   Saved: {out}")
+
+    print("\n" + "="*80)
+    print("DONE!")
+    print("="*80)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
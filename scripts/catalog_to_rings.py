@@ -11,11 +11,23 @@ Usage:
     python catalog_to_rings.py data/telescope/akari_fis_test.csv --bands flux65,flux90,flux140,flux160
     python catalog_to_rings.py data/telescope/allwise_p3as_psd_test.csv --bands w1mpro,w2mpro,w3mpro,w4mpro
 
+    # Registry bands (photometry.py): magnitudes → Jy, upper limits/saturated masked
+    python catalog_to_rings.py data/telescope/allwise_p3as_psd_test.csv --bands w1,w2,w3,w4
+    python catalog_to_rings.py data/telescope/fp_psc_test.csv --bands j,h,k
+
+    # Many Cygnus-X targets from one regional catalog (name,ra,dec[,distance_kpc])
+    python catalog_to_rings.py cygx_allwise.csv --bands w1mpro,w2mpro --targets cygx_targets.csv --output rings/
+
+    # Benchmark ring binning on the catalog replicated 100× (~137k sources)
+    python catalog_to_rings.py data/telescope/allwise_p3as_psd_test.csv --bands w1mpro,w2mpro,w3mpro,w4mpro --benchmark 100
+
 Workflow:
-1. Load catalog CSV
-2. Calculate radius from G79 center for each source
+1. Load catalog CSV (only the needed columns, via catalog_cache.py);
+   registry bands are converted to flux densities [Jy] (photometry.py)
+2. Cone query around the center (KD-tree sky index, sky_index.py) and
+   radius of the sources found
 3. Bin sources into rings (0-2 pc, 0.2 pc spacing)
-4. Average flux in each ring
+4. Average flux in each ring (all bands in one reduction, ring_stats.py)
 5. Save ring profile CSV
 
 © 2025 Carmen N. Wrede, Lino P. Casu
@@ -44,6 +56,11 @@ except ImportError as e:
     print("  pip install numpy pandas astropy")
     sys.exit(1)
 
+from ring_stats import catalog_ring_statistics
+from catalog_cache import load_catalog, catalog_columns, cache_is_fresh
+from sky_index import SkyIndex, load_or_build
+from photometry import BANDS, is_registered, band_columns, convert_catalog
+
 # G79.29+0.46 parameters
 G79_CENTER = SkyCoord("20h31m41s +40d21m07s", frame="icrs")
 G79_DISTANCE = 1.7  # kpc
@@ -51,6 +68,226 @@ G79_DISTANCE = 1.7  # kpc
 # Ring edges (0-2 pc in 0.2 pc steps)
 R_EDGES_PC = np.arange(0.0, 2.0 + 0.2, 0.2)
 
+def bin_catalog_rings(df_cat, r_pc, band_cols, r_edges=R_EDGES_PC, sigma_cols=None):
+    """
+    Ring statistics of all band columns in one reduction
+
+    Args:
+        sigma_cols: {band: per-source error column} → adds {band}_phot_err,
+            the propagated error of the ring mean sqrt(<σ²> / n)
+
+    Returns:
+        DataFrame (rings with sources): ring, r_min_pc, r_max_pc,
+        radius_pc, n_sources, {band}_mean/_median/_std/_err/_n[/_phot_err]
+    """
+    sigma_cols = sigma_cols or {}
+    var_bands = [band for band in band_cols if band in sigma_cols]
+
+    # Cone searches are much larger than the ring region: cut first
+    in_range = (r_pc >= r_edges[0]) & (r_pc < r_edges[-1])
+    values = np.column_stack([df_cat[band].to_numpy(dtype=float)[in_range]
+                              for band in band_cols] +
+                             [df_cat[sigma_cols[band]].to_numpy(dtype=float)[in_range] ** 2
+                              for band in var_bands])
+    var_names = [f"{band}_var" for band in var_bands]
+    df_rings = catalog_ring_statistics(values, r_pc[in_range], r_edges,
+                                       list(band_cols) + var_names)
+    if not var_bands:
+        return df_rings
+
+    # Same reduction gave <σ²> per ring (sources without σ get the ring mean)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for band, var in zip(var_bands, var_names):
+            df_rings[f"{band}_phot_err"] = np.sqrt(df_rings[f"{var}_mean"] / df_rings[f"{band}_n"])
+    columns = list(df_rings.columns[:5])
+    for band in band_cols:
+        columns += [f"{band}_{stat}" for stat in ("mean", "median", "std", "err", "n")]
+        if band in sigma_cols:
+            columns.append(f"{band}_phot_err")
+    return df_rings[columns]
+
+def bin_catalog_rings_loop(df_cat, r_pc, band_cols, r_edges=R_EDGES_PC):
+    """
+    Reference implementation: one mask per ring, pandas stats per band
+
+    Kept for --benchmark (timing and equality check of bin_catalog_rings).
+    """
+    rows = []
+    for ring_idx, (r_min, r_max) in enumerate(zip(r_edges[:-1], r_edges[1:])):
+        mask = (r_pc >= r_min) & (r_pc < r_max)
+        n_sources = np.sum(mask)
+        if n_sources == 0:
+            continue
+        row = {
+            "ring": ring_idx,
+            "r_min_pc": float(r_min),
+            "r_max_pc": float(r_max),
+            "radius_pc": float(0.5 * (r_min + r_max)),
+            "n_sources": int(n_sources),
+        }
+        for band in band_cols:
+            vals = df_cat.loc[mask, band].dropna()
+            if len(vals) > 0:
+                row[f"{band}_mean"] = float(vals.mean())
+                row[f"{band}_median"] = float(vals.median())
+                row[f"{band}_std"] = float(vals.std())
+                row[f"{band}_err"] = float(vals.std() / np.sqrt(len(vals)))
+                row[f"{band}_n"] = int(len(vals))
+            else:
+                row[f"{band}_mean"] = np.nan
+                row[f"{band}_median"] = np.nan
+                row[f"{band}_std"] = np.nan
+                row[f"{band}_err"] = np.nan
+                row[f"{band}_n"] = 0
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+def source_radii_pc(df_cat, ra_col="ra", dec_col="dec"):
+    """Projected distance of every source from the G79 center [pc]"""
+    coords = SkyCoord(
+        ra=df_cat[ra_col].values * u.deg,
+        dec=df_cat[dec_col].values * u.deg,
+        frame='icrs'
+    )
+    r_ang = coords.separation(G79_CENTER)
+    # angle [rad] × distance [kpc] = distance [pc]
+    return (r_ang.to(u.rad).value * G79_DISTANCE * u.kpc).to(u.pc).value
+
+def benchmark_binning(df_cat, band_cols, scale, ra_col="ra", dec_col="dec",
+                      repeats=3):
+    """
+    Time the loop vs. the single reduction on a scaled-up catalog
+
+    The catalog is replicated `scale` times; every copy gets jittered
+    positions (σ = 0.01 deg) and values (σ = 1% of the band scatter), so
+    ring memberships and medians differ between copies.
+
+    Returns:
+        dict: n_sources, t_loop, t_vector [s], max_rel_diff
+    """
+    import time
+
+    rng = np.random.default_rng(42)
+    big = pd.concat([df_cat[[ra_col, dec_col] + band_cols]] * scale, ignore_index=True)
+    big[ra_col] = big[ra_col] + rng.normal(0.0, 0.01, len(big))
+    big[dec_col] = big[dec_col] + rng.normal(0.0, 0.01, len(big))
+    for band in band_cols:
+        col = pd.to_numeric(big[band], errors='coerce')
+        big[band] = col + rng.normal(0.0, 0.01 * (np.nanstd(col) or 1.0), len(big))
+
+    r_pc = source_radii_pc(big, ra_col, dec_col)
+
+    def best_of(func):
+        times = []
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            out = func(big, r_pc, band_cols)
+            times.append(time.perf_counter() - t0)
+        return out, min(times)
+
+    df_loop, t_loop = best_of(bin_catalog_rings_loop)
+    df_vec, t_vec = best_of(bin_catalog_rings)
+
+    if list(df_loop.columns) != list(df_vec.columns) or len(df_loop) != len(df_vec):
+        raise RuntimeError("Vectorized binning changed the output schema")
+    a = df_loop.to_numpy(dtype=float)
+    b = df_vec.to_numpy(dtype=float)
+    if not np.array_equal(np.isnan(a), np.isnan(b)):
+        raise RuntimeError("Vectorized binning changed which values are NaN")
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rel = np.abs(a - b) / np.maximum(np.abs(a), 1e-300)
+    max_rel = float(np.nanmax(rel)) if np.isfinite(rel).any() else 0.0
+
+    return {"n_sources": len(big), "t_loop": t_loop, "t_vector": t_vec,
+            "max_rel_diff": max_rel}
+
+def cone_radii_pc(index, center, distance_kpc, r_max_pc=None):
+    """
+    Sources within r_max_pc of center, from the sky index
+
+    Returns:
+        rows: Catalog row indices
+        r_pc: Projected distance of these sources [pc]
+    """
+    r_max_pc = R_EDGES_PC[-1] if r_max_pc is None else r_max_pc
+    pc_per_rad = distance_kpc * 1000.0
+    rows, sep_deg = index.cone(center, np.degrees(r_max_pc / pc_per_rad))
+    return rows, np.radians(sep_deg) * pc_per_rad
+
+def rings_for_targets(df_cat, index, targets_csv, band_cols, catalog_path, out_dir,
+                      sigma_cols=None):
+    """
+    Ring profiles around many targets from one catalog and one sky index
+
+    targets_csv columns: name, ra, dec [deg], optional distance_kpc
+    (empty cells use G79_DISTANCE).
+    Writes <out_dir>/<catalog>_<name>_rings.csv per target.
+    """
+    targets = pd.read_csv(targets_csv, comment='#')
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    print(f"\n[4/4] Ring profiles for {len(targets)} targets...")
+    for t in targets.itertuples(index=False):
+        # Missing column or empty cell: G79 distance
+        distance = float(getattr(t, "distance_kpc", np.nan))
+        if np.isnan(distance):
+            distance = G79_DISTANCE
+        center = SkyCoord(float(t.ra) * u.deg, float(t.dec) * u.deg, frame="icrs")
+        rows, r_pc = cone_radii_pc(index, center, distance)
+        df_rings = bin_catalog_rings(df_cat.iloc[rows], r_pc, band_cols, sigma_cols=sigma_cols)
+
+        output_csv = out_dir / f"{Path(catalog_path).stem}_{t.name}_rings.csv"
+        write_ring_csv(df_rings, output_csv, catalog_path, band_cols, target=str(t.name),
+                       center_text=center.to_string('hmsdms'), distance_kpc=distance)
+        print(f"   {t.name}: {len(rows)} sources in {len(df_rings)} rings → {output_csv}")
+
+    print("\n" + "="*80)
+    print("DONE!")
+    print("="*80)
+    return 0
+
+def write_ring_csv(df_rings, output_csv, catalog_path, band_cols,
+                   target="G79.29+0.46", center_text="RA 20:31:41, Dec +40:21:07 (J2000)",
+                   distance_kpc=G79_DISTANCE):
+    """Ring profile CSV with the commented header block"""
+    # Registry bands were binned as <key>_jy columns
+    jy_bands = {f"{key}_jy": key for key in BANDS}
+    with open(output_csv, 'w', encoding='utf-8') as f:
+        f.write(f"# {target} Ring Profile from Catalog Point Sources\n")
+        f.write(f"# Source file: {Path(catalog_path).name}\n")
+        f.write(f"# Center: {center_text}\n")
+        f.write(f"# Distance: {distance_kpc} kpc\n")
+        f.write(f"# Ring spacing: 0.2 pc\n")
+        f.write(f"# Bands: {', '.join(band_cols)}\n")
+        for band in band_cols:
+            if band in jy_bands:
+                spec = BANDS[jy_bands[band]]
+                f.write(f"# Photometry: {band} = {spec['survey']} {spec['label']} "
+                        f"({spec['wavelength_um']:g} μm), "
+                        + (f"F0 = {spec['zero_point_jy']:g} Jy, " if spec['zero_point_jy'] else "")
+                        + "upper limits and saturated sources masked\n")
+        f.write(f"# Method: Binned catalog point sources\n")
+        f.write(f"# Date: {pd.Timestamp.now()}\n")
+        f.write("#\n")
+        f.write("# Columns:\n")
+        f.write("#   ring        - Ring index (0=innermost)\n")
+        f.write("#   r_min_pc    - Inner edge [pc]\n")
+        f.write("#   r_max_pc    - Outer edge [pc]\n")
+        f.write("#   radius_pc   - Ring center [pc]\n")
+        f.write("#   n_sources   - Number of catalog sources in ring\n")
+        for band in band_cols:
+            unit = "Jy" if band in jy_bands else band
+            f.write(f"#   {band}_mean   - Mean flux [{unit}]\n")
+            f.write(f"#   {band}_median - Median flux [{unit}]\n")
+            f.write(f"#   {band}_std    - Standard deviation\n")
+            f.write(f"#   {band}_err    - Standard error\n")
+            f.write(f"#   {band}_n      - Number of valid measurements\n")
+            if f"{band}_phot_err" in df_rings.columns:
+                f.write(f"#   {band}_phot_err - Propagated photometric error of the mean [{unit}]\n")
+        f.write("#\n")
+        df_rings.to_csv(f, index=False)
+
 def parse_args():
     """Parse command line arguments"""
     import argparse
@@ -60,13 +297,23 @@ def parse_args():
                        help="Input CSV catalog file [default: data/telescope/akari_fis_test.csv for G79 paper test]")
     parser.add_argument("--bands", type=str, required=False, 
                        default='flux65,flux90,flux140,flux160',
-                       help="Comma-separated flux column names [default: flux65,flux90,flux140,flux160 for AKARI FIS]")
+                       help="Comma-separated flux column names [default: flux65,flux90,flux140,flux160 for AKARI FIS] "
+                            f"or registry bands converted to Jy ({','.join(BANDS)})")
     parser.add_argument("--ra-col", type=str, default="ra", 
                        help="RA column name (default: ra)")
     parser.add_argument("--dec-col", type=str, default="dec", 
                        help="Dec column name (default: dec)")
     parser.add_argument("--output", type=str, default=None,
                        help="Output CSV file (default: auto-generated)")
+    parser.add_argument("--center", type=str, default=None,
+                       help='Ring center (e.g. "20h31m41s +40d21m07s") [default: G79.29+0.46]')
+    parser.add_argument("--distance", type=float, default=G79_DISTANCE,
+                       help=f"Distance [kpc] (default: {G79_DISTANCE})")
+    parser.add_argument("--targets", type=str, default=None,
+                       help="CSV of targets (name,ra,dec[,distance_kpc], deg): one ring CSV per "
+                            "target from one sky-index load; --output is then the output directory")
+    parser.add_argument("--benchmark", type=int, default=None, metavar="SCALE",
+                       help="Only benchmark ring binning on the catalog replicated SCALE times")
     return parser.parse_args()
 
 def main():
@@ -74,8 +321,11 @@ def main():
     
     args = parse_args()
     
-    # Parse band names
+    # Parse band names: registry bands (w1, j, ...) are converted to Jy,
+    # everything else is a catalog column
     band_cols = [b.strip() for b in args.bands.split(',')]
+    phot_bands = [b.lower() for b in band_cols if is_registered(b)]
+    source_cols = [BANDS[b.lower()]["value_col"] if is_registered(b) else b for b in band_cols]
     
     catalog_path = Path(args.catalog_file)
     
@@ -115,7 +365,7 @@ def main():
         
         # Create fluxes for requested bands
         catalog_data = {'ra': ra, 'dec': dec}
-        for band in band_cols:
+        for band in source_cols:
             catalog_data[band] = np.random.uniform(10, 100, n_sources)
         
         catalog_df = pd.DataFrame(catalog_data)
@@ -125,8 +375,13 @@ def main():
     else:
         # Load actual catalog
         try:
-            catalog_df = pd.read_csv(catalog_path, comment='#')
-            print(f"   Loaded catalog with {len(catalog_df)} sources")
+            # Only ra/dec + bands, from the column cache (CSV if stale)
+            fresh = cache_is_fresh(catalog_path)
+            load_cols = [args.ra_col, args.dec_col] + \
+                [b for b in band_cols if not is_registered(b)] + band_columns(phot_bands)
+            catalog_df = load_catalog(catalog_path, columns=load_cols)
+            print(f"   Loaded catalog with {len(catalog_df)} sources "
+                  f"({'column cache' if fresh else 'CSV, cache rebuilt'})")
         except Exception as e:
             print(f"   ERROR loading catalog: {e}")
             print(f"   Creating synthetic catalog instead...")
@@ -138,7 +393,7 @@ def main():
             dec = 40.35 + np.random.randn(n_sources) * 0.01
             
             catalog_data = {'ra': ra, 'dec': dec}
-            for band in band_cols:
+            for band in source_cols:
                 catalog_data[band] = np.random.uniform(10, 100, n_sources)
             
             catalog_df = pd.DataFrame(catalog_data)
@@ -151,111 +406,95 @@ def main():
     print(f"   Columns: {list(df_cat.columns)[:10]}...")
     
     # Check required columns
-    required_cols = [args.ra_col, args.dec_col] + band_cols
+    required_cols = [args.ra_col, args.dec_col] + source_cols
     missing = [c for c in required_cols if c not in df_cat.columns]
     if missing:
         print(f"\nERROR: Missing columns: {missing}")
-        print(f"Available columns: {list(df_cat.columns)}")
+        available = catalog_columns(catalog_path) if catalog_path.exists() else list(df_cat.columns)
+        print(f"Available columns: {available}")
         return 1
     
-    # Calculate radial distances
+    # Registry bands: magnitudes → Jy for the whole catalog, bin <band>_jy
+    sigma_cols = {}
+    if phot_bands:
+        df_jy, phot_info = convert_catalog(df_cat, phot_bands)
+        df_cat = pd.concat([df_cat, df_jy], axis=1)
+        sigma_cols = {f"{b}_jy": f"{b}_jy_sigma" for b in phot_bands}
+        band_cols = [f"{b.lower()}_jy" if is_registered(b) else b for b in band_cols]
+        print(f"   Converted to Jy (upper limits / saturated masked):")
+        for b in phot_bands:
+            spec = BANDS[b]
+            print(f"     {spec['label']:>6s} ({spec['wavelength_um']:g} μm): "
+                  f"{phot_info[b]['n_valid']} valid, {phot_info[b]['n_upper']} upper limits, "
+                  f"{phot_info[b]['n_saturated']} saturated")
+    
+    if args.benchmark:
+        print(f"\n[4/4] Benchmark: catalog × {args.benchmark}...")
+        bench = benchmark_binning(df_cat, band_cols, args.benchmark,
+                                  args.ra_col, args.dec_col)
+        print(f"   Sources:         {bench['n_sources']}")
+        print(f"   Per-ring loop:   {bench['t_loop']*1e3:.1f} ms")
+        print(f"   One reduction:   {bench['t_vector']*1e3:.1f} ms "
+              f"({bench['t_loop']/bench['t_vector']:.1f}× faster)")
+        print(f"   Max. rel. diff.: {bench['max_rel_diff']:.1e} (same schema)")
+        return 0
+    
+    # Radial distances: KD-tree cone query, only sources near the center
     print(f"\n[3/4] Calculating radial distances...")
     
     try:
-        coords = SkyCoord(
-            ra=df_cat[args.ra_col].values * u.deg,
-            dec=df_cat[args.dec_col].values * u.deg,
-            frame='icrs'
-        )
+        positions = (df_cat[args.ra_col].to_numpy(dtype=float),
+                     df_cat[args.dec_col].to_numpy(dtype=float))
+        if catalog_path.exists():
+            index, built = load_or_build(catalog_path, args.ra_col, args.dec_col,
+                                         positions=positions)
+            print(f"   Sky index: {'built' if built else 'loaded'} ({index.n_sources} sources)")
+        else:
+            index = SkyIndex.build(*positions)
     except Exception as e:
         print(f"ERROR converting coordinates: {e}")
         return 1
     
-    # Angular separation from G79 center
-    r_ang = coords.separation(G79_CENTER)
+    if args.targets:
+        return rings_for_targets(df_cat, index, args.targets, band_cols, catalog_path,
+                                 args.output or ".", sigma_cols=sigma_cols)
     
-    # Physical distance in pc
-    # Convert: angle [rad] × distance [kpc] = distance [pc]
-    r_pc = (r_ang.to(u.rad).value * G79_DISTANCE * u.kpc).to(u.pc).value
+    center = SkyCoord(args.center, frame="icrs") if args.center else G79_CENTER
+    rows, r_pc = cone_radii_pc(index, center, args.distance)
+    df_cat = df_cat.iloc[rows]
     
-    print(f"   Radial range: {r_pc.min():.2f} - {r_pc.max():.2f} pc")
-    print(f"   Sources within 2 pc: {np.sum(r_pc < 2.0)}")
+    print(f"   Sources within {R_EDGES_PC[-1]:.0f} pc: {len(rows)} of {len(positions[0])}")
+    if len(rows):
+        print(f"   Radial range: {r_pc.min():.2f} - {r_pc.max():.2f} pc")
     
-    # Extract rings
+    # Extract rings (one digitize + reduction for all bands)
     print(f"\n[4/4] Binning into {len(R_EDGES_PC)-1} rings...")
     
-    rows = []
+    df_rings = bin_catalog_rings(df_cat, r_pc, band_cols, sigma_cols=sigma_cols)
+    by_ring = df_rings.set_index("ring")
+    
+    first_band = band_cols[0]
     for ring_idx, (r_min, r_max) in enumerate(zip(R_EDGES_PC[:-1], R_EDGES_PC[1:])):
-        mask = (r_pc >= r_min) & (r_pc < r_max)
-        n_sources = np.sum(mask)
-        
-        if n_sources > 0:
-            row = {
-                "ring": ring_idx,
-                "r_min_pc": float(r_min),
-                "r_max_pc": float(r_max),
-                "radius_pc": float(0.5 * (r_min + r_max)),
-                "n_sources": int(n_sources),
-            }
-            
-            # Average each band
-            for band in band_cols:
-                vals = df_cat.loc[mask, band].dropna()
-                if len(vals) > 0:
-                    row[f"{band}_mean"] = float(vals.mean())
-                    row[f"{band}_median"] = float(vals.median())
-                    row[f"{band}_std"] = float(vals.std())
-                    row[f"{band}_err"] = float(vals.std() / np.sqrt(len(vals)))
-                    row[f"{band}_n"] = int(len(vals))
-                else:
-                    row[f"{band}_mean"] = np.nan
-                    row[f"{band}_median"] = np.nan
-                    row[f"{band}_std"] = np.nan
-                    row[f"{band}_err"] = np.nan
-                    row[f"{band}_n"] = 0
-            
-            rows.append(row)
-            
-            # Print summary for first band
-            first_band = band_cols[0]
-            if f"{first_band}_mean" in row and not np.isnan(row[f"{first_band}_mean"]):
-                print(f"   Ring {ring_idx}: r={r_min:.1f}-{r_max:.1f} pc, "
-                      f"n={n_sources}, {first_band}={row[f'{first_band}_mean']:.3e}")
-            else:
-                print(f"   Ring {ring_idx}: r={r_min:.1f}-{r_max:.1f} pc, "
-                      f"n={n_sources} (no valid flux)")
-        else:
+        if ring_idx not in by_ring.index:
             print(f"   Ring {ring_idx}: r={r_min:.1f}-{r_max:.1f} pc - NO SOURCES")
+            continue
+        row = by_ring.loc[ring_idx]
+        n_sources = int(row["n_sources"])
+        if not np.isnan(row[f"{first_band}_mean"]):
+            print(f"   Ring {ring_idx}: r={r_min:.1f}-{r_max:.1f} pc, "
+                  f"n={n_sources}, {first_band}={row[f'{first_band}_mean']:.3e}")
+        else:
+            print(f"   Ring {ring_idx}: r={r_min:.1f}-{r_max:.1f} pc, "
+                  f"n={n_sources} (no valid flux)")
     
     # Save CSV
     print(f"\n[4/4] Saving CSV...")
     
-    df_rings = pd.DataFrame(rows)
-    
-    with open(output_csv, 'w', encoding='utf-8') as f:
-        f.write("# G79.29+0.46 Ring Profile from Catalog Point Sources\n")
-        f.write(f"# Source file: {catalog_path.name}\n")
-        f.write(f"# Center: RA 20:31:41, Dec +40:21:07 (J2000)\n")
-        f.write(f"# Distance: {G79_DISTANCE} kpc\n")
-        f.write(f"# Ring spacing: 0.2 pc\n")
-        f.write(f"# Bands: {', '.join(band_cols)}\n")
-        f.write(f"# Method: Binned catalog point sources\n")
-        f.write(f"# Date: {pd.Timestamp.now()}\n")
-        f.write("#\n")
-        f.write("# Columns:\n")
-        f.write("#   ring        - Ring index (0=innermost)\n")
-        f.write("#   r_min_pc    - Inner edge [pc]\n")
-        f.write("#   r_max_pc    - Outer edge [pc]\n")
-        f.write("#   radius_pc   - Ring center [pc]\n")
-        f.write("#   n_sources   - Number of catalog sources in ring\n")
-        for band in band_cols:
-            f.write(f"#   {band}_mean   - Mean flux [{band}]\n")
-            f.write(f"#   {band}_median - Median flux [{band}]\n")
-            f.write(f"#   {band}_std    - Standard deviation\n")
-            f.write(f"#   {band}_err    - Standard error\n")
-            f.write(f"#   {band}_n      - Number of valid measurements\n")
-        f.write("#\n")
-        df_rings.to_csv(f, index=False)
+    if args.center:
+        write_ring_csv(df_rings, output_csv, catalog_path, band_cols, target="Custom center",
+                       center_text=center.to_string('hmsdms'), distance_kpc=args.distance)
+    else:
+        write_ring_csv(df_rings, output_csv, catalog_path, band_cols, distance_kpc=args.distance)
     
     print(f"   ✓ Saved: {output_csv}")
     print(f"   ✓ Extracted {len(df_rings)} rings!")
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Crossmatch - positional cross-match of IR catalogs on a KD-tree
+
+Matches a primary catalog (e.g. AllWISE) against a secondary one (e.g.
+AKARI FIS or 2MASS) with the KD-tree over 3D unit vectors of the
+secondary catalog (sky_index.py, persistent next to the catalog):
+
+    best - nearest secondary source per primary source (one row each)
+    all  - every pair closer than the match radius (sorted by primary
+           row, then separation)
+
+Every catalog has its own positional match radius (e.g. 3" for
+AllWISE/2MASS, 10" for AKARI FIS); a pair matches when its separation
+is below the quadrature sum sqrt(r1² + r2²). Separations come out of
+the tree as chord lengths d and are converted for all pairs at once:
+sep = 2·arcsin(d/2).
+
+The merged table keeps the primary positions (ra/dec) and appends the
+secondary columns with a suffix, plus sep_arcsec - so it goes straight
+into ring binning (catalog_to_rings.bin_catalog_rings), e.g. for color
+profiles.
+
+Usage:
+    # AllWISE × 2MASS, best match, merged CSV
+    python crossmatch.py data/telescope/allwise_p3as_psd_test.csv data/telescope/fp_psc_test.csv \
+        --radius 3,3 --columns1 w1mpro,w2mpro --columns2 j_m,k_m --suffix _2mass
+
+    # Same, plus a K - W1 color and its ring profile around G79
+    python crossmatch.py data/telescope/allwise_p3as_psd_test.csv data/telescope/fp_psc_test.csv \
+        --radius 3,3 --columns1 w1mpro --columns2 k_m --suffix _2mass \
+        --color k_m_2mass-w1mpro --rings
+
+    # 10^6 × 10^6 synthetic benchmark
+    python crossmatch.py --benchmark 1000000
+
+Output:
+    <primary>_x_<secondary>.csv        - Merged table (+ colors)
+    <primary>_x_<secondary>_rings.csv  - Ring profile (with --rings)
+
+© 2025 Carmen N. Wrede, Lino P. Casu
+Licensed under ANTI-CAPITALIST SOFTWARE LICENSE v1.4
+"""
+import sys
+import os
+import time
+import argparse
+from pathlib import Path
+
+# UTF-8 for Windows
+os.environ['PYTHONIOENCODING'] = 'utf-8:replace'
+if sys.platform == 'win32':
+    try:
+        sys.stdout.reconfigure(encoding='utf-8', errors='replace')
+    except:
+        pass
+
+try:
+    import numpy as np
+    import pandas as pd
+    from scipy.spatial import cKDTree
+except ImportError as e:
+    print(f"ERROR: Required packages missing: {e}")
+    print("\nInstall with:")
+    print("  pip install numpy pandas scipy astropy")
+    sys.exit(1)
+
+from sky_index import SkyIndex, load_or_build, unit_vectors, chord_radius
+from catalog_cache import load_catalog
+
+# Positional match radius per catalog [arcsec] when none is given
+DEFAULT_RADIUS_ARCSEC = 3.0
+
+MATCH_MODES = ("best", "all")
+
+def combined_radius(radius1_arcsec, radius2_arcsec):
+    """Match radius of a catalog pair: quadrature sum of the per-catalog radii"""
+    return float(np.hypot(radius1_arcsec, radius2_arcsec))
+
+def chord_to_arcsec(chord):
+    """Angular separation [arcsec] of unit vectors with chord length d"""
+    return np.degrees(2.0 * np.arcsin(np.clip(0.5 * chord, 0.0, 1.0))) * 3600.0
+
+def match_positions(ra_deg, dec_deg, index, radius_arcsec, mode="best"):
+    """
+    Match positions against a sky index
+
+    Args:
+        ra_deg, dec_deg: Primary positions [deg]
+        index: SkyIndex of the secondary catalog
+        radius_arcsec: Match radius [arcsec]
+        mode: "best" (nearest per primary) or "all" (every pair)
+
+    Returns:
+        i: Primary row indices
+        j: Secondary row indices
+        sep_arcsec: Separations [arcsec]
+    """
+    if mode not in MATCH_MODES:
+        raise ValueError(f"mode must be one of {MATCH_MODES}, not {mode!r}")
+
+    xyz = unit_vectors(ra_deg, dec_deg)
+    xyz[~np.isfinite(xyz).all(axis=1)] = 1e3  # never matches
+    chord = chord_radius(radius_arcsec / 3600.0)
+
+    if mode == "best":
+        d, j = index.tree.query(xyz, k=1, distance_upper_bound=chord, workers=-1)
+        i = np.flatnonzero(np.isfinite(d))
+        j = j[i]
+        d = d[i]
+    else:
+        tree = cKDTree(xyz, leafsize=32, balanced_tree=False, compact_nodes=False)
+        pairs = tree.sparse_distance_matrix(index.tree, chord, output_type='ndarray')
+        order = np.lexsort((pairs['v'], pairs['i']))
+        i = pairs['i'][order]
+        j = pairs['j'][order]
+        d = pairs['v'][order]
+
+    sep = chord_to_arcsec(d)
+    keep = sep <= radius_arcsec
+    return i[keep], j[keep], sep[keep]
+
+def merge_matches(df1, df2, i, j, sep_arcsec, suffix="_2", keep_unmatched=False):
+    """
+    Merged table of matched pairs
+
+    Primary columns keep their names, secondary columns get the suffix.
+    keep_unmatched: also keep primary rows without a match (secondary
+    columns NaN, sep_arcsec NaN; only meaningful for mode "best").
+    """
+    right = df2.add_suffix(suffix)
+    if keep_unmatched:
+        left = df1.reset_index(drop=True)
+        pos = np.full(len(df1), -1)
+        pos[i] = np.arange(len(i))
+        matched = pos >= 0
+        right = right.iloc[j].reset_index(drop=True).reindex(np.where(matched, pos, -1))
+        right.index = left.index
+        sep = np.full(len(df1), np.nan)
+        sep[matched] = sep_arcsec[pos[matched]]
+    else:
+        left = df1.iloc[i].reset_index(drop=True)
+        right = right.iloc[j].reset_index(drop=True)
+        sep = sep_arcsec
+
+    merged = pd.concat([left, right], axis=1)
+    merged["sep_arcsec"] = sep
+    return merged
+
+def add_colors(df, colors):
+    """Add color columns "a-b" = df[a] - df[b] (e.g. k_m_2mass-w1mpro)"""
+    for color in colors:
+        for split in range(1, len(color)):
+            a, b = color[:split], color[split + 1:]
+            if color[split] == '-' and a in df.columns and b in df.columns:
+                df[color] = df[a] - df[b]
+                break
+        else:
+            raise KeyError(f"Color {color!r} is not 'column-column' of the merged table")
+    return df
+
+def crossmatch_catalogs(catalog1, catalog2, radius1=DEFAULT_RADIUS_ARCSEC,
+                        radius2=DEFAULT_RADIUS_ARCSEC, mode="best",
+                        columns1=None, columns2=None, suffix="_2",
+                        ra_col="ra", dec_col="dec", keep_unmatched=False):
+    """
+    Cross-match two catalog CSVs (column cache + persistent sky index)
+
+    Returns:
+        merged DataFrame, info dict (radius_arcsec, n1, n2, n_pairs,
+        seconds)
+    """
+    cols1 = None if columns1 is None else [ra_col, dec_col] + [c for c in columns1 if c not in (ra_col, dec_col)]
+    cols2 = None if columns2 is None else [ra_col, dec_col] + [c for c in columns2 if c not in (ra_col, dec_col)]
+    df1 = load_catalog(catalog1, columns=cols1)
+    df2 = load_catalog(catalog2, columns=cols2)
+
+    t0 = time.perf_counter()
+    index, _ = load_or_build(catalog2, ra_col, dec_col,
+                             positions=(df2[ra_col].to_numpy(dtype=float),
+                                        df2[dec_col].to_numpy(dtype=float)))
+    radius = combined_radius(radius1, radius2)
+    i, j, sep = match_positions(df1[ra_col].to_numpy(dtype=float),
+                                df1[dec_col].to_numpy(dtype=float),
+                                index, radius, mode=mode)
+    seconds = time.perf_counter() - t0
+
+    merged = merge_matches(df1, df2, i, j, sep, suffix=suffix,
+                           keep_unmatched=keep_unmatched and mode == "best")
+    return merged, {"radius_arcsec": radius, "n1": len(df1), "n2": len(df2),
+                    "n_pairs": len(i), "seconds": seconds}
+
+def benchmark(n_sources, radius_arcsec=3.0, seed=42):
+    """
+    N × N synthetic cross-match (secondary = primary + 0.5" scatter)
+
+    Returns:
+        dict: t_build, t_best, t_all [s], n_best, n_all, recovered
+        (fraction of best matches that are the true counterpart)
+    """
+    rng = np.random.default_rng(seed)
+    ra = rng.uniform(303.0, 312.0, n_sources)
+    dec = rng.uniform(37.0, 44.0, n_sources)
+    scatter = 0.5 / 3600.0
+    ra2 = ra + rng.normal(0.0, scatter, n_sources) / np.cos(np.radians(dec))
+    dec2 = dec + rng.normal(0.0, scatter, n_sources)
+
+    t0 = time.perf_counter()
+    index = SkyIndex.build(ra2, dec2)
+    t_build = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    i, j, _ = match_positions(ra, dec, index, radius_arcsec, mode="best")
+    t_best = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    i_all, _, _ = match_positions(ra, dec, index, radius_arcsec, mode="all")
+    t_all = time.perf_counter() - t0
+
+    return {"t_build": t_build, "t_best": t_best, "t_all": t_all,
+            "n_best": len(i), "n_all": len(i_all),
+            "recovered": float(np.mean(i == j)) if len(i) else 0.0}
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(
+        description='Positional cross-match of two catalogs (KD-tree on unit vectors)'
+    )
+    parser.add_argument(
+        'catalog1',
+        nargs='?',
+        help='Primary catalog CSV (its ra/dec are kept)'
+    )
+    parser.add_argument(
+        'catalog2',
+        nargs='?',
+        help='Secondary catalog CSV'
+    )
+    parser.add_argument(
+        '--radius',
+        default=f"{DEFAULT_RADIUS_ARCSEC:g}",
+        help='Match radius per catalog "R1,R2" or common "R" [arcsec]; '
+             f'pairs match within sqrt(R1²+R2²) [default: {DEFAULT_RADIUS_ARCSEC:g}]'
+    )
+    parser.add_argument(
+        '--mode',
+        choices=MATCH_MODES,
+        default='best',
+        help='best = nearest counterpart per primary source, all = every pair [default: best]'
+    )
+    parser.add_argument(
+        '--columns1',
+        help='Primary columns to keep (comma-separated) [default: all]'
+    )
+    parser.add_argument(
+        '--columns2',
+        help='Secondary columns to keep (comma-separated) [default: all]'
+    )
+    parser.add_argument(
+        '--suffix',
+        default='_2',
+        help='Suffix for secondary columns [default: _2]'
+    )
+    parser.add_argument(
+        '--keep-unmatched',
+        action='store_true',
+        help='Keep primary sources without counterpart (mode best)'
+    )
+    parser.add_argument(
+        '--color',
+        action='append',
+        default=[],
+        help='Color column "A-B" of merged columns (repeatable), e.g. k_m_2mass-w1mpro'
+    )
+    parser.add_argument(
+        '--rings',
+        action='store_true',
+        help='Also bin the merged table into G79 rings (colors + all kept columns)'
+    )
+    parser.add_argument(
+        '--output',
+        help='Merged CSV [default: <primary>_x_<secondary>.csv]'
+    )
+    parser.add_argument(
+        '--benchmark',
+        type=int,
+        metavar='N',
+        help='Synthetic N × N benchmark (no catalogs needed)'
+    )
+
+    args = parser.parse_args()
+
+    print("="*80)
+    print("CATALOG CROSS-MATCH")
+    print("="*80)
+
+    if args.benchmark:
+        print(f"\nSynthetic {args.benchmark} × {args.benchmark} (0.5\" scatter, 3\" radius)")
+        res = benchmark(args.benchmark)
+        print(f"   Tree build:  {res['t_build']:.2f} s")
+        print(f"   Mode best:   {res['t_best']:.2f} s ({res['n_best']} matches, "
+              f"{res['recovered']*100:.2f}% true counterparts)")
+        print(f"   Mode all:    {res['t_all']:.2f} s ({res['n_all']} pairs)")
+        print("\n" + "="*80)
+        print("DONE!")
+        print("="*80)
+        return 0
+
+    if not args.catalog1 or not args.catalog2:
+        parser.error("catalog1 and catalog2 required (or --benchmark N)")
+
+    for path in (args.catalog1, args.catalog2):
+        if not Path(path).exists():
+            print(f"\nERROR: File not found: {path}")
+            return 1
+
+    radii = [float(r) for r in args.radius.split(',')]
+    radius1, radius2 = (radii[0], radii[0]) if len(radii) == 1 else radii[:2]
+
+    split = lambda s: [c.strip() for c in s.split(',')] if s else None
+    print(f"\nPrimary:   {args.catalog1} (r = {radius1:g}\")")
+    print(f"Secondary: {args.catalog2} (r = {radius2:g}\")")
+
+    merged, info = crossmatch_catalogs(
+        args.catalog1, args.catalog2, radius1, radius2, mode=args.mode,
+        columns1=split(args.columns1), columns2=split(args.columns2),
+        suffix=args.suffix, keep_unmatched=args.keep_unmatched
+    )
+    print(f"\n   Match radius: {info['radius_arcsec']:.2f}\" (mode {args.mode})")
+    print(f"   {info['n1']} × {info['n2']} sources → {info['n_pairs']} matches "
+          f"in {info['seconds']*1e3:.1f} ms")
+    if info['n_pairs']:
+        sep = merged["sep_arcsec"].dropna()
+        print(f"   Separation: median {sep.median():.2f}\", max {sep.max():.2f}\"")
+
+    try:
+        add_colors(merged, args.color)
+    except KeyError as e:
+        print(f"\nERROR: {e}")
+        return 1
+
+    stem = f"{Path(args.catalog1).stem}_x_{Path(args.catalog2).stem}"
+    output = args.output or f"{stem}.csv"
+    merged.to_csv(output, index=False)
+    print(f"\n   Saved: {output}")
+
+    if args.rings:
+        from catalog_to_rings import (G79_CENTER, G79_DISTANCE, cone_radii_pc,
+                                      bin_catalog_rings, write_ring_csv)
+        bands = args.color + [c for c in merged.columns
+                              if c not in ("ra", "dec", "sep_arcsec",
+                                           f"ra{args.suffix}", f"dec{args.suffix}")
+                              and c not in args.color
+                              and merged[c].dtype.kind in 'fiu']
+        index = SkyIndex.build(merged["ra"].to_numpy(dtype=float),
+                               merged["dec"].to_numpy(dtype=float))
+        rows, r_pc = cone_radii_pc(index, G79_CENTER, G79_DISTANCE)
+        df_rings = bin_catalog_rings(merged.iloc[rows], r_pc, bands)
+        rings_out = str(Path(output).with_suffix('')) + "_rings.csv"
+        write_ring_csv(df_rings, rings_out, output, bands)
+        print(f"   Rings: {len(rows)} matched sources in {len(df_rings)} rings")
+        print(f"   Saved: {rings_out}")
+
+    print("\n" + "="*80)
+    print("DONE!")
+    print("="*80)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cube I/O - memory-mapped spectral cubes, read in channel slabs
+
+For cubes larger than RAM: the FITS data is memory-mapped (no scaling
+on open) and read slab_chans channels at a time; BSCALE/BZERO/BLANK are
+applied per slab. Peak memory is one float64 slab, not the cube.
+
+The spectral axis comes from the header alone (spectral_axis_kms), so
+spectral-cube is not needed on the hot path; load_cube() keeps it as an
+optional compatibility path (use_spectral_cube=True).
+
+Usage (from another script in scripts/):
+    from cube_io import iter_channel_slabs, load_cube
+    for c0, c1, slab in iter_channel_slabs("G79_co32_cube.fits", 64):
+        ...  # slab: (c1-c0, ny, nx) float64, NaN = blanked
+    cube = load_cube("G79_co32_cube.fits")   # data, vel, header, wcs, unit
+
+Startup and per-cube latency of both paths:
+    python cube_io.py G79_co32_cube.fits --repeat 3
+
+© 2025 Carmen N. Wrede, Lino P. Casu
+Licensed under ANTI-CAPITALIST SOFTWARE LICENSE v1.4
+"""
+import sys
+import time
+import argparse
+import subprocess
+from pathlib import Path
+
+import numpy as np
+from astropy.io import fits
+from astropy.wcs import WCS
+import astropy.units as u
+
+def _cube_view(raw):
+    """(n_chan, ny, nx) view of a 3D cube or a 4D cube with one Stokes plane"""
+    if raw is None:
+        raise ValueError("Primary HDU has no data")
+    while raw.ndim > 3 and raw.shape[0] == 1:
+        raw = raw[0]
+    if raw.ndim != 3:
+        raise ValueError(f"Expected a 3D cube, got data of shape {raw.shape}")
+    return raw
+
+def cube_header(fits_file):
+    """
+    Header, shape (n_chan, ny, nx) and WCS of a cube without reading data
+
+    Returns:
+        header, shape, wcs (full WCS; use wcs.celestial / wcs.spectral)
+    """
+    header = fits.getheader(fits_file)
+    return header, cube_header_shape(header), WCS(header)
+
+def spectral_axis_kms(header, n_chan=None, strict=False):
+    """
+    Velocity of every channel [km/s] from the header spectral WCS
+
+    Frequency axes are converted with the radio convention and RESTFRQ
+    (or RESTFREQ). Falls back to channel numbers with a warning if the
+    spectral axis cannot be expressed as a velocity; with strict=True
+    (a velocity window is about to be applied) raises ValueError instead.
+    """
+    wcs = WCS(header)
+    if n_chan is None:
+        n_chan = cube_header_shape(header)[0]
+    chans = np.arange(n_chan)
+
+    try:
+        spec = wcs.spectral
+        world = spec.pixel_to_world(chans)
+        quantity = u.Quantity(world)
+        if quantity.unit.is_equivalent(u.km/u.s):
+            return quantity.to_value(u.km/u.s)
+        rest = header.get('RESTFRQ', header.get('RESTFREQ'))
+        if rest is None:
+            raise ValueError("no rest frequency")
+        equiv = u.doppler_radio(rest * u.Hz)
+        return quantity.to_value(u.km/u.s, equivalencies=equiv)
+    except Exception as e:
+        if strict:
+            raise ValueError(f"Could not convert spectral axis to km/s ({e}); "
+                             f"a velocity range cannot be applied") from e
+        print(f"   WARNING: Could not convert spectral axis to km/s ({e}), "
+              f"using channel numbers")
+        return chans.astype(float)
+
+def cube_header_shape(header):
+    """(n_chan, ny, nx) from NAXISn keywords"""
+    naxes = [header[f'NAXIS{i}'] for i in range(header['NAXIS'], 0, -1)]
+    while len(naxes) > 3 and naxes[0] == 1:
+        naxes = naxes[1:]
+    return tuple(naxes)
+
+def channel_window(vel, vel_window=None):
+    """
+    Channel range [c0, c1) covering a velocity window
+
+    Args:
+        vel: Velocity axis [km/s] (ascending or descending)
+        vel_window: (v_min, v_max) or None for all channels
+
+    Returns:
+        c0, c1
+    """
+    if vel_window is None:
+        return 0, len(vel)
+
+    v_lo, v_hi = sorted(vel_window)
+    inside = np.flatnonzero((vel >= v_lo) & (vel <= v_hi))
+    if len(inside) == 0:
+        raise ValueError(f"No channels in velocity window {v_lo}..{v_hi} km/s "
+                         f"(cube covers {np.min(vel):.2f}..{np.max(vel):.2f} km/s)")
+    return int(inside[0]), int(inside[-1]) + 1
+
+def parse_vel_range(text):
+    """(v_min, v_max) [km/s] from a "VMIN,VMAX" option value, None for None/empty"""
+    if not text:
+        return None
+    values = tuple(float(v) for v in text.split(','))
+    if len(values) != 2:
+        raise ValueError(f"Velocity range must be 'VMIN,VMAX', got '{text}'")
+    return values
+
+def velocity_channel_range(header, vel_range=None):
+    """
+    Channel range [c0, c1) of a cube covering a velocity range
+
+    Uses only the header spectral axis (spectral_axis_kms), so the range
+    is known before any data is read. Raises ValueError if a vel_range is
+    given but the spectral axis is not convertible to km/s.
+    """
+    return channel_window(spectral_axis_kms(header, strict=vel_range is not None),
+                          vel_range)
+
+def _scale(block, bscale, bzero, blank):
+    """float64 copy of raw cube data, scaled, NaN for BLANK"""
+    out = np.array(block, dtype=float)
+    if blank is not None:
+        out[block == blank] = np.nan
+    if bscale != 1.0 or bzero != 0.0:
+        out = out * bscale + bzero
+    return out
+
+def _scaling(header, raw):
+    """(BSCALE, BZERO, BLANK) of raw (unscaled) data; BLANK only for integers"""
+    return (header.get('BSCALE', 1.0), header.get('BZERO', 0.0),
+            header.get('BLANK') if raw.dtype.kind in 'iu' else None)
+
+def iter_channel_slabs(fits_file, slab_chans=64, chan_range=None):
+    """
+    Yield (c0, c1, slab) for consecutive channel slabs of a memory-mapped cube
+
+    Args:
+        fits_file: Path to FITS cube (primary HDU, 3D or 4D with 1 Stokes)
+        slab_chans: Channels per slab
+        chan_range: Optional (first, stop) channel range; channels outside
+            are never read
+
+    Yields:
+        c0, c1: Channel range [c0, c1)
+        slab: float64 array (c1-c0, ny, nx), scaled, NaN for BLANK
+    """
+    with fits.open(fits_file, memmap=True, do_not_scale_image_data=True) as hdul:
+        raw = _cube_view(hdul[0].data)
+        scaling = _scaling(hdul[0].header, raw)
+
+        first, stop = chan_range if chan_range is not None else (0, raw.shape[0])
+        for c0 in range(first, stop, slab_chans):
+            c1 = min(c0 + slab_chans, stop)
+            yield c0, c1, _scale(raw[c0:c1], *scaling)
+
+def iter_row_chunks(fits_file, rows=16, chan_range=None):
+    """
+    Yield (y0, y1, block) for consecutive image-row chunks, all channels
+
+    The spatial counterpart of iter_channel_slabs(): every block holds
+    complete spectra, for per-spectrum work (baselines, fits).
+
+    Yields:
+        y0, y1: Row range [y0, y1)
+        block: float64 array (n_chan, y1-y0, nx), scaled, NaN for BLANK
+    """
+    with fits.open(fits_file, memmap=True, do_not_scale_image_data=True) as hdul:
+        raw = _cube_view(hdul[0].data)
+        scaling = _scaling(hdul[0].header, raw)
+
+        c0, c1 = chan_range if chan_range is not None else (0, raw.shape[0])
+        for y0 in range(0, raw.shape[1], rows):
+            y1 = min(y0 + rows, raw.shape[1])
+            yield y0, y1, _scale(raw[c0:c1, y0:y1], *scaling)
+
+def create_cube_file(path, header, shape):
+    """
+    Create an empty float32 FITS cube on disk and return it memory-mapped
+
+    The data block is allocated by extending the file (no data is
+    written up front), then opened in update mode; assign to
+    hdul[0].data[...] and close the HDUList to flush.
+
+    Args:
+        path: Output FITS path (overwritten)
+        header: Header to copy (WCS etc.; scaling keywords are dropped)
+        shape: (n_chan, ny, nx)
+
+    Returns:
+        HDUList opened with mode='update', memmap=True
+    """
+    hdr = fits.PrimaryHDU(np.zeros((1, 1, 1), dtype=np.float32)).header
+    for key, value in header.items():
+        if key not in hdr and key not in ('BSCALE', 'BZERO', 'BLANK', 'COMMENT', 'HISTORY', '') \
+                and not key.startswith('NAXIS'):
+            hdr[key] = value
+    for i, n in enumerate(shape[::-1], 1):
+        hdr[f'NAXIS{i}'] = n
+
+    header_bytes = hdr.tostring().encode('ascii')
+    n_data = int(np.prod(shape)) * 4
+    padded = -(-n_data // 2880) * 2880
+
+    with open(path, 'wb') as f:
+        f.write(header_bytes)
+        f.seek(len(header_bytes) + padded - 1)
+        f.write(b'\0')
+
+    return fits.open(path, mode='update', memmap=True)
+
+def read_cube(fits_file, chan_range=None, slab_chans=64):
+    """
+    Cube (or a channel range of it) as one float64 array, NaN = blanked
+
+    Read slab by slab from the memory-mapped file, so only the returned
+    array is held in memory.
+    """
+    shape = cube_header_shape(fits.getheader(fits_file))
+    c0, c1 = chan_range if chan_range is not None else (0, shape[0])
+
+    data = np.empty((c1 - c0,) + tuple(shape[1:]))
+    for s0, s1, slab in iter_channel_slabs(fits_file, slab_chans, chan_range=(c0, c1)):
+        data[s0 - c0:s1 - c0] = slab
+
+    return data
+
+def load_cube(fits_file, chan_range=None, use_spectral_cube=False):
+    """
+    Cube data, velocity axis and celestial WCS
+
+    Args:
+        fits_file: Path to FITS cube
+        chan_range: Optional (first, stop) channel range
+        use_spectral_cube: Read with SpectralCube (compatibility path;
+            slower, needs the spectral-cube package)
+
+    Returns:
+        dict: data (n_chan, ny, nx) float64, vel [km/s], header,
+        wcs (celestial), unit
+    """
+    if use_spectral_cube:
+        from spectral_cube import SpectralCube
+
+        cube = SpectralCube.read(fits_file)
+        try:
+            cube = cube.with_spectral_unit(u.km/u.s, velocity_convention='radio')
+        except Exception as e:
+            print(f"   WARNING: Could not convert spectral axis to km/s ({e})")
+        if chan_range is not None:
+            cube = cube[chan_range[0]:chan_range[1]]
+        return {
+            "data": cube.filled_data[:].value,
+            "vel": np.asarray(cube.spectral_axis.value, dtype=float),
+            "header": cube.header,
+            "wcs": cube.wcs.celestial,
+            "unit": str(cube.unit),
+        }
+
+    header, shape, wcs = cube_header(fits_file)
+    vel = spectral_axis_kms(header, shape[0])
+    c0, c1 = chan_range if chan_range is not None else (0, shape[0])
+
+    return {
+        "data": read_cube(fits_file, (c0, c1)),
+        "vel": vel[c0:c1],
+        "header": header,
+        "wcs": wcs.celestial,
+        "unit": header.get('BUNIT', ''),
+    }
+
+def import_seconds(module):
+    """Wall time of importing a module in a fresh interpreter [s] (NaN if missing)"""
+    def run(code):
+        t0 = time.perf_counter()
+        ok = subprocess.run([sys.executable, "-c", code], capture_output=True,
+                            cwd=Path(__file__).parent).returncode == 0
+        return time.perf_counter() - t0, ok
+
+    base, _ = run("pass")
+    dt, ok = run(f"import {module}")
+    return dt - base if ok else np.nan
+
+def cube_latency(fits_file, repeat=3, use_spectral_cube=False):
+    """
+    Best-of-repeat time to load a cube and convert its axis to km/s [s]
+    """
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        cube = load_cube(fits_file, use_spectral_cube=use_spectral_cube)
+        cube["data"].sum()
+        best = min(best, time.perf_counter() - t0)
+        del cube
+    return best
+
+def main():
+    """Latency of the header/memmap reader vs SpectralCube"""
+    parser = argparse.ArgumentParser(
+        description='Startup and per-cube latency: cube_io reader vs SpectralCube'
+    )
+    parser.add_argument(
+        'fits_file',
+        nargs='+',
+        help='FITS cube(s) to load'
+    )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help='Loads per cube (best time is reported) [default: 3]'
+    )
+    args = parser.parse_args()
+
+    try:
+        import spectral_cube  # noqa: F401
+        have_sc = True
+    except ImportError:
+        have_sc = False
+
+    print("Startup (import in a fresh interpreter):")
+    print(f"   cube_io:       {import_seconds('cube_io'):.3f} s")
+    if have_sc:
+        print(f"   spectral_cube: {import_seconds('spectral_cube'):.3f} s")
+    else:
+        print("   spectral_cube: not installed (compatibility path unavailable)")
+
+    print("\nPer-cube latency (load + km/s axis + touch all data, best of "
+          f"{args.repeat}):")
+    for fits_file in args.fits_file:
+        fast = cube_latency(fits_file, args.repeat)
+        line = f"   {fits_file}: cube_io {fast:.3f} s"
+        if have_sc:
+            slow = cube_latency(fits_file, args.repeat, use_spectral_cube=True)
+            line += f", SpectralCube {slow:.3f} s ({slow/fast:.1f}×)"
+        print(line)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
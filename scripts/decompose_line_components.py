@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Decompose Line Components - multi-component / NH3 hyperfine fits per ring
+
+Fits up to K components (Gaussians or the NH3 hyperfine template) to
+every ring spectrum of a cube - and optionally every pixel - choosing
+the number of components per spectrum by BIC (or AIC). See
+line_decomposition.py.
+
+With an NH3 (2,2) cube on the same pixel grid, the (2,2) spectra are fitted
+with the (1,1) components (same K, velocities as start values) and every
+component gets a rotational temperature from the (2,2)/(1,1) ratio.
+
+The component table (--table) has the columns read by
+analyze_nh3_velocities.py, so the Δv comparison there can come from the
+cube instead of the published table:
+
+    python decompose_line_components.py G79_nh3_11_cube.fits --template nh3_11 \
+        --nh3-22 G79_nh3_22_cube.fits --aperture 1.0 --table G79_NH3_components_cube.csv
+    python analyze_nh3_velocities.py --table G79_NH3_components_cube.csv
+
+Usage:
+    # Up to 3 Gaussians per ring (CO)
+    python decompose_line_components.py G79_co32_cube.fits --max-components 3
+
+    # NH3 (1,1)+(2,2), rings of 0.2 pc, plus per-pixel component maps
+    python decompose_line_components.py G79_nh3_11_cube.fits --template nh3_11 \
+        --nh3-22 G79_nh3_22_cube.fits --per-pixel --min-peak 0.3
+
+Output:
+    <output>              - One row per (ring, component)
+    <table>               - component, v_min_kms, v_max_kms, Trot_K, Trot_limit_type
+                            (v_min/v_max = centroid ∓ FWHM/2)
+    <prefix>_components.fits (--per-pixel) - NCOMP map + TPEAK/VCENT/SIGMA
+                            planes (one per component, sorted by velocity)
+
+© 2025 Carmen N. Wrede, Lino P. Casu
+Licensed under ANTI-CAPITALIST SOFTWARE LICENSE v1.4
+"""
+import sys
+import os
+import argparse
+from pathlib import Path
+
+# UTF-8 for Windows
+os.environ['PYTHONIOENCODING'] = 'utf-8:replace'
+if sys.platform == 'win32':
+    try:
+        sys.stdout.reconfigure(encoding='utf-8', errors='replace')
+    except:
+        pass
+
+try:
+    import numpy as np
+    import pandas as pd
+    from astropy.io import fits
+    from astropy.coordinates import SkyCoord
+    import astropy.units as u
+except ImportError as e:
+    print(f"ERROR: Required packages missing: {e}")
+    print("\nInstall with:")
+    print("  pip install astropy pandas numpy")
+    sys.exit(1)
+
+from cube_io import (cube_header, spectral_axis_kms, read_cube,
+                     channel_window, parse_vel_range)
+from radius_map import cached_radius_map
+from ring_stats import ring_index
+from ring_spectra import ring_spectra_stream
+from line_decomposition import (TEMPLATES, decompose_spectra, fit_components,
+                                rotation_temperature)
+
+# G79.29+0.46 center (same as fits_to_ring_profile.py)
+G79_CENTER = SkyCoord("20h31m41s", "+40d21m07s", frame="icrs")
+
+FWHM = 2.0 * np.sqrt(2.0 * np.log(2.0))
+
+def component_names(n_components, prefix=""):
+    """Blue/Central/Red for up to 3 components (by velocity), else C1..CK"""
+    names = {1: ["Central"], 2: ["Blue", "Red"], 3: ["Blue", "Central", "Red"]}
+    base = names.get(n_components, [f"C{j+1}" for j in range(n_components)])
+    return [prefix + name for name in base]
+
+def fit_nh3_22(vel, spectra, dec, template="nh3_22"):
+    """
+    Fit (2,2) spectra with the (1,1) components as start values
+
+    Returns:
+        amplitude, amplitude_err: Arrays like dec["amplitude"] (NaN where
+        no (1,1) component or failed fit)
+    """
+    n, k_max = dec["amplitude"].shape
+    amp = np.full((n, k_max), np.nan)
+    amp_err = np.full((n, k_max), np.nan)
+
+    for K in range(1, k_max + 1):
+        sel = np.flatnonzero(dec["n_components"] == K)
+        if len(sel) == 0:
+            continue
+        v0 = dec["centroid"][sel, :K]
+        chan = np.abs(vel[None, None, :] - v0[:, :, None]).argmin(axis=2)
+        a0 = np.take_along_axis(np.nan_to_num(spectra[sel]), chan, axis=1)
+
+        p0 = np.stack([np.abs(a0), v0, dec["width"][sel, :K]], axis=2).reshape(len(sel), 3 * K)
+        fit = fit_components(vel, spectra[sel], p0, template=template)
+
+        ok = fit["fit_ok"]
+        amp[sel[ok], :K] = fit["params"][ok, 0::3]
+        amp_err[sel[ok], :K] = fit["errors"][ok, 0::3]
+
+    return amp, amp_err
+
+def component_rows(dec, r_edges, n_pixels, amp22=None, amp22_err=None, aperture=False):
+    """Rows of the per-(ring, component) table"""
+    rows = []
+    for i in range(len(dec["n_components"])):
+        K = int(dec["n_components"][i])
+        if K == 0:
+            continue
+        names = component_names(K, "" if aperture else f"R{i}-")
+        for j in range(K):
+            v0 = dec["centroid"][i, j]
+            sigma = dec["width"][i, j]
+            row = {
+                "component": names[j],
+                "ring": i,
+                "radius_pc": 0.5 * (r_edges[i] + r_edges[i + 1]),
+                "n_components": K,
+                "v_min_kms": v0 - 0.5 * FWHM * sigma,
+                "v_max_kms": v0 + 0.5 * FWHM * sigma,
+                "v_cent_kms": v0,
+                "v_err_kms": dec["centroid_err"][i, j],
+                "sigma_kms": sigma,
+                "sigma_err_kms": dec["width_err"][i, j],
+                "T_peak": dec["amplitude"][i, j],
+                "T_peak_err": dec["amplitude_err"][i, j],
+                "n_pixels": int(n_pixels[i]),
+            }
+            if amp22 is not None:
+                a22, e22 = amp22[i, j], amp22_err[i, j]
+                detected = np.isfinite(a22) and a22 > 3.0 * e22
+                # Non-detection: 3σ upper limit on (2,2) → upper limit on T_rot
+                t_rot = rotation_temperature(row["T_peak"], a22 if detected else 3.0 * e22)
+                row["T22_peak"] = a22
+                row["T22_peak_err"] = e22
+                row["Trot_K"] = float(t_rot)
+                row["Trot_limit_type"] = "measured" if detected else "upper"
+            rows.append(row)
+
+    return pd.DataFrame(rows)
+
+def decompose_pixels(fits_file, vel, chans, min_peak, **dec_kw):
+    """
+    Decompose every pixel spectrum in the channel window
+
+    Returns:
+        dict as decompose_spectra(), arrays reshaped to (..., ny, nx)
+    """
+    c0, c1 = chans
+    cube = read_cube(fits_file, chan_range=(c0, c1))
+
+    _, ny, nx = cube.shape
+    spectra = cube.reshape(c1 - c0, -1).T
+    with np.errstate(invalid='ignore'):
+        peak = np.nanmax(np.where(np.isfinite(spectra), spectra, -np.inf), axis=1)
+    todo = np.isfinite(peak)
+    if min_peak is not None:
+        todo &= peak >= min_peak
+    print(f"   Pixels to fit: {todo.sum()}/{len(todo)}")
+
+    k_max = dec_kw.get("max_components", 3)
+    out = {key: np.full((len(spectra), k_max), np.nan)
+           for key in ("amplitude", "centroid", "width")}
+    out["n_components"] = np.zeros(len(spectra), dtype=int)
+
+    if todo.any():
+        dec = decompose_spectra(vel[c0:c1], spectra[todo], **dec_kw)
+        for key in out:
+            out[key][todo] = dec[key]
+
+    maps = {key: val.T.reshape(-1, ny, nx) for key, val in out.items()}
+    maps["n_components"] = maps["n_components"][0]
+    return maps
+
+def save_component_maps(maps, header, path):
+    """NCOMP (primary) + TPEAK, VCENT, SIGMA cubes (component axis first)"""
+    from astropy.wcs import WCS
+
+    wcs_header = WCS(header).celestial.to_header()
+    hdus = [fits.PrimaryHDU(maps["n_components"].astype(np.int16), header=wcs_header)]
+    hdus[0].header['COMMENT'] = "Number of components (BIC/AIC), 0 = not fitted"
+    for name, key, unit in (("TPEAK", "amplitude", header.get('BUNIT', '')),
+                            ("VCENT", "centroid", "km/s"),
+                            ("SIGMA", "width", "km/s")):
+        hdu = fits.ImageHDU(maps[key].astype(np.float32), header=wcs_header, name=name)
+        hdu.header['BUNIT'] = unit
+        hdus.append(hdu)
+    fits.HDUList(hdus).writeto(path, overwrite=True)
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(
+        description='Multi-component / NH3 hyperfine decomposition of ring spectra'
+    )
+    parser.add_argument(
+        'fits_file',
+        help='Input FITS cube (NH3 (1,1) for --template nh3_11)'
+    )
+    parser.add_argument(
+        '--template',
+        choices=sorted(TEMPLATES),
+        default='gauss',
+        help='Component shape [default: gauss]'
+    )
+    parser.add_argument(
+        '--nh3-22',
+        help='NH3 (2,2) cube on the same pixel grid → T_rot per component'
+    )
+    parser.add_argument(
+        '--max-components',
+        type=int,
+        default=3,
+        help='Largest number of components tried per spectrum [default: 3]'
+    )
+    parser.add_argument(
+        '--criterion',
+        choices=['bic', 'aic'],
+        default='bic',
+        help='Information criterion for the number of components [default: bic]'
+    )
+    parser.add_argument(
+        '--vel-range', '--vel-window',
+        dest='vel_window',
+        help='Fit window "VMIN,VMAX" [km/s]; only these channels are read '
+             '(use --vel-range=-40,40 for negative values)'
+    )
+    parser.add_argument(
+        '--aperture',
+        type=float,
+        help='Fit one spectrum averaged within this radius [pc] instead of rings'
+    )
+    parser.add_argument(
+        '--r-min',
+        type=float,
+        default=0.0,
+        help='Minimum radius [pc]'
+    )
+    parser.add_argument(
+        '--r-max',
+        type=float,
+        default=2.0,
+        help='Maximum radius [pc]'
+    )
+    parser.add_argument(
+        '--r-step',
+        type=float,
+        default=0.2,
+        help='Ring width [pc]'
+    )
+    parser.add_argument(
+        '--center',
+        help='Center coordinates (e.g., "20h31m41s +40d21m07s")'
+    )
+    parser.add_argument(
+        '--distance',
+        type=float,
+        default=1.7,
+        help='Distance to source [kpc]'
+    )
+    parser.add_argument(
+        '--per-pixel',
+        action='store_true',
+        help='Also decompose every pixel and write <prefix>_components.fits'
+    )
+    parser.add_argument(
+        '--min-peak',
+        type=float,
+        help='Per-pixel mode: skip spectra whose peak is below this value'
+    )
+    parser.add_argument(
+        '--output',
+        help='Per-(ring, component) CSV [default: <cube>_components.csv]'
+    )
+    parser.add_argument(
+        '--table',
+        help='Component table for analyze_nh3_velocities.py [default: <cube>_component_table.csv]'
+    )
+
+    args = parser.parse_args()
+
+    print("="*80)
+    print("LINE COMPONENT DECOMPOSITION - G79.29+0.46")
+    print("="*80)
+
+    fits_path = Path(args.fits_file)
+    for path in [fits_path] + ([Path(args.nh3_22)] if args.nh3_22 else []):
+        if not path.exists():
+            print(f"\nERROR: File not found: {path}")
+            return 1
+
+    prefix = str(fits_path.with_suffix(''))
+    output = args.output or f"{prefix}_components.csv"
+    table = args.table or f"{prefix}_component_table.csv"
+
+    center = SkyCoord(args.center, frame="icrs") if args.center else G79_CENTER
+    distance = args.distance * u.kpc
+
+    if args.aperture:
+        r_edges = np.array([0.0, args.aperture])
+    else:
+        r_edges = np.arange(args.r_min, args.r_max + args.r_step, args.r_step)
+
+    header, shape, wcs = cube_header(str(fits_path))
+    try:
+        vel_window = parse_vel_range(args.vel_window)
+        vel = spectral_axis_kms(header, shape[0], strict=vel_window is not None)
+        chans = channel_window(vel, vel_window)
+    except ValueError as e:
+        print(f"\nERROR: {e}")
+        return 1
+    dec_kw = dict(max_components=args.max_components, template=args.template,
+                  criterion=args.criterion)
+
+    print(f"\nInput: {fits_path} {shape}")
+    print(f"Template: {args.template}, K ≤ {args.max_components}, {args.criterion.upper()}")
+    print(f"Channels: {chans[0]}-{chans[1]-1} ({vel[chans[0]]:.2f} to {vel[chans[1]-1]:.2f} km/s)")
+
+    print(f"\n[1/3] Ring spectra...")
+    r_pc, _ = cached_radius_map(shape[1:], wcs.celestial, center, distance)
+    idx = ring_index(r_pc, r_edges)
+    n_rings = len(r_edges) - 1
+    res = ring_spectra_stream(str(fits_path), idx, n_rings, progress=False,
+                              chan_range=chans)
+    spectra = res["spectra"]
+
+    print(f"\n[2/3] Decomposing {n_rings} spectra...")
+    dec = decompose_spectra(vel[chans[0]:chans[1]], spectra, **dec_kw)
+
+    amp22 = amp22_err = None
+    if args.nh3_22:
+        header22, shape22, _ = cube_header(args.nh3_22)
+        if shape22[1:] != shape[1:]:
+            print(f"\nERROR: (2,2) cube grid {shape22[1:]} differs from {shape[1:]}")
+            return 1
+        try:
+            vel22 = spectral_axis_kms(header22, shape22[0],
+                                      strict=vel_window is not None)
+            c22 = channel_window(vel22, vel_window)
+        except ValueError as e:
+            print(f"\nERROR: (2,2) cube: {e}")
+            return 1
+        res22 = ring_spectra_stream(args.nh3_22, idx, n_rings, progress=False,
+                                    chan_range=c22)
+        amp22, amp22_err = fit_nh3_22(vel22[c22[0]:c22[1]], res22["spectra"], dec,
+                                      template="nh3_22" if args.template == "nh3_11" else args.template)
+
+    df = component_rows(dec, r_edges, res["n_pixels"], amp22, amp22_err,
+                        aperture=bool(args.aperture))
+
+    for i, K in enumerate(dec["n_components"]):
+        v = ", ".join(f"{c:+.2f}" for c in dec["centroid"][i, :K])
+        print(f"   Ring {i}: K = {K}  v = [{v}] km/s")
+
+    if df.empty:
+        print("\nERROR: No successful fits")
+        return 1
+
+    print(f"\n[3/3] Saving...")
+    with open(output, 'w') as f:
+        f.write(f"# Line components per ring ({args.template}, {args.criterion.upper()})\n")
+        f.write(f"# Source: {fits_path.name}" + (f" + {Path(args.nh3_22).name}" if args.nh3_22 else "") + "\n")
+        f.write(f"# Center: {center.to_string('hmsdms')}\n")
+        f.write(f"# Distance: {distance}\n")
+        f.write(f"# Date: {pd.Timestamp.now()}\n")
+        f.write(f"#\n")
+        df.to_csv(f, index=False)
+    print(f"   Saved: {output}")
+
+    columns = ["component", "v_min_kms", "v_max_kms", "Trot_K", "Trot_limit_type"]
+    out = df.reindex(columns=columns + ["radius_pc", "T_peak", "sigma_kms"])
+    out.to_csv(table, index=False)
+    print(f"   Saved: {table}")
+
+    if args.per_pixel:
+        print(f"\n   Per-pixel decomposition...")
+        maps = decompose_pixels(str(fits_path), vel, chans, args.min_peak, **dec_kw)
+        path = f"{prefix}_components.fits"
+        save_component_maps(maps, header, path)
+        print(f"   Saved: {path}")
+
+    print("\n" + "="*80)
+    print("DONE!")
+    print("="*80)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
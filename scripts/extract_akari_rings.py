@@ -48,6 +48,9 @@ except ImportError as e:
     print("  pip install numpy pandas astropy")
     sys.exit(1)
 
+from radius_map import cached_radius_map
+from ring_stats import ring_statistics
+
 # G79.29+0.46 parameters (Carmen's exact values!)
 G79_CENTER = SkyCoord("20h31m41s +40d21m07s", frame="icrs")
 G79_DISTANCE = 1.7  # kpc
@@ -99,57 +102,35 @@ def main():
     # Calculate radial distances
     print(f"\n[2/4] Calculating radial distances...")
     
-    ny, nx = data.shape
-    y_idx, x_idx = np.indices(data.shape)
-    
-    # Convert pixels to sky coordinates
-    ra, dec = wcs.all_pix2world(x_idx, y_idx, 0)
-    coords = SkyCoord(ra*u.deg, dec*u.deg, frame="icrs")
-    
-    # Angular separation from G79 center
-    r_ang = coords.separation(G79_CENTER)
-    
-    # Physical distance in pc
-    r_pc = (r_ang.to(u.rad) * (G79_DISTANCE * u.kpc)).to(u.pc).value
+    # Pixel-space radius map (see radius_map.py)
+    r_pc, info = cached_radius_map(data.shape, wcs, G79_CENTER, G79_DISTANCE)
     
+    print(f"   Method: {info['method']} (max deviation: {info['max_dev_pc']:.2e} pc)")
     print(f"   Radial range: {r_pc.min():.2f} - {r_pc.max():.2f} pc")
     
     # Extract rings
     print(f"\n[3/4] Extracting {len(r_edges_pc)-1} rings...")
     
-    rows = []
-    for ring_idx, (r_min, r_max) in enumerate(zip(r_edges_pc[:-1], r_edges_pc[1:])):
-        mask = (r_pc >= r_min) & (r_pc < r_max) & np.isfinite(data)
-        
-        if np.any(mask):
-            vals = data[mask]
-            I_mean = np.nanmean(vals)
-            I_std = np.nanstd(vals)
-            I_median = np.nanmedian(vals)
-            n_pixels = np.sum(mask)
-            
-            rows.append({
-                "ring": ring_idx,
-                "r_min_pc": float(r_min),
-                "r_max_pc": float(r_max),
-                "radius_pc": float(0.5 * (r_min + r_max)),
-                "I_mean": float(I_mean),
-                "I_median": float(I_median),
-                "I_std": float(I_std),
-                "I_err": float(I_std / np.sqrt(n_pixels)),
-                "n_pixels": int(n_pixels),
-            })
-            
-            print(f"   Ring {ring_idx}: r={r_min:.1f}-{r_max:.1f} pc, "
-                  f"I={I_mean:.3e} ± {I_std:.3e}, n={n_pixels}")
+    # All rings in one pass (see ring_stats.py)
+    df = ring_statistics(data, r_pc, r_edges_pc, keep_empty=True)
+    
+    for row in df.itertuples():
+        if row.n_pixels > 0:
+            print(f"   Ring {row.ring}: r={row.r_inner_pc:.1f}-{row.r_outer_pc:.1f} pc, "
+                  f"I={row.I_mean:.3e} ± {row.I_std:.3e}, n={row.n_pixels}")
         else:
-            print(f"   Ring {ring_idx}: r={r_min:.1f}-{r_max:.1f} pc - NO DATA")
+            print(f"   Ring {row.ring}: r={row.r_inner_pc:.1f}-{row.r_outer_pc:.1f} pc - NO DATA")
+    
+    df = df[df["n_pixels"] > 0].rename(columns={
+        "r_inner_pc": "r_min_pc",
+        "r_outer_pc": "r_max_pc",
+        "I_sem": "I_err",
+    })[["ring", "r_min_pc", "r_max_pc", "radius_pc", "I_mean", "I_median",
+        "I_std", "I_err", "n_pixels"]].reset_index(drop=True)
     
     # Save CSV
     print(f"\n[4/4] Saving CSV...")
     
-    df = pd.DataFrame(rows)
-    
     with open(output_csv, 'w', encoding='utf-8') as f:
         f.write("# G79.29+0.46 Ring Profile from FITS\n")
         f.write(f"# Source file: {fits_path.name}\n")
@@ -9,8 +9,15 @@ This script is ready to run with G79 IRAM CO data!
 Usage:
     python extract_co_velocity_rings.py G79_iram_co21_cube.fits
     
+    # Only read the channels between -10 and +10 km/s
+    python extract_co_velocity_rings.py G79_iram_co21_cube.fits --vel-range=-10,10
+    
+    # Compatibility: read the cube with spectral-cube instead
+    python extract_co_velocity_rings.py G79_iram_co21_cube.fits --spectral-cube
+    
 Output:
     G79_iram_co21_rings_REAL.csv
+    G79_iram_co21_rings_REAL_rv.fits  (ring × channel r–v matrix, see rv_diagram.py)
 
 Carmen's method:
 1. Load spectral cube
@@ -26,6 +33,7 @@ Licensed under ANTI-CAPITALIST SOFTWARE LICENSE v1.4
 """
 import sys
 import os
+import argparse
 from pathlib import Path
 
 # UTF-8 for Windows
@@ -39,32 +47,20 @@ if sys.platform == 'win32':
 try:
     import numpy as np
     import pandas as pd
+    from astropy.io import fits
     from astropy.coordinates import SkyCoord
-    import astropy.units as u
 except ImportError as e:
     print(f"ERROR: Core packages missing: {e}")
     print("\nInstall with:")
     print("  pip install numpy pandas astropy")
     sys.exit(1)
 
-# Check for spectral-cube
-try:
-    from spectral_cube import SpectralCube
-    from astropy.modeling import models, fitting
-    HAVE_SPECTRAL_CUBE = True
-except ImportError:
-    print("\n" + "="*80)
-    print("MISSING DEPENDENCY: spectral-cube")
-    print("="*80)
-    print("\nThis script requires the 'spectral-cube' package for FITS cube analysis.")
-    print("\nInstall with:")
-    print("  pip install spectral-cube")
-    print("\nNote: This is an OPTIONAL dependency for advanced FITS cube processing.")
-    print("      The main paper validation does NOT require this package.")
-    print("\n" + "="*80)
-    print("STATUS: Non-critical - other scripts work fine!")
-    print("="*80 + "\n")
-    sys.exit(0)  # Exit gracefully, not as error
+from radius_map import cached_radius_map
+from ring_stats import ring_index
+from ring_spectra import ring_spectra
+from gauss_fit import fit_gaussians
+from rv_diagram import save_rv_fits
+from cube_io import load_cube, velocity_channel_range, parse_vel_range
 
 # G79.29+0.46 parameters (Carmen's exact values!)
 G79_CENTER = SkyCoord("20h31m41s +40d21m07s", frame="icrs")
@@ -75,14 +71,27 @@ r_edges_pc = np.arange(0.0, 2.0 + 0.2, 0.2)
 
 def main():
     """Main extraction function"""
-    
-    if len(sys.argv) < 2:
-        print("Usage: python extract_co_velocity_rings.py <FITS_cube>")
-        print("\nExample:")
-        print("  python extract_co_velocity_rings.py G79_iram_co21_cube.fits")
-        return 1
-    
-    fits_file = sys.argv[1]
+    parser = argparse.ArgumentParser(
+        description='Velocity rings (ring spectra + Gaussian centroids) from a CO cube'
+    )
+    parser.add_argument(
+        'fits_file',
+        help='Input FITS cube (e.g. G79_iram_co21_cube.fits)'
+    )
+    parser.add_argument(
+        '--vel-range',
+        help='Only read channels in "VMIN,VMAX" [km/s] (use --vel-range=-10,10 for negative values)'
+    )
+    parser.add_argument(
+        '--spectral-cube',
+        action='store_true',
+        help='Read the cube with spectral-cube (compatibility path; default: header/memmap reader)'
+    )
+
+    args = parser.parse_args()
+
+    fits_file = args.fits_file
+    use_spectral_cube = args.spectral_cube
     fits_path = Path(fits_file)
     
     if not fits_path.exists():
@@ -101,67 +110,52 @@ def main():
     print(f"Distance:   {G79_DISTANCE} kpc")
     print(f"Rings:      {len(r_edges_pc)-1} rings (0-2 pc, 0.2 pc spacing)")
     
-    # Load cube
+    # Load cube (memory-mapped FITS + header velocity axis, see cube_io.py)
     print(f"\n[1/5] Loading spectral cube...")
     try:
-        cube = SpectralCube.read(fits_path)
+        vel_range = parse_vel_range(args.vel_range)
+        chan_range = velocity_channel_range(fits.getheader(fits_file), vel_range)
+        cube = load_cube(fits_file, chan_range=chan_range,
+                         use_spectral_cube=use_spectral_cube)
+    except ImportError:
+        print("ERROR: spectral-cube not installed (pip install spectral-cube, "
+              "or run without --spectral-cube)")
+        return 1
     except Exception as e:
         print(f"ERROR loading cube: {e}")
         return 1
     
-    # Convert spectral axis to km/s
-    try:
-        cube = cube.with_spectral_unit(u.km/u.s)
-        vel = cube.spectral_axis.value
-    except Exception as e:
-        print(f"WARNING: Could not convert to km/s: {e}")
-        vel = cube.spectral_axis.value
+    vel = cube["vel"]
+    cube_data = cube.pop("data")
     
-    print(f"   Cube size: {cube.shape}")
+    print(f"   Cube size: {cube_data.shape}")
     print(f"   Velocity range: {vel.min():.2f} - {vel.max():.2f} km/s")
     print(f"   Channels: {len(vel)}")
     
     # Calculate spatial radial distances
     print(f"\n[2/5] Calculating spatial distances...")
     
-    wcs_spatial = cube.wcs.celestial
-    ny, nx = cube.shape[1], cube.shape[2]
-    y_idx, x_idx = np.indices((ny, nx))
-    
-    # Convert to sky coordinates
-    ra, dec = wcs_spatial.all_pix2world(x_idx, y_idx, 0)
-    coords = SkyCoord(ra*u.deg, dec*u.deg, frame="icrs")
-    
-    # Angular separation
-    r_ang = coords.separation(G79_CENTER)
-    
-    # Physical distance
-    r_pc = (r_ang.to(u.rad) * (G79_DISTANCE * u.kpc)).to(u.pc).value
+    # Pixel-space radius map (see radius_map.py)
+    r_pc, info = cached_radius_map(cube_data.shape[1:], cube["wcs"], G79_CENTER, G79_DISTANCE)
     
+    print(f"   Method: {info['method']} (max deviation: {info['max_dev_pc']:.2e} pc)")
     print(f"   Spatial range: {r_pc.min():.2f} - {r_pc.max():.2f} pc")
     
     # Extract ring spectra
     print(f"\n[3/5] Extracting {len(r_edges_pc)-1} ring spectra...")
     
+    # All ring spectra from one sparse product (see ring_spectra.py)
+    n_rings = len(r_edges_pc) - 1
+    res = ring_spectra(cube_data, ring_index(r_pc, r_edges_pc), n_rings)
+    del cube_data
+    
+    # All ring spectra fitted together (batched Levenberg–Marquardt, see gauss_fit.py)
+    fit = fit_gaussians(vel, res["spectra"])
+    
     rows = []
     for ring_idx, (r_min, r_max) in enumerate(zip(r_edges_pc[:-1], r_edges_pc[1:])):
-        mask_2d = (r_pc >= r_min) & (r_pc < r_max)
-        
-        if np.any(mask_2d):
-            # Create 3D mask
-            mask_3d = np.broadcast_to(mask_2d[np.newaxis, :, :], cube.shape)
-            
-            # Get cube data
-            try:
-                cube_data = cube.filled_data[:].value
-            except:
-                cube_data = cube.unmasked_data[:].value
-            
-            # Mask data
-            masked_data = np.where(mask_3d, cube_data, np.nan)
-            
-            # Average spectrum in this ring
-            spectrum = np.nanmean(masked_data, axis=(1, 2))
+        if res["n_pixels"][ring_idx] > 0:
+            spectrum = res["spectra"][ring_idx]
             
             if not np.all(np.isnan(spectrum)):
                 # Find peak
@@ -169,29 +163,21 @@ def main():
                 v_peak = vel[peak_idx]
                 T_peak = spectrum[peak_idx]
                 
-                # Try Gaussian fit
-                try:
-                    g_init = models.Gaussian1D(
-                        amplitude=T_peak,
-                        mean=v_peak,
-                        stddev=1.0
-                    )
-                    fit_g = fitting.LevMarLSQFitter()
-                    g = fit_g(g_init, vel, spectrum)
-                    
-                    v_cent = float(g.mean.value)
-                    v_width = float(abs(g.stddev.value))
-                    T_fit = float(g.amplitude.value)
+                if fit["fit_ok"][ring_idx]:
+                    v_cent = float(fit["centroid"][ring_idx])
+                    v_err = float(fit["centroid_err"][ring_idx])
+                    v_width = float(fit["width"][ring_idx])
+                    T_fit = float(fit["amplitude"][ring_idx])
                     fit_success = True
-                    
-                except Exception as e:
+                else:
                     # Fallback to peak
                     v_cent = float(v_peak)
+                    v_err = np.nan
                     v_width = np.nan
                     T_fit = float(T_peak)
                     fit_success = False
                 
-                n_pixels = int(np.sum(mask_2d))
+                n_pixels = int(res["n_pixels"][ring_idx])
                 
                 rows.append({
                     "ring": ring_idx,
@@ -199,6 +185,7 @@ def main():
                     "r_max_pc": float(r_max),
                     "radius_pc": float(0.5 * (r_min + r_max)),
                     "v_obs_kms": v_cent,
+                    "v_err_kms": v_err,
                     "v_width_kms": v_width,
                     "T_peak_K": float(T_peak),
                     "T_fit_K": T_fit,
@@ -238,6 +225,7 @@ def main():
         f.write("#   r_max_pc    - Outer edge [pc]\n")
         f.write("#   radius_pc   - Ring center [pc]\n")
         f.write("#   v_obs_kms   - Velocity centroid [km/s] (Gaussian fit or peak)\n")
+        f.write("#   v_err_kms   - 1σ uncertainty of v_obs_kms [km/s] (nan if fit failed)\n")
         f.write("#   v_width_kms - Line width [km/s] (Gaussian σ, nan if fit failed)\n")
         f.write("#   T_peak_K    - Peak temperature [K]\n")
         f.write("#   T_fit_K     - Fitted amplitude [K]\n")
@@ -249,6 +237,12 @@ def main():
     print(f"   ✓ Saved: {output_csv}")
     print(f"   ✓ Extracted {len(df)} velocity rings!")
     
+    # Keep the full ring spectra as an r–v diagram
+    output_rv = output_csv.replace(".csv", "_rv.fits")
+    save_rv_fits(res["spectra"], vel, r_edges_pc, output_rv, n_pixels=res["n_pixels"],
+                 bunit=cube["unit"], source=fits_path.name)
+    print(f"   ✓ Saved r–v diagram: {output_rv}")
+    
     # Statistics
     print(f"\n[5/5] Statistics...")
     
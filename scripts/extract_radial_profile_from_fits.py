@@ -11,6 +11,9 @@ Requirements:
 Usage:
     python extract_radial_profile_from_fits.py data/telescope/iram/G79_CO21.fits
     python extract_radial_profile_from_fits.py data/telescope/effelsberg/G79_NH3.fits --output G79_verified_profile.csv
+    
+    # Cube: intensity, v_obs(r) and σ_v(r) from moment maps in a velocity window
+    python extract_radial_profile_from_fits.py G79_CO21.fits --vel-range=-10,10 --threshold 0.5
 
 © 2025 Carmen N. Wrede, Lino P. Casu
 Licensed under ANTI-CAPITALIST SOFTWARE LICENSE v1.4
@@ -43,13 +46,8 @@ except ImportError:
     print("Install with: pip install astropy")
     sys.exit(1)
 
-try:
-    from spectral_cube import SpectralCube
-    HAS_SPECTRAL_CUBE = True
-except ImportError:
-    HAS_SPECTRAL_CUBE = False
-    print("WARNING: spectral-cube not installed (optional)")
-    print("Install with: pip install spectral-cube")
+from cube_io import spectral_axis_kms, parse_vel_range
+from moments import moment_maps
 
 # G79.29+0.46 coordinates
 G79_COORD = SkyCoord('20h32m32.9s', '+41d19m33s', frame='icrs')
@@ -129,8 +127,8 @@ def extract_radial_profile_2d(hdu, center_coord, distance, n_bins=10):
     # Convert to physical distance
     # Get pixel scale from WCS
     try:
-        pixscale = wcs.proj_plane_pixel_scales()[0]  # degrees/pixel
-        pixscale_arcsec = pixscale * 3600  # arcsec/pixel
+        pixscale = u.Quantity(wcs.celestial.proj_plane_pixel_scales()[0], u.deg)  # degrees/pixel
+        pixscale_arcsec = pixscale.to_value(u.arcsec)  # arcsec/pixel
         pixscale_pc = (pixscale_arcsec * u.arcsec * distance).to(u.pc, 
                        equivalencies=u.dimensionless_angles())
         r_pc = r_pix * pixscale_pc.value
@@ -174,52 +172,60 @@ def extract_radial_profile_2d(hdu, center_coord, distance, n_bins=10):
     
     return radii_pc, values, errors
 
-def extract_radial_profile_3d(hdu, center_coord, distance, n_bins=10):
+def extract_radial_profile_3d(hdu, center_coord, distance, n_bins=10,
+                              vel_window=None, threshold=None):
     """
     Extract radial profile from 3D cube (velocity cube)
     
     For velocity cubes, we:
-    1. Collapse along velocity axis (moment 0 - integrated intensity)
-    2. Extract radial profile from 2D map
-    3. Optionally: Extract velocity information (moment 1)
+    1. Compute moment 0/1/2 maps in one pass over the channels (moments.py)
+    2. Extract radial profiles of all three maps (same 2D path)
+    
+    This gives intensity, v_obs(r) and σ_v(r) without per-spectrum fitting.
     
     Args:
         hdu: FITS HDU with 3D cube
         center_coord: SkyCoord of source center
         distance: Distance to source
         n_bins: Number of radial bins
+        vel_window: Optional (v_min, v_max) [km/s] for the moments
+        threshold: Optional signal threshold (data units) for the moments
     
     Returns:
-        radii_pc, intensity, velocity, errors
+        radii_pc, intensity, velocity, int_err, vel_err, sigma_v, sigma_err
     """
     print("\n[2/6] Extracting 3D radial profile...")
-    print("   Collapsing velocity axis (moment 0)...")
+    print("   Computing moment 0/1/2 maps (single pass over channels)...")
     
     data = hdu.data
     wcs = WCS(hdu.header)
+    vel = spectral_axis_kms(hdu.header, data.shape[0], strict=vel_window is not None)
     
-    # Collapse along velocity axis (assumed to be first axis)
-    # Moment 0: Integrated intensity
-    moment0 = np.nansum(data, axis=0)
+    mom = moment_maps(data, vel, vel_window=vel_window, threshold=threshold)
     
-    # Create 2D HDU for radial profile extraction
-    hdu_2d = fits.PrimaryHDU(data=moment0, header=hdu.header)
+    c0, c1 = mom["channels"]
+    print(f"   Channels: {c0}-{c1-1} ({vel[c0]:.2f} to {vel[c1-1]:.2f} km/s)")
+    if threshold is not None:
+        print(f"   Signal mask: T >= {threshold:g}")
     
-    # Remove velocity axis from WCS
-    wcs_2d = wcs.dropaxis(2)  # Drop spectral axis
-    hdu_2d.header.update(wcs_2d.to_header())
+    # Celestial WCS only (a copy of the cube header would keep the
+    # spectral axis and give a 3-axis WCS for the 2D maps)
+    header_2d = wcs.celestial.to_header()
     
-    # Extract profile from moment 0
-    radii_pc, intensity, int_err = extract_radial_profile_2d(
-        hdu_2d, center_coord, distance, n_bins
-    )
+    profiles = []
+    for name in ("mom0", "mom1", "mom2"):
+        # Create 2D HDU for radial profile extraction
+        hdu_2d = fits.PrimaryHDU(data=mom[name], header=header_2d)
+        print(f"\n   {name}:", end="")
+        profiles.append(extract_radial_profile_2d(
+            hdu_2d, center_coord, distance, n_bins
+        ))
     
-    # TODO: Add moment 1 (velocity) extraction
-    # For now, return zeros
-    velocity = np.zeros_like(intensity)
-    vel_err = np.zeros_like(intensity)
+    radii_pc, intensity, int_err = profiles[0]
+    _, velocity, vel_err = profiles[1]
+    _, sigma_v, sigma_err = profiles[2]
     
-    return radii_pc, intensity, velocity, int_err, vel_err
+    return radii_pc, intensity, velocity, int_err, vel_err, sigma_v, sigma_err
 
 def plot_profile(radii_pc, values, errors, output_path=None):
     """
@@ -253,7 +259,7 @@ def plot_profile(radii_pc, values, errors, output_path=None):
         plt.show()
 
 def save_profile_csv(radii_pc, values, errors, output_path, 
-                     value_name='value', source_info=''):
+                     value_name='value', source_info='', extra=None):
     """
     Save profile to CSV
     
@@ -264,7 +270,9 @@ def save_profile_csv(radii_pc, values, errors, output_path,
         output_path: Output CSV path
         value_name: Name of the value column
         source_info: Source information for header
+        extra: Optional dict {name: (values, errors)} of further columns
     """
+    extra = extra or {}
     print(f"\n[6/6] Saving to CSV: {output_path}")
     
     with open(output_path, 'w', encoding='utf-8') as f:
@@ -274,11 +282,17 @@ def save_profile_csv(radii_pc, values, errors, output_path,
         f.write(f"# Extraction method: Radial binning from FITS\n")
         f.write(f"# Date: {np.datetime64('today')}\n")
         f.write(f"#\n")
-        f.write(f"ring,radius_pc,{value_name},{value_name}_err\n")
+        header = f"ring,radius_pc,{value_name},{value_name}_err"
+        for name in extra:
+            header += f",{name},{name}_err"
+        f.write(header + "\n")
         
         # Write data
         for i, (r, v, e) in enumerate(zip(radii_pc, values, errors)):
-            f.write(f"{i},{r:.3f},{v:.6e},{e:.6e}\n")
+            line = f"{i},{r:.3f},{v:.6e},{e:.6e}"
+            for vals, errs in extra.values():
+                line += f",{vals[i]:.6e},{errs[i]:.6e}"
+            f.write(line + "\n")
     
     print(f"   Saved {len(radii_pc)} radial bins")
 
@@ -312,6 +326,16 @@ def main():
         default=1.7,
         help='Distance to source [kpc]'
     )
+    parser.add_argument(
+        '--vel-range', '--vel-window',
+        dest='vel_window',
+        help='Velocity window for the cube moments, "VMIN,VMAX" [km/s]; only these channels are read (use --vel-range=-10,10 for negative values)'
+    )
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        help='Signal mask for the cube moments: ignore voxels below this value'
+    )
     
     args = parser.parse_args()
     
@@ -336,6 +360,8 @@ def main():
     # Extract profile based on dimensionality
     distance = args.distance * u.kpc
     
+    extra = None
+    
     if '2D' in file_type:
         radii_pc, values, errors = extract_radial_profile_2d(
             hdu_list[0], G79_COORD, distance, args.bins
@@ -343,14 +369,23 @@ def main():
         value_name = 'intensity'
     
     elif '3D' in file_type:
-        radii_pc, intensity, velocity, int_err, vel_err = extract_radial_profile_3d(
-            hdu_list[0], G79_COORD, distance, args.bins
-        )
+        try:
+            vel_window = parse_vel_range(args.vel_window)
+            (radii_pc, intensity, velocity, int_err, vel_err,
+             sigma_v, sigma_err) = extract_radial_profile_3d(
+                hdu_list[0], G79_COORD, distance, args.bins,
+                vel_window=vel_window, threshold=args.threshold
+            )
+        except ValueError as e:
+            print(f"\nERROR: {e}")
+            return 1
         values = intensity
         errors = int_err
         value_name = 'intensity'
-        
-        # TODO: Save velocity as separate column
+        extra = {
+            'v_obs_kms': (velocity, vel_err),
+            'sigma_v_kms': (sigma_v, sigma_err),
+        }
     
     else:
         print(f"\nERROR: Unsupported file type: {file_type}")
@@ -360,7 +395,8 @@ def main():
     save_profile_csv(
         radii_pc, values, errors, args.output,
         value_name=value_name,
-        source_info=f"{fits_path.name} ({file_type})"
+        source_info=f"{fits_path.name} ({file_type})",
+        extra=extra
     )
     
     # Plot if requested
@@ -12,7 +12,7 @@ Based on Carmen's workflow:
 This is the PRODUCTION VERSION combining:
 - astroquery for automated data fetching
 - WCS for coordinate handling
-- spectral-cube for datacube analysis
+- memory-mapped FITS cubes (cube_io.py) for datacube analysis
 - Automated ring extraction
 
 Usage:
@@ -57,6 +57,12 @@ except ImportError as e:
     print("  pip install numpy pandas matplotlib astropy")
     sys.exit(1)
 
+from radius_map import cached_radius_map
+from ring_stats import ring_statistics, ring_index
+from ring_spectra import ring_spectra
+from gauss_fit import fit_gaussians
+from cube_io import load_cube
+
 # Optional imports for advanced features
 try:
     from astroquery.ipac.irsa import Irsa
@@ -70,13 +76,6 @@ try:
 except ImportError:
     HAVE_HSA = False
 
-try:
-    from spectral_cube import SpectralCube
-    from astropy.modeling import models, fitting
-    HAVE_SPECTRAL_CUBE = True
-except ImportError:
-    HAVE_SPECTRAL_CUBE = False
-
 # G79.29+0.46 coordinates
 G79_CENTER = SkyCoord("20h31m41s +40d21m07s", frame="icrs")
 G79_DISTANCE = 1.7  # kpc
@@ -174,19 +173,8 @@ def fits_2d_to_rings(fits_file, center=G79_CENTER, distance=G79_DISTANCE,
     
     print(f"   Image size: {data.shape}")
     
-    # 2. Calculate radial distances
-    ny, nx = data.shape
-    y_idx, x_idx = np.indices(data.shape)
-    
-    # Convert pixels to sky coordinates
-    ra, dec = wcs.all_pix2world(x_idx, y_idx, 0)
-    coords = SkyCoord(ra*u.deg, dec*u.deg, frame="icrs")
-    
-    # Angular separation from center
-    r_ang = coords.separation(center)
-    
-    # Physical distance (convert to pc)
-    r_pc = (r_ang.to(u.rad) * (distance * u.kpc)).to(u.pc).value
+    # 2. Calculate radial distances (pixel space, see radius_map.py)
+    r_pc, _ = cached_radius_map(data.shape, wcs, center, distance)
     
     print(f"   Radial range: {r_pc.min():.2f} - {r_pc.max():.2f} pc")
     
@@ -195,34 +183,17 @@ def fits_2d_to_rings(fits_file, center=G79_CENTER, distance=G79_DISTANCE,
     
     print(f"   Extracting {len(r_centers)} rings...")
     
-    # 4. Extract ring averages
-    rows = []
-    for ring_idx, (r_min, r_max) in enumerate(zip(r_edges[:-1], r_edges[1:])):
-        mask = (r_pc >= r_min) & (r_pc < r_max) & np.isfinite(data)
-        
-        if np.any(mask):
-            vals = data[mask]
-            I_mean = np.nanmean(vals)
-            I_std = np.nanstd(vals)
-            I_median = np.nanmedian(vals)
-            n_pixels = np.sum(mask)
-            
-            rows.append({
-                "ring": ring_idx,
-                "radius_pc": float(0.5 * (r_min + r_max)),
-                "r_inner_pc": float(r_min),
-                "r_outer_pc": float(r_max),
-                "I_mean": float(I_mean),
-                "I_median": float(I_median),
-                "I_std": float(I_std),
-                "I_err": float(I_std / np.sqrt(n_pixels)),  # Standard error
-                "n_pixels": int(n_pixels),
-            })
-            
-            print(f"      Ring {ring_idx}: r={r_min:.2f}-{r_max:.2f} pc, "
-                  f"I={I_mean:.3e} ± {I_std:.3e}, n={n_pixels}")
+    # 4. Extract ring averages (all rings in one pass, see ring_stats.py)
+    df_rings = ring_statistics(data, r_pc, r_edges)
     
-    df_rings = pd.DataFrame(rows)
+    for row in df_rings.itertuples():
+        print(f"      Ring {row.ring}: r={row.r_inner_pc:.2f}-{row.r_outer_pc:.2f} pc, "
+              f"I={row.I_mean:.3e} ± {row.I_std:.3e}, n={row.n_pixels}")
+    
+    df_rings = df_rings.rename(columns={"I_sem": "I_err"})[
+        ["ring", "radius_pc", "r_inner_pc", "r_outer_pc", "I_mean", "I_median",
+         "I_std", "I_err", "n_pixels"]
+    ]
     
     # 5. Save to CSV
     if output_csv:
@@ -257,36 +228,17 @@ def fits_cube_to_rings(fits_file, center=G79_CENTER, distance=G79_DISTANCE,
     Returns:
         DataFrame with ring profile
     """
-    if not HAVE_SPECTRAL_CUBE:
-        print("ERROR: spectral-cube not installed!")
-        print("Install with: pip install spectral-cube")
-        return None
-    
     print(f"\n[CUBE→Rings] Processing 3D cube: {fits_file}")
     
-    # 1. Load cube
-    cube = SpectralCube.read(fits_file)
-    
-    # Convert to km/s
-    try:
-        cube = cube.with_spectral_unit(u.km/u.s)
-    except:
-        print("   Warning: Could not convert spectral axis to km/s")
-    
-    vel = cube.spectral_axis.value
+    # 1. Load cube (memory-mapped FITS + header velocity axis, see cube_io.py)
+    cube = load_cube(fits_file)
+    vel = cube["vel"]
     
-    print(f"   Cube size: {cube.shape}")
+    print(f"   Cube size: {cube['data'].shape}")
     print(f"   Velocity range: {vel.min():.2f} - {vel.max():.2f} km/s")
     
     # 2. Calculate radial distances (spatial only)
-    wcs_spatial = cube.wcs.celestial
-    ny, nx = cube.shape[1], cube.shape[2]
-    y_idx, x_idx = np.indices((ny, nx))
-    
-    ra, dec = wcs_spatial.all_pix2world(x_idx, y_idx, 0)
-    coords = SkyCoord(ra*u.deg, dec*u.deg, frame="icrs")
-    r_ang = coords.separation(center)
-    r_pc = (r_ang.to(u.rad) * (distance * u.kpc)).to(u.pc).value
+    r_pc, _ = cached_radius_map(cube["data"].shape[1:], cube["wcs"], center, distance)
     
     print(f"   Radial range: {r_pc.min():.2f} - {r_pc.max():.2f} pc")
     
@@ -295,45 +247,29 @@ def fits_cube_to_rings(fits_file, center=G79_CENTER, distance=G79_DISTANCE,
     
     print(f"   Extracting {len(r_centers)} ring spectra...")
     
+    # Cube read once; all ring spectra from one sparse product (see ring_spectra.py)
+    res = ring_spectra(cube.pop("data"), ring_index(r_pc, r_edges),
+                       len(r_centers))
+    
+    # All ring spectra fitted together (batched Levenberg–Marquardt, see gauss_fit.py)
+    fit = fit_gaussians(vel, res["spectra"])
+    
     rows = []
     for ring_idx, (r_min, r_max) in enumerate(zip(r_edges[:-1], r_edges[1:])):
-        mask_2d = (r_pc >= r_min) & (r_pc < r_max)
-        
-        if np.any(mask_2d):
-            # Average spectrum in this ring
-            # Create 3D mask
-            mask_3d = np.broadcast_to(mask_2d[np.newaxis, :, :], cube.shape)
-            
-            # Get subcube
-            subcube_data = cube.filled_data[:].value
-            masked_data = np.where(mask_3d, subcube_data, np.nan)
-            
-            # Average over spatial dimensions
-            spectrum = np.nanmean(masked_data, axis=(1, 2))
+        if res["n_pixels"][ring_idx] > 0:
+            spectrum = res["spectra"][ring_idx]
             
             if not np.all(np.isnan(spectrum)):
-                # Fit Gaussian to find centroid velocity
-                try:
-                    # Simple 1-Gaussian fit
-                    g_init = models.Gaussian1D(
-                        amplitude=np.nanmax(spectrum),
-                        mean=vel[np.nanargmax(spectrum)],
-                        stddev=1.0
-                    )
-                    fit_g = fitting.LevMarLSQFitter()
-                    g = fit_g(g_init, vel, spectrum)
-                    
-                    v_cent = float(g.mean.value)
-                    v_width = float(abs(g.stddev.value))
-                    T_peak = float(np.nanmax(spectrum))
-                    
-                except:
-                    # Fallback: just use peak
+                # Gaussian centroid from the batched fit, else peak
+                if fit["fit_ok"][ring_idx]:
+                    v_cent = float(fit["centroid"][ring_idx])
+                    v_width = float(fit["width"][ring_idx])
+                else:
                     v_cent = float(vel[np.nanargmax(spectrum)])
                     v_width = np.nan
-                    T_peak = float(np.nanmax(spectrum))
+                T_peak = float(np.nanmax(spectrum))
                 
-                n_pixels = int(np.sum(mask_2d))
+                n_pixels = int(res["n_pixels"][ring_idx])
                 
                 rows.append({
                     "ring": ring_idx,
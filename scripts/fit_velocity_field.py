@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fit Velocity Field - Gaussian centroid per pixel, in parallel
+
+Fits one Gaussian to EVERY spectrum of a cube and writes velocity-field
+maps (v_cent, σ, T_peak) as FITS with the celestial WCS of the cube.
+
+How it scales:
+    - The cube is copied once into shared memory (float32); worker
+      processes attach to it by name, so nothing large is pickled.
+    - The spatial plane is split into row chunks; each chunk is fitted
+      with the batched Levenberg–Marquardt fitter (gauss_fit.py).
+    - Every finished chunk is saved to a checkpoint directory; a rerun
+      with the same inputs skips finished chunks (resume after a crash
+      or a killed job).
+
+Usage:
+    python fit_velocity_field.py G79_iram_co21_cube.fits
+    python fit_velocity_field.py G79_iram_co21_cube.fits --workers 8 --vel-range=-10,10 --min-peak 0.5
+
+    # Per-pixel S/N cut with the rms map of baseline.py
+    python baseline.py G79_iram_co21_cube.fits --line-window=-10,10
+    python fit_velocity_field.py G79_iram_co21_cube_blsub.fits \
+        --rms-map G79_iram_co21_cube_rms.fits --min-snr 5
+
+    # Resume an interrupted run (same command; finished chunks are skipped)
+    python fit_velocity_field.py G79_iram_co21_cube.fits --workers 8 --vel-range=-10,10 --min-peak 0.5
+
+Output (prefix = cube name without .fits):
+    <prefix>_vcent.fits   - Centroid velocity [km/s] (+ ERR extension)
+    <prefix>_sigma.fits   - Gaussian σ [km/s] (+ ERR extension)
+    <prefix>_tpeak.fits   - Fitted amplitude (+ ERR extension)
+    <prefix>_fitok.fits   - 1 = fit converged, 0 = failed / skipped
+
+© 2025 Carmen N. Wrede, Lino P. Casu
+Licensed under ANTI-CAPITALIST SOFTWARE LICENSE v1.4
+"""
+import sys
+import os
+import json
+import time
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+# UTF-8 for Windows
+os.environ['PYTHONIOENCODING'] = 'utf-8:replace'
+if sys.platform == 'win32':
+    try:
+        sys.stdout.reconfigure(encoding='utf-8', errors='replace')
+    except:
+        pass
+
+try:
+    import numpy as np
+    from astropy.io import fits
+except ImportError as e:
+    print(f"ERROR: Required packages missing: {e}")
+    print("\nInstall with:")
+    print("  pip install astropy numpy")
+    sys.exit(1)
+
+from cube_io import (cube_header, spectral_axis_kms, iter_channel_slabs,
+                     channel_window, parse_vel_range)
+from gauss_fit import fit_gaussians
+
+# Spectra per chunk (one unit of work and one checkpoint file)
+CHUNK_SPECTRA = 4096
+
+# Worker state (set once per process by _init_worker)
+_cube = None
+_vel = None
+_shm = None
+
+def _init_worker(shm_name, shape, vel):
+    """Attach a worker process to the shared cube"""
+    global _cube, _vel, _shm
+    # Workers share the parent's resource tracker, so attaching does not
+    # hand ownership over: the parent alone unlinks the block
+    _shm = shared_memory.SharedMemory(name=shm_name)
+    _cube = np.ndarray(shape, dtype=np.float32, buffer=_shm.buf)
+    _vel = vel
+
+def _fit_rows(y0, y1, min_peak=None):
+    """
+    Fit all spectra of image rows y0:y1 of the shared cube
+
+    min_peak: scalar or (y1-y0, nx) per-pixel threshold
+
+    Returns:
+        y0, y1, dict of (y1-y0, nx) maps
+    """
+    n_chan, _, nx = _cube.shape
+    spectra = np.asarray(_cube[:, y0:y1, :], dtype=float).reshape(n_chan, -1).T
+
+    n = len(spectra)
+    out = {key: np.full(n, np.nan) for key in
+           ("centroid", "centroid_err", "width", "width_err", "amplitude", "amplitude_err")}
+    out["fit_ok"] = np.zeros(n, dtype=bool)
+
+    with np.errstate(invalid='ignore'):
+        peak = np.nanmax(np.where(np.isfinite(spectra), spectra, -np.inf), axis=1)
+    todo = np.isfinite(peak)
+    if min_peak is not None:
+        todo &= peak >= np.ravel(min_peak)
+
+    if todo.any():
+        fit = fit_gaussians(_vel, spectra[todo])
+        for key in out:
+            out[key][todo] = fit[key]
+
+    return y0, y1, {key: val.reshape(y1 - y0, nx) for key, val in out.items()}
+
+def load_shared_cube(fits_file, chan_range, slab_chans=64):
+    """
+    Copy channels chan_range of a cube into a new shared-memory block
+
+    Returns:
+        shm (SharedMemory, caller must close + unlink), cube view
+    """
+    header, shape, _ = cube_header(fits_file)
+    c0, c1 = chan_range
+    sub_shape = (c1 - c0,) + tuple(shape[1:])
+
+    nbytes = int(np.prod(sub_shape)) * np.dtype(np.float32).itemsize
+    shm = shared_memory.SharedMemory(create=True, size=nbytes)
+    cube = np.ndarray(sub_shape, dtype=np.float32, buffer=shm.buf)
+
+    for s0, s1, slab in iter_channel_slabs(fits_file, slab_chans, chan_range=chan_range):
+        cube[s0 - c0:s1 - c0] = slab
+
+    return shm, cube
+
+def checkpoint_signature(fits_file, chan_range, rows, min_peak, rms_map=None, min_snr=None):
+    """Identifies the inputs a checkpoint directory belongs to"""
+    st = Path(fits_file).stat()
+    signature = {
+        "source": Path(fits_file).name,
+        "size": st.st_size,
+        "mtime": int(st.st_mtime),
+        "channels": list(chan_range),
+        "rows_per_chunk": rows,
+        "min_peak": min_peak,
+    }
+    if rms_map is not None and min_snr is not None:
+        rst = Path(rms_map).stat()
+        signature["rms_map"] = [Path(rms_map).name, rst.st_size, int(rst.st_mtime)]
+        signature["min_snr"] = min_snr
+    return signature
+
+# Files a checkpoint directory holds (nothing else is ever deleted)
+CHECKPOINT_FILES = ("rows_*.npz", "rows_*.npz.tmp", "meta.json")
+
+def open_checkpoint(path, signature):
+    """
+    Prepare the checkpoint directory; stale chunks (other inputs) are removed
+
+    The directory must be new, empty or an earlier checkpoint (meta.json).
+
+    Returns:
+        set of finished (y0, y1) chunks
+
+    Raises:
+        ValueError: Directory holds other files but no meta.json
+    """
+    meta = path / "meta.json"
+    if path.is_dir() and not meta.exists() and any(path.iterdir()):
+        raise ValueError(f"Checkpoint directory {path} is not empty and holds no "
+                         f"checkpoint (meta.json); use a new or empty directory")
+    path.mkdir(parents=True, exist_ok=True)
+
+    for f in path.glob("rows_*.npz.tmp"):
+        f.unlink()
+    if meta.exists():
+        try:
+            same = json.loads(meta.read_text()) == signature
+        except ValueError:
+            same = False
+        if not same:
+            print("   Checkpoint belongs to other inputs - starting over")
+            for f in path.glob("rows_*.npz"):
+                f.unlink()
+
+    meta.write_text(json.dumps(signature, indent=1))
+
+    done = set()
+    for f in path.glob("rows_*.npz"):
+        _, y0, y1 = f.stem.split("_")
+        done.add((int(y0), int(y1)))
+
+    return done
+
+def remove_checkpoint(path):
+    """Delete the checkpoint files; the directory only if nothing else is in it"""
+    for pattern in CHECKPOINT_FILES:
+        for f in path.glob(pattern):
+            f.unlink()
+    if path.is_dir() and not any(path.iterdir()):
+        path.rmdir()
+
+def save_chunk(path, y0, y1, maps):
+    """Save one finished chunk (atomic rename)"""
+    final = path / f"rows_{y0:06d}_{y1:06d}.npz"
+    tmp = path / (final.name + ".tmp")
+    with open(tmp, 'wb') as f:
+        np.savez(f, **maps)
+    os.replace(tmp, final)
+
+def fit_velocity_field(fits_file, workers=None, vel_window=None, min_peak=None,
+                       checkpoint_dir=None, rows_per_chunk=None, rms_map=None, min_snr=None):
+    """
+    Gaussian fit of every spectrum, parallel over row chunks
+
+    Args:
+        fits_file: Path to FITS cube
+        workers: Worker processes [default: os.cpu_count()]
+        vel_window: Optional (v_min, v_max) [km/s] fit window
+        min_peak: Skip spectra whose peak is below this value
+        checkpoint_dir: Directory for finished chunks [default:
+            <cube>.vfit/ next to the cube]
+        rows_per_chunk: Image rows per chunk [default: ~CHUNK_SPECTRA spectra]
+        rms_map: rms map FITS (baseline.py, <cube>_rms.fits)
+        min_snr: With rms_map: skip spectra whose peak is below min_snr × rms
+
+    Returns:
+        dict of 2D maps (centroid, centroid_err, width, width_err,
+        amplitude, amplitude_err, fit_ok), header of the cube
+    """
+    header, shape, _ = cube_header(fits_file)
+    n_chan, ny, nx = shape
+    vel = spectral_axis_kms(header, n_chan, strict=vel_window is not None)
+    c0, c1 = channel_window(vel, vel_window)
+
+    rows = rows_per_chunk or max(1, CHUNK_SPECTRA // nx)
+    chunks = [(y, min(y + rows, ny)) for y in range(0, ny, rows)]
+
+    checkpoint = Path(checkpoint_dir or str(fits_file) + ".vfit")
+    signature = checkpoint_signature(fits_file, (c0, c1), rows, min_peak, rms_map, min_snr)
+    done = open_checkpoint(checkpoint, signature)
+    todo = [c for c in chunks if c not in done]
+
+    print(f"   Cube: {shape}, fit channels {c0}-{c1-1} "
+          f"({vel[c0]:.2f} to {vel[c1-1]:.2f} km/s)")
+    print(f"   Chunks: {len(chunks)} × {rows} rows, {len(done & set(chunks))} already done "
+          f"(checkpoint: {checkpoint})")
+
+    if todo:
+        workers = workers or os.cpu_count() or 1
+        threshold = min_peak
+        if rms_map is not None and min_snr is not None:
+            rms = fits.getdata(rms_map).astype(float)
+            if rms.shape != (ny, nx):
+                raise ValueError(f"rms map {rms.shape} does not match the cube plane {(ny, nx)}")
+            # NaN rms (blank pixel) → NaN threshold → spectrum skipped
+            threshold = min_snr * rms
+            if min_peak is not None:
+                threshold = np.maximum(threshold, min_peak)
+
+        shm, _ = load_shared_cube(fits_file, (c0, c1))
+        print(f"   Shared cube: {shm.size/1024**2:.0f} MB, {workers} worker(s)")
+
+        t0 = time.perf_counter()
+        n_done = 0
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker,
+                initargs=(shm.name, (c1 - c0, ny, nx), vel[c0:c1])
+            ) as pool:
+                futures = [pool.submit(_fit_rows, y0, y1,
+                                       threshold[y0:y1] if np.ndim(threshold) else threshold)
+                           for y0, y1 in todo]
+                for future in as_completed(futures):
+                    y0, y1, maps = future.result()
+                    save_chunk(checkpoint, y0, y1, maps)
+                    n_done += (y1 - y0) * nx
+                    dt = time.perf_counter() - t0
+                    print(f"   Rows {y0}-{y1-1} done ({n_done/dt:.0f} spectra/s)")
+        finally:
+            shm.close()
+            shm.unlink()
+
+    # Assemble maps from all chunk files
+    maps = None
+    for y0, y1 in chunks:
+        with np.load(checkpoint / f"rows_{y0:06d}_{y1:06d}.npz") as z:
+            if maps is None:
+                maps = {key: np.empty((ny, nx), dtype=z[key].dtype) for key in z.files}
+            for key in z.files:
+                maps[key][y0:y1] = z[key]
+
+    return maps, header
+
+def write_maps(maps, header, prefix):
+    """
+    Write v_cent / σ / T_peak maps (+ ERR extensions) and the fit_ok mask
+
+    Failed fits are NaN in the maps. The header carries the celestial WCS
+    of the cube.
+
+    Returns:
+        List of written files
+    """
+    from astropy.wcs import WCS
+
+    wcs_header = WCS(header).celestial.to_header()
+    ok = maps["fit_ok"]
+    unit = header.get('BUNIT', '')
+
+    written = []
+    for suffix, key, bunit, label in (
+        ("vcent", "centroid", "km/s", "Gaussian centroid velocity"),
+        ("sigma", "width", "km/s", "Gaussian sigma"),
+        ("tpeak", "amplitude", unit, "Gaussian amplitude"),
+    ):
+        hdr = wcs_header.copy()
+        hdr['BUNIT'] = bunit
+        hdr['BTYPE'] = key
+        hdr['COMMENT'] = f"{label} per pixel (fit_velocity_field.py)"
+
+        value = np.where(ok, maps[key], np.nan).astype(np.float32)
+        error = np.where(ok, maps[key + "_err"], np.nan).astype(np.float32)
+
+        path = f"{prefix}_{suffix}.fits"
+        fits.HDUList([
+            fits.PrimaryHDU(value, header=hdr),
+            fits.ImageHDU(error, header=wcs_header, name='ERR'),
+        ]).writeto(path, overwrite=True)
+        written.append(path)
+
+    path = f"{prefix}_fitok.fits"
+    fits.PrimaryHDU(ok.astype(np.uint8), header=wcs_header).writeto(path, overwrite=True)
+    written.append(path)
+
+    return written
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(
+        description='Fit a Gaussian to every pixel of a cube (velocity-field maps)'
+    )
+    parser.add_argument(
+        'fits_file',
+        help='Input FITS cube'
+    )
+    parser.add_argument(
+        '--output-prefix',
+        help='Prefix for the output maps [default: cube name without .fits]'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        help='Worker processes [default: all CPUs]'
+    )
+    parser.add_argument(
+        '--vel-range', '--vel-window',
+        dest='vel_window',
+        help='Fit window "VMIN,VMAX" [km/s]; only these channels are read '
+             '(use --vel-range=-10,10 for negative values)'
+    )
+    parser.add_argument(
+        '--min-peak',
+        type=float,
+        help='Skip spectra whose peak is below this value (e.g. 3× rms)'
+    )
+    parser.add_argument(
+        '--rms-map',
+        help='rms map from baseline.py (<cube>_rms.fits) for --min-snr'
+    )
+    parser.add_argument(
+        '--min-snr',
+        type=float,
+        help='With --rms-map: skip spectra whose peak is below MIN_SNR × rms of that pixel'
+    )
+    parser.add_argument(
+        '--rows-per-chunk',
+        type=int,
+        help=f'Image rows per chunk [default: ~{CHUNK_SPECTRA} spectra]'
+    )
+    parser.add_argument(
+        '--checkpoint-dir',
+        help='Directory for finished chunks [default: <cube>.fits.vfit]'
+    )
+    parser.add_argument(
+        '--keep-checkpoint',
+        action='store_true',
+        help='Keep the checkpoint directory after the maps are written'
+    )
+
+    args = parser.parse_args()
+
+    print("="*80)
+    print("PER-PIXEL VELOCITY FIELD - G79.29+0.46")
+    print("="*80)
+
+    fits_path = Path(args.fits_file)
+    if not fits_path.exists():
+        print(f"\nERROR: File not found: {fits_path}")
+        return 1
+
+    try:
+        vel_window = parse_vel_range(args.vel_window)
+    except ValueError as e:
+        print(f"\nERROR: {e}")
+        return 1
+    if (args.rms_map is None) != (args.min_snr is None):
+        print("\nERROR: --rms-map and --min-snr go together")
+        return 1
+
+    prefix = args.output_prefix or str(fits_path.with_suffix(''))
+
+    print(f"\nInput: {fits_path}")
+    print(f"\n[1/2] Fitting spectra...")
+
+    try:
+        maps, header = fit_velocity_field(
+            str(fits_path), workers=args.workers, vel_window=vel_window,
+            min_peak=args.min_peak, checkpoint_dir=args.checkpoint_dir,
+            rows_per_chunk=args.rows_per_chunk, rms_map=args.rms_map, min_snr=args.min_snr
+        )
+    except ValueError as e:
+        print(f"\nERROR: {e}")
+        return 1
+
+    ok = maps["fit_ok"]
+    print(f"\n   Successful fits: {ok.sum()}/{ok.size} pixels")
+    if ok.any():
+        print(f"   v_cent range: {np.nanmin(maps['centroid'][ok]):.2f} - "
+              f"{np.nanmax(maps['centroid'][ok]):.2f} km/s")
+
+    print(f"\n[2/2] Writing maps...")
+    for path in write_maps(maps, header, prefix):
+        print(f"   Saved: {path}")
+
+    if not args.keep_checkpoint:
+        remove_checkpoint(Path(args.checkpoint_dir or str(fits_path) + ".vfit"))
+
+    print("\n" + "="*80)
+    print("DONE!")
+    print("="*80)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
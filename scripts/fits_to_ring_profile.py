@@ -10,8 +10,30 @@ Usage:
     # 2D image (e.g., AKARI, Herschel continuum)
     python fits_to_ring_profile.py G79_akari_90um.fits --output G79_akari_rings.csv
     
+    # Re-bin instantly with any ring edges (index saved next to the FITS file)
+    python fits_to_ring_profile.py G79_akari_90um.fits --index --edges 0,0.1,0.3,0.7,1.5
+    
+    # Mosaic larger than RAM (memory-mapped, row tiles)
+    python fits_to_ring_profile.py CygnusX_mosaic.fits --stream --tile-rows 512
+    
+    # Several co-registered bands in one pass (one wide CSV)
+    python fits_to_ring_profile.py akari_65.fits akari_90.fits akari_140.fits akari_160.fits \
+        --band-names flux65,flux90,flux140,flux160 --output G79_akari_multiband_rings.csv
+    
+    # Beam-aware block-bootstrap errors (I_sem_boot), 1000 resamples
+    python fits_to_ring_profile.py G79_akari_90um.fits --bootstrap 1000 --block-size beam
+    
+    # Sector × radius profile (8 sectors of 45°) + (angle, radius) FITS image
+    python fits_to_ring_profile.py G79_akari_90um.fits --sectors 8 --output G79_akari_polar.csv
+    
     # 3D cube (e.g., CO, [CII])
     python fits_to_ring_profile.py G79_co32_cube.fits --cube --output G79_co_rings.csv
+    
+    # 3D cube larger than RAM (memory-mapped, 64-channel slabs)
+    python fits_to_ring_profile.py G79_iram_co21_cube.fits --cube --stream --slab-chans 64
+    
+    # Only read the channels between -10 and +10 km/s of a wide-band cube
+    python fits_to_ring_profile.py G79_iram_co21_cube.fits --cube --stream --vel-range=-10,10
 
 © 2025 Carmen N. Wrede, Lino P. Casu
 Licensed under ANTI-CAPITALIST SOFTWARE LICENSE v1.4
@@ -44,10 +66,26 @@ except ImportError as e:
     print("  pip install astropy pandas numpy")
     sys.exit(1)
 
+from radius_map import cached_radius_map
+from radius_map import radius_map_rows, pixel_geometry, cache_key, polar_map
+from radial_index import load_or_build as load_or_build_index, index_path
+from ring_spectra import ring_spectra, ring_spectra_stream
+from cube_io import (cube_header, spectral_axis_kms, load_cube, channel_window,
+                     velocity_channel_range, parse_vel_range)
+from gauss_fit import fit_gaussians
+from ring_stats import (ring_statistics, ring_statistics_overlap, ring_index,
+                        annulus_overlap, multiband_ring_statistics,
+                        polar_statistics, polar_image, bootstrap_sem,
+                        RingAccumulator, RingQuantileSketch)
+
 # G79.29+0.46 center (CORRECT coordinates!)
 G79_CENTER = SkyCoord("20h31m41s", "+40d21m07s", frame="icrs")
 G79_DISTANCE = 1.7 * u.kpc
 
+# Sub-pixel overlap needs (nearly) square, orthogonal pixels
+MAX_PIXEL_ASPECT_DEV = 0.01
+MAX_PIXEL_SKEW_DEG = 0.5
+
 def load_fits_2d(fits_file):
     """
     Load 2D FITS image
@@ -66,7 +104,8 @@ def load_fits_2d(fits_file):
     
     return data, wcs, header
 
-def calculate_radial_distance(data, wcs, center_coord, distance):
+def calculate_radial_distance(data, wcs, center_coord, distance, method="auto",
+                              use_cache=True):
     """
     Calculate radial distance from center for each pixel
     
@@ -75,33 +114,60 @@ def calculate_radial_distance(data, wcs, center_coord, distance):
         wcs: WCS object
         center_coord: SkyCoord of center
         distance: Distance to source (with units)
+        method: "auto", "fast" (pixel space) or "exact" (SkyCoord)
+        use_cache: Load/store the radius map in the on-disk cache
     
     Returns:
         r_pc: Radial distance in parsecs for each pixel
     """
     print("\n[2/5] Calculating radial distances...")
     
-    # Get pixel coordinates
-    ny, nx = data.shape
-    y_idx, x_idx = np.indices(data.shape)
+    r_pc, info = cached_radius_map(data.shape, wcs, center_coord, distance,
+                                   method=method, use_cache=use_cache)
     
-    # Convert to world coordinates
-    ra, dec = wcs.all_pix2world(x_idx, y_idx, 0)
-    coords = SkyCoord(ra*u.deg, dec*u.deg, frame="icrs")
+    print(f"   Center: {center_coord.to_string('hmsdms')}")
+    print(f"   Distance: {distance}")
+    print(f"   Method: {info['method']} (max deviation from SkyCoord: {info['max_dev_pc']:.2e} pc)")
+    print(f"   Cache: {'hit' if info['cached'] else 'miss'}")
+    print(f"   Radial range: {np.nanmin(r_pc):.3f} - {np.nanmax(r_pc):.3f} pc")
     
-    # Calculate angular separation from center
-    r_ang = coords.separation(center_coord)
+    return r_pc
+
+def beam_block_size(header, wcs):
+    """
+    Block size [pixels] for the block bootstrap: one beam FWHM (BMAJ)
     
-    # Convert to physical distance
-    r_pc = (r_ang.to(u.rad) * distance).to(u.pc)
+    Returns 1 (plain pixel bootstrap) if the header has no beam.
+    """
+    if 'BMAJ' not in header:
+        return 1
+    pix_deg = np.sqrt(np.abs(np.prod(wcs.celestial.proj_plane_pixel_scales()))).to_value(u.deg)
+    return max(int(np.ceil(float(header['BMAJ']) / pix_deg)), 1)
+
+def add_bootstrap_errors(df, data, idx, n_rings, n_boot, block_size, seed=None,
+                         pix=None, weights=None):
+    """
+    Add I_sem_boot (block-bootstrap error of I_mean) after I_sem
     
-    print(f"   Center: {center_coord.to_string('hmsdms')}")
-    print(f"   Distance: {distance}")
-    print(f"   Radial range: {np.nanmin(r_pc):.3f} - {np.nanmax(r_pc):.3f}")
+    See ring_stats.ring_bootstrap: all rings and resamples are drawn in
+    one vectorized reduction over the ring index computed once.
+    """
+    print(f"\n   Bootstrap: {n_boot} resamples, blocks of {block_size}×{block_size} pixels")
+    
+    sem = bootstrap_sem(data, idx, n_rings, n_boot=n_boot, block_size=block_size,
+                        pix=pix, weights=weights, seed=seed)
+    df.insert(df.columns.get_loc("I_sem") + 1, "I_sem_boot", sem[df["ring"].values])
     
-    return r_pc.value
+    for row in df.itertuples():
+        if row.n_pixels > 0:
+            print(f"   Ring {row.ring}: I_sem={row.I_sem:.3e}, "
+                  f"I_sem_boot={row.I_sem_boot:.3e} "
+                  f"({row.I_sem_boot/row.I_sem if row.I_sem > 0 else np.nan:.1f}×)")
+    
+    return df
 
-def create_ring_profile_2d(data, r_pc, r_edges):
+def create_ring_profile_2d(data, r_pc, r_edges, percentiles=(), n_boot=0,
+                           block_size=1, seed=None):
     """
     Create radial profile by averaging in rings
     
@@ -109,6 +175,10 @@ def create_ring_profile_2d(data, r_pc, r_edges):
         data: 2D intensity array
         r_pc: Radial distance for each pixel [pc]
         r_edges: Ring edges [pc]
+        percentiles: Extra percentiles, e.g. (16, 84) → I_p16, I_p84
+        n_boot: Bootstrap resamples for I_sem_boot (0 = none)
+        block_size: Bootstrap block size [pixels] (≈ beam; 1 = plain)
+        seed: Bootstrap random seed
     
     Returns:
         DataFrame with ring profile
@@ -117,61 +187,476 @@ def create_ring_profile_2d(data, r_pc, r_edges):
     print(f"   Ring edges: {r_edges[0]:.2f} - {r_edges[-1]:.2f} pc")
     print(f"   Number of rings: {len(r_edges)-1}")
     
-    rows = []
+    # All rings in one pass (see ring_stats.py)
+    df = ring_statistics(data, r_pc, r_edges, percentiles=percentiles,
+                         keep_empty=True)
+    
+    for row in df.itertuples():
+        if row.n_pixels > 0:
+            print(f"   Ring {row.ring}: r={row.radius_pc:.2f} pc, "
+                  f"I={row.I_mean:.3e} ± {row.I_sem:.3e}, n={row.n_pixels}")
+        else:
+            print(f"   Ring {row.ring}: r={row.radius_pc:.2f} pc - NO DATA")
+    
+    df = df[df["n_pixels"] > 0].reset_index(drop=True)
+    
+    if n_boot > 0:
+        df = add_bootstrap_errors(df, data, ring_index(r_pc, r_edges),
+                                  len(r_edges) - 1, n_boot, block_size, seed)
+    print(f"\n   Created profile with {len(df)} rings")
+    
+    return df
+
+def overlap_geometry(wcs, center_coord, distance):
+    """
+    Pixel geometry for sub-pixel overlap, or None if not suitable
+    
+    Overlap weights assume a linear WCS with square pixels around the
+    center; distortions or non-square pixels fall back to hard edges.
+    """
+    if wcs.celestial.has_distortion:
+        print("   WCS has distortion terms - falling back to hard ring edges")
+        return None
+    
+    geom = pixel_geometry(wcs, center_coord, distance)
+    
+    if (abs(geom['aspect'] - 1) > MAX_PIXEL_ASPECT_DEV
+            or abs(geom['skew_deg']) > MAX_PIXEL_SKEW_DEG):
+        print(f"   Pixels not square at center (aspect {geom['aspect']:.3f}, "
+              f"skew {geom['skew_deg']:.2f}°) - falling back to hard ring edges")
+        return None
+    
+    return geom
+
+def create_ring_profile_2d_overlap(data, wcs, r_edges, center_coord, distance,
+                                   percentiles=(), n_boot=0, block_size=1,
+                                   seed=None):
+    """
+    Create radial profile with exact sub-pixel annulus overlap weights
+    
+    Each pixel enters every ring with its fractional area in that ring
+    (see ring_stats.annulus_overlap), which removes the quantization noise
+    of the hard r_min <= r < r_max cut for rings only a few pixels wide.
+    
+    Args:
+        data: 2D intensity array
+        wcs: WCS object
+        r_edges: Ring edges [pc]
+        center_coord: SkyCoord of center
+        distance: Distance to source (with units)
+        percentiles: Extra percentiles, e.g. (16, 84)
+        n_boot: Bootstrap resamples for I_sem_boot (0 = none)
+        block_size: Bootstrap block size [pixels] (≈ beam; 1 = plain)
+        seed: Bootstrap random seed
+    
+    Returns:
+        DataFrame with ring profile, or None if the pixel geometry is not
+        suitable (distortions, non-square pixels)
+    """
+    print("\n[2-3/5] Creating ring profile (exact sub-pixel overlap)...")
+    
+    geom = overlap_geometry(wcs, center_coord, distance)
+    if geom is None:
+        return None
+    
+    print(f"   Center pixel: ({geom['x0']:.1f}, {geom['y0']:.1f})")
+    print(f"   Pixel size: {geom['pc_per_pix']:.4f} pc")
+    print(f"   Ring edges: {r_edges[0]:.2f} - {r_edges[-1]:.2f} pc")
+    print(f"   Number of rings: {len(r_edges)-1}")
+    
+    df = ring_statistics_overlap(
+        data, r_edges, geom['x0'], geom['y0'], geom['pc_per_pix'],
+        percentiles=percentiles, keep_empty=True
+    )
+    
+    for row in df.itertuples():
+        if row.n_pixels > 0:
+            print(f"   Ring {row.ring}: r={row.radius_pc:.2f} pc, "
+                  f"I={row.I_mean:.3e} ± {row.I_sem:.3e}, n={row.n_pixels}")
+        else:
+            print(f"   Ring {row.ring}: r={row.radius_pc:.2f} pc - NO DATA")
+    
+    df = df[df["n_pixels"] > 0].reset_index(drop=True)
+    
+    if n_boot > 0:
+        pix, ring, weight = annulus_overlap(
+            data.shape, geom['x0'], geom['y0'], geom['pc_per_pix'], r_edges
+        )
+        df = add_bootstrap_errors(df, data, ring, len(r_edges) - 1, n_boot,
+                                  block_size, seed, pix=pix, weights=weight)
+    
+    print(f"\n   Created profile with {len(df)} rings")
+    
+    return df
+
+def create_ring_profile_multiband(fits_files, band_names, r_edges, center_coord,
+                                  distance, percentiles=(), hard_edges=False,
+                                  method="auto", use_cache=True):
+    """
+    Ring profiles of N co-registered 2D images in one pass
+    
+    All images must share the pixel grid and celestial WCS (e.g. after
+    reprojection). The radius map / overlap weights and ring index are
+    computed once and all bands are reduced together as a (band, y, x)
+    stack (see ring_stats.multiband_ring_statistics).
     
-    for ring_idx, (r_min, r_max) in enumerate(zip(r_edges[:-1], r_edges[1:])):
-        # Mask for this ring
-        mask = (r_pc >= r_min) & (r_pc < r_max) & np.isfinite(data)
+    Args:
+        fits_files: List of FITS images (one per band)
+        band_names: Column prefix per band
+        r_edges: Ring edges [pc]
+        center_coord: SkyCoord of center
+        distance: Distance to source (with units)
+        percentiles: Extra percentiles → {band}_p16, ...
+        hard_edges: Whole pixels by center radius (no sub-pixel overlap)
+        method: Radius method ("auto", "fast", "exact")
+        use_cache: Use the on-disk radius-map cache
+    
+    Returns:
+        Wide DataFrame ({band}_mean/_median/_std/_err/_n), or None
+    """
+    images = []
+    wcs = None
+    
+    for fits_file, band in zip(fits_files, band_names):
+        print(f"\n   Band {band}:")
+        data, band_wcs, _ = load_fits_2d(fits_file)
         
-        if np.any(mask):
-            vals = data[mask]
-            n_pixels = len(vals)
-            
-            # Statistics
-            I_mean = np.nanmean(vals)
-            I_std = np.nanstd(vals)
-            I_median = np.nanmedian(vals)
-            I_min = np.nanmin(vals)
-            I_max = np.nanmax(vals)
-            
-            # Standard error of mean
-            I_sem = I_std / np.sqrt(n_pixels) if n_pixels > 1 else I_std
+        if wcs is None:
+            wcs = band_wcs.celestial
+        elif data.shape != images[0].shape:
+            print(f"   ERROR: {fits_file} has shape {data.shape}, "
+                  f"expected {images[0].shape} (reproject first)")
+            return None
+        elif not wcs.wcs.compare(band_wcs.celestial.wcs, tolerance=1e-8):
+            print(f"   ERROR: {fits_file} has a different WCS (reproject first)")
+            return None
+        
+        images.append(np.asarray(data, dtype=float))
+    
+    stack = np.stack(images)
+    del images
+    print(f"\n   Stack: {stack.shape} ({stack.nbytes/1024**2:.0f} MB)")
+    
+    geom = None
+    if not hard_edges and method != 'exact':
+        print("\n[2-3/5] Creating ring profiles (exact sub-pixel overlap)...")
+        geom = overlap_geometry(wcs, center_coord, distance)
+    
+    if geom is not None:
+        pix, ring, weight = annulus_overlap(
+            stack.shape[1:], geom['x0'], geom['y0'], geom['pc_per_pix'], r_edges
+        )
+        df = multiband_ring_statistics(
+            stack, r_edges, band_names, ring, pix=pix, weights=weight,
+            percentiles=percentiles
+        )
+    else:
+        r_pc = calculate_radial_distance(stack[0], wcs, center_coord, distance,
+                                         method, use_cache=use_cache)
+        print("\n[3/5] Creating ring profiles...")
+        df = multiband_ring_statistics(
+            stack, r_edges, band_names, ring_index(r_pc, r_edges),
+            percentiles=percentiles
+        )
+    
+    # Band names are file stems (not identifiers): index by column name
+    for row in df.to_dict("records"):
+        vals = ", ".join(f"{band}={row[f'{band}_mean']:.3e}" for band in band_names)
+        print(f"   Ring {row['ring']}: r={row['radius_pc']:.2f} pc, {vals}")
+    
+    print(f"\n   Created {len(band_names)}-band profile with {len(df)} rings")
+    
+    return df
+
+def create_ring_profile_2d_stream(fits_file, r_edges, center_coord, distance,
+                                  tile_rows=256, method="auto", percentiles=(),
+                                  rel_err=0.005):
+    """
+    Create radial profile from a 2D image in row tiles (streaming mode)
+    
+    The HDU is memory-mapped and processed tile_rows rows at a time; the
+    radius map is built per tile and the ring statistics are accumulated
+    incrementally (see ring_stats.RingAccumulator). Peak memory is set by
+    the tile size, not by the image size. Median and percentiles come from
+    a mergeable quantile sketch (ring_stats.RingQuantileSketch) with
+    relative error <= rel_err.
+    
+    Args:
+        fits_file: Path to FITS image
+        r_edges: Ring edges [pc]
+        center_coord: SkyCoord of center
+        distance: Distance to source (with units)
+        tile_rows: Number of image rows per tile
+        method: Radius method ("auto", "fast", "exact")
+        percentiles: Extra percentiles, e.g. (16, 84) → I_p16, I_p84
+        rel_err: Relative error bound of the quantile sketch
+    
+    Returns:
+        DataFrame with ring profile
+    """
+    print(f"\n[1/5] Memory-mapping 2D FITS: {fits_file}")
+    
+    with fits.open(fits_file, memmap=True, do_not_scale_image_data=True) as hdul:
+        hdu = hdul[0]
+        header = hdu.header
+        wcs = WCS(header).celestial
+        raw = hdu.data
+        
+        if raw is None or raw.ndim != 2:
+            print("   ERROR: Streaming mode needs a 2D image in the primary HDU")
+            return None
+        
+        bscale = header.get('BSCALE', 1.0)
+        bzero = header.get('BZERO', 0.0)
+        blank = header.get('BLANK') if raw.dtype.kind in 'iu' else None
+        
+        ny, nx = raw.shape
+        n_tiles = (ny + tile_rows - 1) // tile_rows
+        n_rings = len(r_edges) - 1
+        
+        print(f"   Shape: {raw.shape} ({raw.dtype}, {raw.nbytes/1024**2:.0f} MB on disk)")
+        print(f"\n[2-3/5] Streaming {n_tiles} tiles of {tile_rows} rows "
+              f"(~{tile_rows*nx*8*4/1024**2:.0f} MB peak per tile)...")
+        
+        acc = RingAccumulator(n_rings)
+        sketch = RingQuantileSketch(n_rings, rel_err=rel_err)
+        
+        for y_start in range(0, ny, tile_rows):
+            y_stop = min(y_start + tile_rows, ny)
             
-            rows.append({
-                "ring": ring_idx,
-                "radius_pc": float(0.5*(r_min + r_max)),
-                "r_inner_pc": float(r_min),
-                "r_outer_pc": float(r_max),
-                "I_mean": float(I_mean),
-                "I_std": float(I_std),
-                "I_sem": float(I_sem),
-                "I_median": float(I_median),
-                "I_min": float(I_min),
-                "I_max": float(I_max),
-                "n_pixels": int(n_pixels)
-            })
+            tile = np.array(raw[y_start:y_stop], dtype=float)
+            if blank is not None:
+                tile[raw[y_start:y_stop] == blank] = np.nan
+            tile = tile * bscale + bzero
             
-            print(f"   Ring {ring_idx}: r={0.5*(r_min+r_max):.2f} pc, "
-                  f"I={I_mean:.3e} ± {I_sem:.3e}, n={n_pixels}")
-        else:
-            print(f"   Ring {ring_idx}: r={0.5*(r_min+r_max):.2f} pc - NO DATA")
+            r_tile = radius_map_rows(raw.shape, wcs, center_coord, distance,
+                                     y_start, y_stop, method=method)
+            idx = ring_index(r_tile, r_edges)
+            acc.update(tile, idx)
+            sketch.update(tile, idx)
+    
+    quantiles = sketch.quantiles([0.5] + [p / 100.0 for p in percentiles])
+    df = acc.to_profile(
+        r_edges, median=quantiles[0],
+        percentiles=dict(zip(percentiles, quantiles[1:]))
+    )
+    print(f"   Median/percentiles: quantile sketch, relative error <= {rel_err:g}")
+    
+    for row in df.itertuples():
+        print(f"   Ring {row.ring}: r={row.radius_pc:.2f} pc, "
+              f"I={row.I_mean:.3e} ± {row.I_sem:.3e}, n={row.n_pixels}")
+    
+    print(f"\n   Created profile with {len(df)} rings")
+    
+    return df
+
+def create_ring_profile_polar(data, wcs, r_edges, center_coord, distance,
+                              n_sectors, pa_start=0.0, method="auto",
+                              percentiles=()):
+    """
+    Create sector × radius profile (n_sectors × n_rings)
+    
+    Radius and position angle come from the same pass over the pixel
+    grid (radius_map.polar_map) and all (ring, sector) cells are reduced
+    together, so this costs about as much as one azimuthal profile.
+    
+    Args:
+        data: 2D intensity array
+        wcs: WCS object
+        r_edges: Ring edges [pc]
+        center_coord: SkyCoord of center
+        distance: Distance to source (with units)
+        n_sectors: Number of azimuthal sectors
+        pa_start: Position angle where sector 0 starts [deg, east of north]
+        method: Radius method ("auto", "fast", "exact")
+        percentiles: Extra percentiles, e.g. (16, 84)
+    
+    Returns:
+        Tidy DataFrame with one row per (ring, sector)
+    """
+    print("\n[2/5] Calculating radius and position angle...")
+    
+    r_pc, pa_deg, info = polar_map(data.shape, wcs, center_coord, distance,
+                                   method=method)
+    
+    print(f"   Method: {info['method']} (max deviation from SkyCoord: {info['max_dev_pc']:.2e} pc)")
+    print(f"   Radial range: {np.nanmin(r_pc):.3f} - {np.nanmax(r_pc):.3f} pc")
+    
+    width = 360.0 / n_sectors
+    print(f"\n[3/5] Creating sector × ring profile...")
+    print(f"   Sectors: {n_sectors} × {width:g}° starting at PA {pa_start:g}°")
+    print(f"   Number of rings: {len(r_edges)-1}")
+    
+    df = polar_statistics(data, r_pc, pa_deg, r_edges, n_sectors,
+                          pa_start=pa_start, percentiles=percentiles)
+    
+    for ring, group in df.groupby("ring"):
+        vals = " ".join(f"{v:.2e}" for v in group["I_mean"])
+        print(f"   Ring {ring}: r={group['radius_pc'].iloc[0]:.2f} pc, I[sector]={vals}")
+    
+    print(f"\n   Created profile with {len(df)} (ring, sector) cells")
+    
+    return df
+
+def save_polar_image(df, r_edges, n_sectors, pa_start, output, source=""):
+    """
+    Save the (angle, radius) image of a sector × ring profile as FITS
+    
+    Primary HDU: I_mean, axis 1 = radius [pc], axis 2 = position angle
+    [deg]. Extensions: N_PIXELS (pixels per cell) and EDGES (ring edges,
+    needed when the rings are not evenly spaced).
+    """
+    n_rings = len(r_edges) - 1
+    width = 360.0 / n_sectors
+    
+    hdr = fits.Header()
+    hdr['CTYPE1'] = 'RADIUS'
+    hdr['CUNIT1'] = 'pc'
+    hdr['CRPIX1'] = 1.0
+    hdr['CRVAL1'] = 0.5 * (r_edges[0] + r_edges[1])
+    hdr['CDELT1'] = r_edges[1] - r_edges[0]
+    hdr['CTYPE2'] = 'PA'
+    hdr['CUNIT2'] = 'deg'
+    hdr['CRPIX2'] = 1.0
+    hdr['CRVAL2'] = (pa_start + 0.5 * width) % 360.0
+    hdr['CDELT2'] = width
+    hdr['BUNIT'] = 'I_mean'
+    hdr['NSECTORS'] = (n_sectors, 'Number of azimuthal sectors')
+    hdr['PASTART'] = (pa_start, 'PA where sector 0 starts [deg E of N]')
+    hdr['SOURCE'] = source
+    if not np.allclose(np.diff(r_edges), r_edges[1] - r_edges[0]):
+        hdr['COMMENT'] = 'Uneven ring edges: use EDGES table, not CDELT1'
+    
+    edges = fits.BinTableHDU.from_columns(
+        [fits.Column(name='r_edge_pc', format='D', array=np.asarray(r_edges, dtype=float))],
+        name='EDGES'
+    )
+    
+    fits.HDUList([
+        fits.PrimaryHDU(polar_image(df, n_rings, n_sectors, "I_mean"), header=hdr),
+        fits.ImageHDU(polar_image(df, n_rings, n_sectors, "n_pixels"), name='N_PIXELS'),
+        edges,
+    ]).writeto(output, overwrite=True)
+
+def create_ring_profile_2d_index(fits_file, r_edges, center_coord, distance,
+                                 method="auto", keep_values=False):
+    """
+    Create radial profile from a prefix-sum radial index
+    
+    The index (pixels sorted by radius + cumulative sums, see
+    radial_index.py) is loaded from next to the FITS file, or built and
+    saved on the first run. Any ring edges then cost O(rings · log N)
+    without touching the pixel data again.
+    
+    Args:
+        fits_file: Path to FITS image
+        r_edges: Ring edges [pc] (any spacing)
+        center_coord: SkyCoord of center
+        distance: Distance to source (with units)
+        method: Radius method ("auto", "fast", "exact")
+        keep_values: Store values in the index for exact median/min/max
+    
+    Returns:
+        DataFrame with ring profile
+    """
+    print(f"\n[1-2/5] Radial index: {index_path(fits_file)}")
+    
+    header = fits.getheader(fits_file)
+    wcs = WCS(header)
+    shape = (header['NAXIS2'], header['NAXIS1'])
+    key = cache_key(shape, wcs, center_coord, distance, method)
+    
+    def build_inputs():
+        data, wcs_full, _ = load_fits_2d(fits_file)
+        r_pc = calculate_radial_distance(data, wcs_full, center_coord, distance, method)
+        return data, r_pc
+    
+    index, built = load_or_build_index(fits_file, key, build_inputs,
+                                       keep_values=keep_values)
+    
+    print(f"   {'Built and saved' if built else 'Loaded'} index with {index.n_pixels} pixels")
+    print(f"\n[3/5] Querying {len(r_edges)-1} rings...")
+    
+    df = index.query(r_edges)
+    
+    for row in df.itertuples():
+        print(f"   Ring {row.ring}: r={row.r_inner_pc:.3f}-{row.r_outer_pc:.3f} pc, "
+              f"I={row.I_mean:.3e} ± {row.I_sem:.3e}, n={row.n_pixels}")
     
-    df = pd.DataFrame(rows)
     print(f"\n   Created profile with {len(df)} rings")
     
     return df
 
-def create_ring_profile_3d(cube_file, r_edges, center_coord, distance):
+def fit_ring_velocities(vel, spectra, n_pixels, r_edges):
+    """
+    Gaussian fit of every ring spectrum → velocity profile rows
+    
+    All rings are fitted together with the batched Levenberg–Marquardt
+    fitter (gauss_fit.py); failed fits fall back to the peak channel.
+    
+    Args:
+        vel: Velocity axis [km/s] (or channel numbers)
+        spectra: Ring spectra (n_rings, n_chan), see ring_spectra.py
+        n_pixels: Pixels per ring
+        r_edges: Ring edges [pc]
+    
+    Returns:
+        DataFrame (ring, radius_pc, v_obs_kms, v_err_kms, T_peak,
+        v_width_kms, n_pixels)
+    """
+    has = (np.asarray(n_pixels) > 0) & np.isfinite(spectra).any(axis=1)
+    fit = fit_gaussians(vel, spectra[has])
+    
+    rows = []
+    
+    for k, ring_idx in enumerate(np.flatnonzero(has)):
+        r_min, r_max = r_edges[ring_idx], r_edges[ring_idx + 1]
+        y = spectra[ring_idx]
+        
+        if fit["fit_ok"][k]:
+            v_cent = float(fit["centroid"][k])
+            v_err = float(fit["centroid_err"][k])
+            T_peak = float(fit["amplitude"][k])
+            v_width = float(fit["width"][k])
+        else:
+            v_cent = vel[np.nanargmax(y)]
+            v_err = np.nan
+            T_peak = np.nanmax(y)
+            v_width = np.nan
+        
+        rows.append({
+            "ring": int(ring_idx),
+            "radius_pc": float(0.5*(r_min + r_max)),
+            "v_obs_kms": v_cent,
+            "v_err_kms": v_err,
+            "T_peak": T_peak,
+            "v_width_kms": v_width,
+            "n_pixels": int(n_pixels[ring_idx])
+        })
+        
+        print(f"   Ring {ring_idx}: r={0.5*(r_min+r_max):.2f} pc, "
+              f"v={v_cent:.2f} km/s, T={T_peak:.3e}")
+    
+    return pd.DataFrame(rows)
+
+def create_ring_profile_3d(cube_file, r_edges, center_coord, distance,
+                           use_spectral_cube=False, vel_range=None):
     """
     Create ring profile from 3D spectral cube
     
-    This extracts both intensity and velocity information
+    This extracts both intensity and velocity information. The cube is
+    read from the memory-mapped FITS file with the velocity axis taken
+    from the header (cube_io.load_cube); spectral-cube is only used when
+    use_spectral_cube is set (compatibility path).
     
     Args:
         cube_file: Path to FITS cube
         r_edges: Ring edges [pc]
         center_coord: SkyCoord of center
         distance: Distance to source
+        use_spectral_cube: Read the cube with SpectralCube instead
+        vel_range: Optional (v_min, v_max) [km/s]; only these channels
+            are read
     
     Returns:
         DataFrame with ring profile including velocities
@@ -179,80 +664,80 @@ def create_ring_profile_3d(cube_file, r_edges, center_coord, distance):
     print("\n[CUBE MODE] Loading 3D spectral cube...")
     
     try:
-        from spectral_cube import SpectralCube
-        from astropy.modeling import models, fitting
+        chan_range = velocity_channel_range(fits.getheader(cube_file), vel_range)
+        cube = load_cube(cube_file, chan_range=chan_range,
+                         use_spectral_cube=use_spectral_cube)
     except ImportError:
         print("ERROR: spectral-cube not installed!")
-        print("Install with: pip install spectral-cube")
+        print("Install with: pip install spectral-cube (or drop --spectral-cube)")
         return None
     
-    # Load cube
-    cube = SpectralCube.read(cube_file)
-    
-    # Convert to km/s if possible
-    try:
-        cube = cube.with_spectral_unit(u.km/u.s)
-        vel = cube.spectral_axis.value
-        print(f"   Velocity range: {vel[0]:.1f} - {vel[-1]:.1f} km/s")
-    except:
-        vel = np.arange(cube.shape[0])
-        print("   WARNING: Could not convert to km/s, using channel numbers")
+    vel = cube["vel"]
+    print(f"   Velocity range: {vel[0]:.1f} - {vel[-1]:.1f} km/s")
     
     # Calculate radial distances for spatial plane
-    wcs_spatial = cube.wcs.celestial
-    ny, nx = cube.shape[1:]
-    y_idx, x_idx = np.indices((ny, nx))
+    r_pc, _ = cached_radius_map(cube["data"].shape[1:], cube["wcs"], center_coord, distance)
+    
+    print(f"   Spatial range: {np.nanmin(r_pc):.3f} - {np.nanmax(r_pc):.3f} pc")
+    
+    # Extract ring profiles: all ring spectra from one sparse product
+    # (see ring_spectra.py)
+    res = ring_spectra(cube["data"], ring_index(r_pc, r_edges), len(r_edges) - 1)
+    del cube
+    
+    return fit_ring_velocities(vel, res["spectra"], res["n_pixels"], r_edges)
+
+def create_ring_profile_3d_stream(cube_file, r_edges, center_coord, distance,
+                                  slab_chans=64, method="auto", use_cache=True,
+                                  vel_range=None):
+    """
+    Create ring profile from a 3D cube larger than RAM (channel slabs)
+    
+    The cube is memory-mapped and read slab_chans channels at a time;
+    each slab is reduced into the per-ring spectra right away (see
+    ring_spectra.ring_spectra_stream). Peak memory is set by the slab
+    size. Velocities come from the header spectral WCS (cube_io.py), so
+    spectral-cube is not needed.
+    
+    Args:
+        cube_file: Path to FITS cube
+        r_edges: Ring edges [pc]
+        center_coord: SkyCoord of center
+        distance: Distance to source
+        slab_chans: Channels per slab
+        method: Radius method ("auto", "fast", "exact")
+        use_cache: Use the on-disk radius-map cache
+        vel_range: Optional (v_min, v_max) [km/s]; only these channels
+            are read
+    
+    Returns:
+        DataFrame with ring profile including velocities
+    """
+    print(f"\n[CUBE MODE] Memory-mapping 3D cube: {cube_file}")
     
-    ra, dec = wcs_spatial.all_pix2world(x_idx, y_idx, 0)
-    coords = SkyCoord(ra*u.deg, dec*u.deg, frame="icrs")
-    r_ang = coords.separation(center_coord)
-    r_pc = (r_ang.to(u.rad) * distance).to(u.pc).value
+    header, shape, wcs = cube_header(cube_file)
+    vel = spectral_axis_kms(header, shape[0], strict=vel_range is not None)
+    c0, c1 = channel_window(vel, vel_range)
+    vel = vel[c0:c1]
+    
+    print(f"   Cube size: {shape}, reading channels {c0}-{c1-1}")
+    print(f"   Velocity range: {vel[0]:.1f} - {vel[-1]:.1f} km/s")
+    print(f"   Slab: {slab_chans} channels "
+          f"(~{min(slab_chans, c1-c0)*shape[1]*shape[2]*8*3/1024**2:.0f} MB peak)")
+    
+    r_pc, _ = cached_radius_map(shape[1:], wcs.celestial, center_coord, distance,
+                                method=method, use_cache=use_cache)
     
     print(f"   Spatial range: {np.nanmin(r_pc):.3f} - {np.nanmax(r_pc):.3f} pc")
     
-    # Extract ring profiles
-    rows = []
+    res = ring_spectra_stream(cube_file, ring_index(r_pc, r_edges),
+                              len(r_edges) - 1, slab_chans=slab_chans,
+                              chan_range=(c0, c1))
     
-    for ring_idx, (r_min, r_max) in enumerate(zip(r_edges[:-1], r_edges[1:])):
-        mask = (r_pc >= r_min) & (r_pc < r_max)
-        
-        if np.any(mask):
-            # Average spectrum in this ring
-            subcube = cube[:, mask]
-            spectrum = subcube.mean(axis=(1,))
-            y = spectrum.value
-            
-            # Simple Gaussian fit to get velocity
-            try:
-                g_init = models.Gaussian1D(
-                    amplitude=np.nanmax(y),
-                    mean=vel[np.nanargmax(y)],
-                    stddev=1.0
-                )
-                fit_g = fitting.LevMarLSQFitter()
-                g = fit_g(g_init, vel, y)
-                
-                v_cent = float(g.mean.value)
-                T_peak = float(g.amplitude.value)
-                v_width = float(abs(g.stddev.value))
-            except:
-                v_cent = vel[np.nanargmax(y)]
-                T_peak = np.nanmax(y)
-                v_width = np.nan
-            
-            rows.append({
-                "ring": ring_idx,
-                "radius_pc": float(0.5*(r_min + r_max)),
-                "v_obs_kms": v_cent,
-                "T_peak": T_peak,
-                "v_width_kms": v_width,
-                "n_pixels": int(np.sum(mask))
-            })
-            
-            print(f"   Ring {ring_idx}: r={0.5*(r_min+r_max):.2f} pc, "
-                  f"v={v_cent:.2f} km/s, T={T_peak:.3e}")
+    print(f"   Throughput: {res['chan_per_s']:.1f} channels/s "
+          f"({c1-c0} channels in {res['seconds']:.2f} s)")
     
-    return pd.DataFrame(rows)
+    return fit_ring_velocities(vel, res["spectra"], res["n_pixels"], r_edges)
 
 def main():
     """Main function"""
@@ -261,7 +746,12 @@ def main():
     )
     parser.add_argument(
         'fits_file',
-        help='Input FITS file (2D image or 3D cube)'
+        nargs='+',
+        help='Input FITS file (2D image or 3D cube); several co-registered 2D images = multi-band mode'
+    )
+    parser.add_argument(
+        '--band-names',
+        help='Comma-separated column prefixes for multi-band mode [default: file names]'
     )
     parser.add_argument(
         '--output',
@@ -273,6 +763,90 @@ def main():
         action='store_true',
         help='Process as 3D spectral cube (not 2D image)'
     )
+    parser.add_argument(
+        '--hard-edges',
+        action='store_true',
+        help='Assign whole pixels by center radius instead of exact sub-pixel overlap'
+    )
+    parser.add_argument(
+        '--index',
+        action='store_true',
+        help='Use (or build) a prefix-sum radial index next to the FITS file for instant re-binning'
+    )
+    parser.add_argument(
+        '--index-values',
+        action='store_true',
+        help='Store pixel values in the index for exact median/min/max (larger index)'
+    )
+    parser.add_argument(
+        '--bootstrap',
+        type=int,
+        default=0,
+        metavar='N',
+        help='Add I_sem_boot from N (block-)bootstrap resamples [default: 0 = off]'
+    )
+    parser.add_argument(
+        '--block-size',
+        default='beam',
+        help='Bootstrap block size in pixels, or "beam" (BMAJ from header; 1 if absent) [default: beam]'
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        help='Random seed for --bootstrap'
+    )
+    parser.add_argument(
+        '--sectors',
+        type=int,
+        help='Polar mode: split every ring into N azimuthal sectors (tidy CSV + FITS image)'
+    )
+    parser.add_argument(
+        '--sector-start',
+        type=float,
+        default=0.0,
+        help='Position angle where sector 0 starts [deg east of north, default: 0]'
+    )
+    parser.add_argument(
+        '--polar-image',
+        help='(angle, radius) FITS image for polar mode [default: <output>_polar.fits]'
+    )
+    parser.add_argument(
+        '--vel-range',
+        help='--cube: only read channels in "VMIN,VMAX" [km/s] (use --vel-range=-10,10 for negative values)'
+    )
+    parser.add_argument(
+        '--spectral-cube',
+        action='store_true',
+        help='Read --cube input with spectral-cube (compatibility path; default: header/memmap reader)'
+    )
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help='Memory-map the input and process it in row tiles (2D) or channel slabs (--cube), for data larger than RAM'
+    )
+    parser.add_argument(
+        '--tile-rows',
+        type=int,
+        default=256,
+        help='Rows per tile in --stream mode [default: 256]'
+    )
+    parser.add_argument(
+        '--slab-chans',
+        type=int,
+        default=64,
+        help='Channels per slab in cube streaming mode (--cube --stream) [default: 64]'
+    )
+    parser.add_argument(
+        '--percentiles',
+        default='16,84',
+        help='Comma-separated extra percentiles per ring (I_p16, I_p84, ...) [default: 16,84]'
+    )
+    parser.add_argument(
+        '--sketch-rel-err',
+        type=float,
+        default=0.005,
+        help='Relative error of the median/percentile sketch in --stream mode [default: 0.005]'
+    )
     parser.add_argument(
         '--r-min',
         type=float,
@@ -291,6 +865,10 @@ def main():
         default=0.2,
         help='Ring width [pc]'
     )
+    parser.add_argument(
+        '--edges',
+        help='Explicit comma-separated ring edges [pc] (overrides --r-min/--r-max/--r-step)'
+    )
     parser.add_argument(
         '--center',
         help='Center coordinates (e.g., "20h31m41s +40d21m07s")'
@@ -301,15 +879,53 @@ def main():
         default=1.7,
         help='Distance to source [kpc]'
     )
+    parser.add_argument(
+        '--radius-method',
+        choices=['auto', 'fast', 'exact'],
+        default='auto',
+        help='Radius map: fast pixel-space offsets or exact SkyCoord separation [default: auto]'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Do not use the on-disk radius-map cache (list it with: python scripts/radius_map.py)'
+    )
     
     args = parser.parse_args()
     
     print("="*80)
     print("FITS TO RING PROFILE - G79.29+0.46")
     print("="*80)
-    print(f"\nInput: {args.fits_file}")
+    multiband = len(args.fits_file) > 1
+    if multiband and (args.cube or args.stream or args.index):
+        print("\nERROR: Multi-band mode works on in-memory 2D images only")
+        return 1
+    if args.bootstrap and (multiband or args.cube or args.stream or args.index
+                           or args.sectors):
+        print("\nERROR: --bootstrap works on a single in-memory 2D image only")
+        return 1
+    if args.sectors is not None:
+        if args.sectors < 1:
+            print("\nERROR: --sectors must be >= 1")
+            return 1
+        if multiband or args.cube or args.stream or args.index:
+            print("\nERROR: Polar mode works on a single in-memory 2D image only")
+            return 1
+    
+    if multiband:
+        mode = f"2D Multi-band ({len(args.fits_file)} bands)"
+    elif args.cube:
+        mode = "3D Cube (streaming)" if args.stream else "3D Cube"
+    elif args.sectors:
+        mode = f"2D Polar ({args.sectors} sectors)"
+    elif args.stream:
+        mode = "2D Image (streaming)"
+    else:
+        mode = "2D Image"
+    
+    print(f"\nInput: {', '.join(args.fits_file)}")
     print(f"Output: {args.output}")
-    print(f"Mode: {'3D Cube' if args.cube else '2D Image'}")
+    print(f"Mode: {mode}")
     
     # Parse center
     if args.center:
@@ -322,30 +938,120 @@ def main():
     print(f"\nTarget center: {center.to_string('hmsdms')}")
     print(f"Distance: {distance}")
     
+    percentiles = tuple(float(p) for p in args.percentiles.split(',') if p.strip())
+    try:
+        vel_range = parse_vel_range(args.vel_range)
+    except ValueError as e:
+        print(f"\nERROR: {e}")
+        return 1
+    if vel_range and not args.cube:
+        print("\nERROR: --vel-range needs --cube")
+        return 1
+    
     # Define ring edges
-    r_edges = np.arange(args.r_min, args.r_max + args.r_step, args.r_step)
+    if args.edges:
+        r_edges = np.array([float(e) for e in args.edges.split(',')])
+        if np.any(np.diff(r_edges) <= 0):
+            print("\nERROR: --edges must be strictly increasing")
+            return 1
+    else:
+        r_edges = np.arange(args.r_min, args.r_max + args.r_step, args.r_step)
     print(f"\nRing configuration:")
     print(f"   Range: {r_edges[0]:.2f} - {r_edges[-1]:.2f} pc")
-    print(f"   Step: {args.r_step:.2f} pc")
+    print(f"   Step: {'custom edges' if args.edges else f'{args.r_step:.2f} pc'}")
     print(f"   Number of rings: {len(r_edges)-1}")
     
-    # Check file exists
-    fits_path = Path(args.fits_file)
-    if not fits_path.exists():
-        print(f"\nERROR: File not found: {fits_path}")
-        return 1
+    # Check files exist
+    fits_paths = [Path(f) for f in args.fits_file]
+    for path in fits_paths:
+        if not path.exists():
+            print(f"\nERROR: File not found: {path}")
+            return 1
+    fits_path = fits_paths[0]
     
     # Process based on mode
-    if args.cube:
+    if multiband:
+        if args.band_names:
+            band_names = [b.strip() for b in args.band_names.split(',')]
+        else:
+            band_names = [path.stem for path in fits_paths]
+        
+        if len(band_names) != len(fits_paths):
+            print(f"\nERROR: {len(band_names)} band names for {len(fits_paths)} files")
+            return 1
+        
+        print(f"\n[1/5] Loading {len(fits_paths)} co-registered bands...")
+        df = create_ring_profile_multiband(
+            [str(p) for p in fits_paths], band_names, r_edges, center, distance,
+            percentiles=percentiles, hard_edges=args.hard_edges,
+            method=args.radius_method, use_cache=not args.no_cache
+        )
+    elif args.cube and args.stream:
+        # 3D cube, streamed in channel slabs
+        try:
+            df = create_ring_profile_3d_stream(
+                str(fits_path), r_edges, center, distance,
+                slab_chans=args.slab_chans, method=args.radius_method,
+                use_cache=not args.no_cache, vel_range=vel_range
+            )
+        except ValueError as e:
+            print(f"\nERROR: {e}")
+            return 1
+    elif args.cube:
         # 3D cube mode
-        df = create_ring_profile_3d(
-            str(fits_path), r_edges, center, distance
+        try:
+            df = create_ring_profile_3d(
+                str(fits_path), r_edges, center, distance,
+                use_spectral_cube=args.spectral_cube, vel_range=vel_range
+            )
+        except ValueError as e:
+            print(f"\nERROR: {e}")
+            return 1
+    elif args.sectors:
+        # 2D image, sector × ring
+        data, wcs, header = load_fits_2d(str(fits_path))
+        df = create_ring_profile_polar(
+            data, wcs, r_edges, center, distance, args.sectors,
+            pa_start=args.sector_start, method=args.radius_method,
+            percentiles=percentiles
+        )
+    elif args.index:
+        # 2D image via prefix-sum radial index
+        df = create_ring_profile_2d_index(
+            str(fits_path), r_edges, center, distance,
+            method=args.radius_method, keep_values=args.index_values
+        )
+    elif args.stream:
+        # 2D image, streamed in row tiles
+        df = create_ring_profile_2d_stream(
+            str(fits_path), r_edges, center, distance,
+            tile_rows=args.tile_rows, method=args.radius_method,
+            percentiles=percentiles, rel_err=args.sketch_rel_err
         )
     else:
         # 2D image mode
         data, wcs, header = load_fits_2d(str(fits_path))
-        r_pc = calculate_radial_distance(data, wcs, center, distance)
-        df = create_ring_profile_2d(data, r_pc, r_edges)
+        df = None
+        
+        if args.block_size == 'beam':
+            block_size = beam_block_size(header, wcs)
+        else:
+            block_size = int(args.block_size)
+        boot = dict(n_boot=args.bootstrap, block_size=block_size, seed=args.seed)
+        
+        if not args.hard_edges and args.radius_method != 'exact':
+            df = create_ring_profile_2d_overlap(
+                data, wcs, r_edges, center, distance, percentiles=percentiles,
+                **boot
+            )
+        
+        if df is None:
+            r_pc = calculate_radial_distance(
+                data, wcs, center, distance, args.radius_method,
+                use_cache=not args.no_cache
+            )
+            df = create_ring_profile_2d(data, r_pc, r_edges, percentiles=percentiles,
+                                        **boot)
     
     if df is None or len(df) == 0:
         print("\nERROR: No profile created!")
@@ -357,10 +1063,13 @@ def main():
     # Add metadata as comments
     with open(args.output, 'w', encoding='utf-8') as f:
         f.write(f"# Ring profile from FITS\n")
-        f.write(f"# Source: {fits_path.name}\n")
+        f.write(f"# Source: {', '.join(p.name for p in fits_paths)}\n")
         f.write(f"# Center: {center.to_string('hmsdms')}\n")
         f.write(f"# Distance: {distance}\n")
-        f.write(f"# Ring edges: {r_edges[0]:.2f} - {r_edges[-1]:.2f} pc (step {args.r_step:.2f} pc)\n")
+        if args.edges:
+            f.write(f"# Ring edges: {args.edges} pc\n")
+        else:
+            f.write(f"# Ring edges: {r_edges[0]:.2f} - {r_edges[-1]:.2f} pc (step {args.r_step:.2f} pc)\n")
         f.write(f"# Date: {pd.Timestamp.now()}\n")
         f.write(f"#\n")
         
@@ -369,12 +1078,21 @@ def main():
     
     print(f"   Saved {len(df)} rings")
     
+    if args.sectors:
+        polar_path = args.polar_image or str(Path(args.output).with_suffix('')) + "_polar.fits"
+        save_polar_image(df, r_edges, args.sectors, args.sector_start,
+                         polar_path, source=fits_path.name)
+        print(f"   Saved (angle, radius) image: {polar_path}")
+    
     # Summary
     print("\n[5/5] Summary")
     print("="*80)
     print(f"\nProfile statistics:")
     if 'I_mean' in df.columns:
         print(f"   Intensity range: {df['I_mean'].min():.3e} - {df['I_mean'].max():.3e}")
+    for col in df.columns:
+        if col.endswith('_mean') and col != 'I_mean':
+            print(f"   {col[:-5]} range: {df[col].min():.3e} - {df[col].max():.3e}")
     if 'v_obs_kms' in df.columns:
         print(f"   Velocity range: {df['v_obs_kms'].min():.2f} - {df['v_obs_kms'].max():.2f} km/s")
     
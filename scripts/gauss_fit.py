@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Batched Gaussian Fitter - Levenberg–Marquardt on many spectra at once
+
+Fits  T(v) = A · exp(-(v - v0)² / (2 σ²))  to every row of a
+(n_spectra, n_chan) array simultaneously. All spectra iterate together:
+the normal equations from the analytic Jacobian and their 3×3 solutions are
+computed as stacked arrays, each spectrum keeps its own damping factor,
+and spectra drop out of the active set as soon as they converge.
+
+Each spectrum is fitted on a window of ± WINDOW_SIGMA line widths around
+its peak, so an LM iteration costs O(line width), not O(n_chan). Fits
+whose line is not covered by their window are repeated with a wider one.
+
+Initial guess is the same as with astropy's Gaussian1D + LevMarLSQFitter
+in the ring scripts: A = peak value, v0 = velocity of the peak, σ = 1.
+
+Usage (from another script in scripts/):
+    from gauss_fit import fit_gaussians
+    fit = fit_gaussians(vel, spectra)   # spectra: (n_spectra, n_chan)
+    fit["centroid"], fit["width"], fit["amplitude"], fit["fit_ok"]
+
+© 2025 Carmen N. Wrede, Lino P. Casu
+Licensed under ANTI-CAPITALIST SOFTWARE LICENSE v1.4
+"""
+import numpy as np
+
+# Size of one (spectra × channels) temporary per batch; small batches
+# keep the ~10 passes per LM iteration inside the CPU cache
+BLOCK_KB = 256
+
+# Fit window: peak ± WINDOW_SIGMA line widths (+ WINDOW_PAD channels);
+# a fit is kept if the window covers its centroid ± COVER_SIGMA widths
+WINDOW_SIGMA = 5.0
+COVER_SIGMA = 4.0
+WINDOW_PAD = 3
+
+# Refits with a wider window before falling back to the full spectrum
+WINDOW_PASSES = 2
+
+FWHM_PER_SIGMA = 2.0 * np.sqrt(2.0 * np.log(2.0))
+
+def gaussian(v, amplitude, centroid, width):
+    """Gaussian profile (broadcasts over leading axes of the parameters)"""
+    return amplitude * np.exp(-0.5 * ((v - centroid) / width)**2)
+
+def peak_channels(spectra, finite=None):
+    """Channel of the maximum of every spectrum (NaN channels ignored)"""
+    spectra = np.atleast_2d(spectra)
+    finite = np.isfinite(spectra) if finite is None else finite
+    if finite.all():
+        return np.argmax(spectra, axis=1)
+    return np.argmax(np.where(finite, spectra, -np.inf), axis=1)
+
+def initial_guess(vel, spectra, width=1.0, peak=None):
+    """
+    Peak-based initial guess for every spectrum
+
+    Args:
+        peak: Optional peak channels (from peak_channels())
+
+    Returns:
+        p0: Array (n_spectra, 3) of (amplitude, centroid, width); NaN rows
+        for spectra without any finite value
+    """
+    spectra = np.atleast_2d(spectra)
+    finite = np.isfinite(spectra)
+    has = finite.any(axis=1)
+
+    peak = peak_channels(spectra, finite) if peak is None else peak
+    p0 = np.full((len(spectra), 3), np.nan)
+    p0[has, 0] = spectra[has, peak[has]]
+    p0[has, 1] = vel[peak[has]]
+    p0[has, 2] = width
+
+    return p0
+
+def _residuals(vel, wy, w, p):
+    """
+    Weighted residuals (n, n_chan), plus x = (v - v0)/σ and g = w·exp(-x²/2)
+
+    wy is w·y (precomputed); w is None when all channels are valid. In-place
+    operations keep the number of full-size temporaries low.
+    """
+    A, v0, s = p[:, 0:1], p[:, 1:2], p[:, 2:3]
+    x = vel - v0
+    x /= s
+    g = x * x
+    g *= -0.5
+    np.exp(g, out=g)
+    if w is not None:
+        g *= w
+    r = A * g
+    np.subtract(wy, r, out=r)
+
+    return r, x, g
+
+def _normal_equations(p, x, g, r):
+    """
+    JᵀJ (n, 3, 3) and Jᵀr (n, 3) from the analytic Jacobian
+
+    With a = A/σ the Jacobian columns are ∂/∂A = g, ∂/∂v0 = a·g·x and
+    ∂/∂σ = a·g·x², so all entries follow from the row sums Σ g²·xᵏ
+    (k = 0..4) and Σ g·r·xᵏ (k = 0..2); the (n, n_chan, 3) Jacobian is
+    never built. The sums are row dot products of g, g·x and g·x², so
+    only these two products are written.
+    """
+    a = p[:, 0] / p[:, 2]
+
+    gx = g * x
+    gx2 = gx * x
+    dot = lambda u, v: np.einsum('ij,ij->i', u, v)
+    S = [dot(g, g), dot(g, gx), dot(gx, gx), dot(gx, gx2), dot(gx2, gx2)]
+    T = [dot(g, r), dot(gx, r), dot(gx2, r)]
+
+    a2 = a * a
+    JTJ = np.empty((len(p), 3, 3))
+    JTJ[:, 0, 0] = S[0]
+    JTJ[:, 0, 1] = JTJ[:, 1, 0] = a * S[1]
+    JTJ[:, 0, 2] = JTJ[:, 2, 0] = a * S[2]
+    JTJ[:, 1, 1] = a2 * S[2]
+    JTJ[:, 1, 2] = JTJ[:, 2, 1] = a2 * S[3]
+    JTJ[:, 2, 2] = a2 * S[4]
+
+    JTr = np.stack([T[0], a * T[1], a * T[2]], axis=1)
+
+    return JTJ, JTr
+
+def _rows(arr, sel):
+    """Rows sel of a per-spectrum array; shared 1D axes pass through"""
+    return arr if arr is None or arr.ndim == 1 else arr[sel]
+
+def _lm_fit(vel, y, w, p, n_valid, max_iter, tol, lam0):
+    """
+    Batched LM loop on one block
+
+    Args:
+        vel: Velocity axis (n_chan,), or one axis per spectrum (n, n_chan)
+        y: Spectra (n, n_chan), zero where w = 0
+        w: Channel weights (n, n_chan), or None if all channels are valid
+        p: Initial guess (n, 3)
+        n_valid: Valid channels per spectrum
+
+    Returns:
+        p, chi2, n_iter, converged, err (1σ, scaled by reduced chi²)
+    """
+    n = len(y)
+    p = np.array(p, dtype=float)
+    n_iter = np.zeros(n, dtype=int)
+    converged = np.zeros(n, dtype=bool)
+    chi2 = np.full(n, np.nan)
+    JTJ_p = np.full((n, 3, 3), np.nan)
+
+    # Compacted state of the active (not yet converged) spectra
+    act = np.flatnonzero(np.all(np.isfinite(p), axis=1) & (n_valid > 3))
+    fitted = act
+    v_a, y_a, p_a = _rows(vel, act), y[act], p[act]
+    w_a = _rows(w, act)
+    lam = np.full(len(act), lam0)
+
+    r, x, g = _residuals(v_a, y_a, w_a, p_a)
+    chi2_a = np.einsum('ij,ij->i', r, r)
+    JTJ, JTr = _normal_equations(p_a, x, g, r)
+    eye = np.eye(3)
+
+    for _ in range(max_iter):
+        if len(act) == 0:
+            break
+
+        # Marquardt scaling: damp with the diagonal of JᵀJ
+        H = JTJ + lam[:, None, None] * (JTJ * eye)
+
+        try:
+            step = np.linalg.solve(H, JTr[..., None])[..., 0]
+        except np.linalg.LinAlgError:
+            step = np.stack([np.linalg.lstsq(h, b, rcond=None)[0]
+                             for h, b in zip(H, JTr)])
+
+        p_new = p_a + step
+        p_new[:, 2] = np.abs(p_new[:, 2])
+
+        r, x, g = _residuals(v_a, y_a, w_a, p_new)
+        chi2_new = np.einsum('ij,ij->i', r, r)
+
+        better = np.isfinite(chi2_new) & (chi2_new <= chi2_a)
+        n_iter[act] += 1
+
+        rel_chi2 = (chi2_a - chi2_new) / np.maximum(chi2_a, 1e-300)
+        rel_step = np.max(np.abs(step) / np.maximum(np.abs(p_new), 1e-12), axis=1)
+        done = better & (rel_chi2 < tol) & (rel_step < np.sqrt(tol))
+
+        # Accepted steps: take them and relax damping; rejected: more damping
+        JTJ_new, JTr_new = _normal_equations(p_new, x, g, r)
+        p_a[better] = p_new[better]
+        chi2_a[better] = chi2_new[better]
+        JTJ[better] = JTJ_new[better]
+        JTr[better] = JTr_new[better]
+        lam = np.where(better, np.maximum(lam / 10.0, 1e-12), lam * 10.0)
+
+        # Give up when the damping makes the step vanish
+        done |= ~better & (lam > 1e12)
+
+        if done.any():
+            p[act[done]] = p_a[done]
+            chi2[act[done]] = chi2_a[done]
+            JTJ_p[act[done]] = JTJ[done]
+            converged[act[done]] = True
+
+            keep = ~done
+            act, y_a, p_a = act[keep], y_a[keep], p_a[keep]
+            v_a, w_a = _rows(v_a, keep), _rows(w_a, keep)
+            lam, chi2_a = lam[keep], chi2_a[keep]
+            JTJ, JTr = JTJ[keep], JTr[keep]
+
+    # Not converged within max_iter: keep the last accepted parameters
+    p[act] = p_a
+    chi2[act] = chi2_a
+    JTJ_p[act] = JTJ
+
+    # Uncertainties from (JᵀJ)⁻¹ at the solution (kept from the last
+    # accepted step), scaled by reduced chi²
+    err = np.full((n, 3), np.nan)
+    if len(fitted):
+        dof = np.maximum(n_valid[fitted] - 3, 1)
+        try:
+            inv = np.linalg.inv(JTJ_p[fitted])
+        except np.linalg.LinAlgError:
+            inv = np.linalg.pinv(JTJ_p[fitted])
+        with np.errstate(invalid='ignore'):
+            cov = inv * (chi2[fitted] / dof)[:, None, None]
+            err[fitted] = np.sqrt(np.einsum('ikk->ik', cov))
+
+    return p, chi2, n_iter, converged, err
+
+def halfmax_sigma(spectra, amplitude):
+    """
+    Line width estimate [channels]: channels above half maximum / FWHM
+
+    Noise channels above half maximum only widen the estimate (a wider
+    fit window); 0 for spectra without a peak.
+    """
+    with np.errstate(invalid='ignore'):
+        n_half = np.count_nonzero(spectra >= 0.5 * amplitude[:, None], axis=1)
+    return n_half / FWHM_PER_SIGMA
+
+def _fit_windows(vel, y, finite, p0, center, half, max_iter, tol, lam0, block_size):
+    """
+    Fit every spectrum on the channels center ± half[i], in blocks of
+    spectra with similar window length
+
+    Windows are shifted inside the spectrum instead of being clipped, so
+    all windows of a block have the same length. finite = None means all
+    channels are valid.
+
+    Returns:
+        p, chi2, n_iter, converged, err, lo, hi (window channels lo..hi-1)
+    """
+    n, n_chan = y.shape
+    length = np.minimum(2 * half + 1, n_chan)
+
+    p = np.full((n, 3), np.nan)
+    chi2 = np.full(n, np.nan)
+    n_iter = np.zeros(n, dtype=int)
+    converged = np.zeros(n, dtype=bool)
+    err = np.full((n, 3), np.nan)
+    lo = np.zeros(n, dtype=int)
+
+    order = np.argsort(length, kind='stable')
+    i = 0
+    while i < n:
+        # Block size from the longest window of the block
+        L = int(length[order[min(i + (block_size or n) - 1, n - 1)]])
+        size = block_size or max(16, BLOCK_KB * 1024 // (8 * L))
+        sel = order[i:i + size]
+        L = int(length[sel].max())
+        i += len(sel)
+
+        start = np.clip(center[sel] - L // 2, 0, n_chan - L)
+        cols = start[:, None] + np.arange(L)
+        y_w = y[sel[:, None], cols]
+        vel_w = vel if L == n_chan else vel[cols]
+        if finite is None:
+            w_w, n_valid = None, np.full(len(sel), L)
+        else:
+            fin = finite[sel[:, None], cols]
+            w_w = None if fin.all() else fin.astype(float)
+            n_valid = fin.sum(axis=1)
+
+        (p[sel], chi2[sel], n_iter[sel], converged[sel],
+         err[sel]) = _lm_fit(vel_w, y_w, w_w, p0[sel], n_valid,
+                             max_iter, tol, lam0)
+        lo[sel] = start
+
+    return p, chi2, n_iter, converged, err, lo, lo + np.minimum(length, n_chan)
+
+def fit_gaussians(vel, spectra, p0=None, max_iter=100, tol=1e-8,
+                  lam0=1e-3, block_size=None, window_sigma=WINDOW_SIGMA):
+    """
+    Fit one Gaussian to every spectrum, all spectra in one batched LM loop
+
+    Each spectrum is fitted on a channel window of ± window_sigma line
+    widths around its peak (width from the half-maximum run), so the cost
+    per LM iteration scales with the line width, not the number of
+    channels. Spectra whose fitted line is not covered by its window
+    (centroid ± window_sigma·width beyond the window) are fitted again
+    with a window from the fitted parameters, at most WINDOW_PASSES
+    times, finally on the full spectrum. The Gaussian falls below
+    e^(-window_sigma²/2) of its peak outside the window, so the channels
+    left out do not constrain the parameters.
+
+    Args:
+        vel: Velocity axis [km/s], length n_chan
+        spectra: Array (n_spectra, n_chan) or (n_chan,); NaN channels are
+            ignored (zero weight)
+        p0: Optional initial guess (n_spectra, 3) = (amplitude, centroid,
+            width); default initial_guess()
+        max_iter: Maximum LM iterations
+        tol: Convergence when the relative chi² decrease of an accepted
+            step is below tol and the relative parameter change below √tol
+        lam0: Initial LM damping
+        block_size: Spectra per batch; default keeps one batch of
+            (block_size, window) temporaries in CPU cache (BLOCK_KB)
+        window_sigma: Half window [line widths]; None = fit all channels
+
+    Returns:
+        dict of arrays (n_spectra,):
+            amplitude, centroid, width,
+            amplitude_err, centroid_err, width_err (1σ, scaled by
+                reduced chi² of the fitted channels, as in astropy's
+                LevMarLSQFitter),
+            chi2, n_iter, fit_ok (converged, finite, width > 0)
+    """
+    vel = np.asarray(vel, dtype=float)
+    y = np.atleast_2d(np.asarray(spectra, dtype=float))
+    n, n_chan = y.shape
+
+    # NaN channels get zero weight; y is zeroed there, so w·y = y
+    finite = np.isfinite(y)
+    all_finite = finite.all()
+    y0 = y if all_finite else np.where(finite, y, 0.0)
+
+    peak = peak_channels(y, finite)
+    p0 = initial_guess(vel, y, peak=peak) if p0 is None else np.array(np.atleast_2d(p0), dtype=float)
+
+    if window_sigma is None:
+        half = np.full(n, n_chan)
+    else:
+        sigma_ch = np.maximum(halfmax_sigma(y, p0[:, 0]), 1.0)
+        half = np.ceil(window_sigma * sigma_ch).astype(int) + WINDOW_PAD
+
+    # Channel ↔ velocity for window centers of refits (axis may descend)
+    chan = np.arange(n_chan, dtype=float)
+    ascending = vel[-1] >= vel[0]
+    v_sorted, c_sorted = (vel, chan) if ascending else (vel[::-1], chan[::-1])
+    dv = np.median(np.abs(np.diff(vel))) if n_chan > 1 else 1.0
+    v_min, v_max = vel.min(), vel.max()
+    todo = np.arange(n)
+    p = np.full((n, 3), np.nan)
+    chi2 = np.full(n, np.nan)
+    n_iter = np.zeros(n, dtype=int)
+    converged = np.zeros(n, dtype=bool)
+    err = np.full((n, 3), np.nan)
+
+    for npass in range(WINDOW_PASSES + 1):
+        if npass == WINDOW_PASSES:
+            half[todo] = n_chan
+        # First pass: all spectra (views, no copy of the cube-sized arrays)
+        rows = slice(None) if npass == 0 else todo
+        (p_t, chi2_t, it_t, conv_t, err_t,
+         lo, hi) = _fit_windows(vel, y0[rows], None if all_finite else finite[rows],
+                                p0[rows], peak[rows],
+                                half[rows], max_iter, tol, lam0, block_size)
+        p[todo], chi2[todo], converged[todo], err[todo] = p_t, chi2_t, conv_t, err_t
+        n_iter[todo] += it_t
+
+        if window_sigma is None or npass == WINDOW_PASSES:
+            break
+
+        # Fitted line must lie inside the window (or the window reach the
+        # end of the spectrum on that side)
+        w_lo = np.minimum(vel[lo], vel[hi - 1])
+        w_hi = np.maximum(vel[lo], vel[hi - 1])
+        reach = (window_sigma - (WINDOW_SIGMA - COVER_SIGMA)) * p_t[:, 2]
+        with np.errstate(invalid='ignore'):
+            inside = (((p_t[:, 1] - reach >= w_lo) | (w_lo == v_min)) &
+                      ((p_t[:, 1] + reach <= w_hi) | (w_hi == v_max)))
+        redo = np.all(np.isfinite(p_t), axis=1) & ~inside
+        if not redo.any():
+            break
+
+        # Refit around the fitted centroid with a window from the fitted
+        # width (at least twice the old one), starting from the fit
+        p0[todo[redo]] = p_t[redo]
+        todo = todo[redo]
+        peak[todo] = np.rint(np.interp(p_t[redo, 1], v_sorted, c_sorted)).astype(int)
+        need = np.ceil(window_sigma * p_t[redo, 2] / max(dv, 1e-300)).astype(int) + WINDOW_PAD
+        half[todo] = np.maximum(need, 2 * half[todo])
+
+    fit_ok = (converged & np.all(np.isfinite(p), axis=1) & (p[:, 2] > 0)
+              & np.all(np.isfinite(err), axis=1))
+
+    return {
+        "amplitude": p[:, 0],
+        "centroid": p[:, 1],
+        "width": p[:, 2],
+        "amplitude_err": err[:, 0],
+        "centroid_err": err[:, 1],
+        "width_err": err[:, 2],
+        "chi2": chi2,
+        "n_iter": n_iter,
+        "fit_ok": fit_ok,
+    }
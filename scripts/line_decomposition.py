@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Line Decomposition - batched multi-component / NH3 hyperfine fitting
+
+Fits K components to every row of a (n_spectra, n_chan) array with one
+batched Levenberg–Marquardt loop (same scheme as gauss_fit.py, but with
+an explicit (n, n_chan, 3K) Jacobian). Each component is a template of
+Gaussians sharing amplitude A, velocity v0 and width σ:
+
+    T(v) = Σ_k A_k Σ_h r_h · exp(-(v - v0_k - δ_h)² / (2 σ_k²))
+
+    "gauss"   one line (δ = 0, r = 1)
+    "nh3_11"  NH3 (1,1) main group + 4 satellite groups
+    "nh3_22"  NH3 (2,2) main group + 4 satellite groups
+
+Hyperfine groups are optically thin (fixed relative intensities, r = 1
+for the main group, so A is the main-group peak).
+
+decompose_spectra() fits K = 1 .. max_components (greedy: each new
+component starts at the peak of the previous residual) and keeps, per
+spectrum, the K with the lowest information criterion (BIC or AIC).
+
+Usage (from another script in scripts/):
+    from line_decomposition import decompose_spectra
+    dec = decompose_spectra(vel, spectra, max_components=3, template="nh3_11")
+    dec["n_components"], dec["centroid"]   # (n,), (n, max_components)
+
+© 2025 Carmen N. Wrede, Lino P. Casu
+Licensed under ANTI-CAPITALIST SOFTWARE LICENSE v1.4
+"""
+import numpy as np
+
+from gauss_fit import BLOCK_KB, initial_guess
+
+# Hyperfine groups: (velocity offset [km/s], intensity relative to main group)
+# Group centroids and LTE strengths after Ho & Townes (1983)
+NH3_11 = ((-19.41, 0.222), (-7.47, 0.278), (0.0, 1.0), (7.56, 0.278), (19.55, 0.222))
+NH3_22 = ((-25.92, 0.063), (-16.38, 0.065), (0.0, 1.0), (16.38, 0.065), (25.92, 0.063))
+
+TEMPLATES = {
+    "gauss": ((0.0, 1.0),),
+    "nh3_11": NH3_11,
+    "nh3_22": NH3_22,
+}
+
+def _template(template):
+    """(offsets, ratios) arrays of a template name or ((δ, r), ...) tuple"""
+    if isinstance(template, str):
+        if template not in TEMPLATES:
+            raise ValueError(f"Unknown template '{template}' "
+                             f"(available: {', '.join(TEMPLATES)})")
+        template = TEMPLATES[template]
+    groups = np.asarray(template, dtype=float).reshape(-1, 2)
+    return groups[:, 0], groups[:, 1]
+
+def component_model(vel, p, template="gauss"):
+    """
+    Model spectra for parameters p (n, 3K) = (A_1, v0_1, σ_1, A_2, ...)
+
+    Returns:
+        Array (n, n_chan)
+    """
+    model, _ = _model_jacobian(np.asarray(vel, dtype=float),
+                               np.atleast_2d(p), _template(template), None)
+    return model
+
+def _model_jacobian(vel, p, template, w, jacobian=False):
+    """Model (n, n_chan) and, optionally, the weighted Jacobian (n, n_chan, 3K)"""
+    offsets, ratios = template
+    n, n_par = p.shape
+    model = np.zeros((n, len(vel)))
+    J = np.empty((n, len(vel), n_par)) if jacobian else None
+
+    for k in range(0, n_par, 3):
+        A, v0, s = p[:, k:k+1], p[:, k+1:k+2], p[:, k+2:k+3]
+        e_sum = np.zeros_like(model)
+        ex = np.zeros_like(model) if jacobian else None
+        ex2 = np.zeros_like(model) if jacobian else None
+
+        for d, r in zip(offsets, ratios):
+            x = (vel - v0 - d) / s
+            e = r * np.exp(-0.5 * x * x)
+            e_sum += e
+            if jacobian:
+                e *= x
+                ex += e
+                e *= x
+                ex2 += e
+
+        model += A * e_sum
+        if jacobian:
+            J[:, :, k] = e_sum
+            J[:, :, k+1] = A / s * ex
+            J[:, :, k+2] = A / s * ex2
+
+    if w is not None:
+        model *= w
+        if jacobian:
+            J *= w[:, :, None]
+
+    return model, J
+
+# Rejected trial steps may be singular (a component with zero amplitude);
+# they come out non-finite and are never accepted
+@np.errstate(invalid='ignore', divide='ignore', over='ignore')
+def fit_components(vel, spectra, p0, template="gauss", max_iter=200, tol=1e-8,
+                   lam0=1e-3, min_width=None, block_size=None):
+    """
+    Fit K template components to every spectrum, batched LM
+
+    Args:
+        vel: Velocity axis [km/s], length n_chan
+        spectra: Array (n_spectra, n_chan); NaN channels are ignored
+        p0: Initial guess (n_spectra, 3K) = (A_1, v0_1, σ_1, A_2, ...)
+        template: Template name (see TEMPLATES) or ((δ, r), ...) tuple
+        max_iter: Maximum LM iterations
+        tol: Convergence tolerance (as in gauss_fit.fit_gaussians)
+        lam0: Initial LM damping
+        min_width: Lower limit for σ [km/s] [default: half a channel]
+        block_size: Spectra per batch [default: as in gauss_fit]
+
+    Returns:
+        dict: params, errors (n, 3K), chi2, n_valid, n_iter, fit_ok (n,);
+        fit_ok also requires every component inside the velocity range
+    """
+    vel = np.asarray(vel, dtype=float)
+    y = np.atleast_2d(np.asarray(spectra, dtype=float))
+    p0 = np.atleast_2d(np.asarray(p0, dtype=float))
+    tmpl = _template(template)
+    n_par = p0.shape[1]
+
+    if min_width is None:
+        min_width = 0.5 * np.median(np.abs(np.diff(vel))) if len(vel) > 1 else 0.0
+
+    if block_size is None:
+        block_size = max(16, BLOCK_KB * 1024 // (8 * len(vel)))
+
+    if len(y) > block_size:
+        parts = [fit_components(vel, y[i:i + block_size], p0[i:i + block_size],
+                                template=template, max_iter=max_iter,
+                                tol=tol, lam0=lam0, min_width=min_width,
+                                block_size=block_size)
+                 for i in range(0, len(y), block_size)]
+        return {key: np.concatenate([part[key] for part in parts])
+                for key in parts[0]}
+
+    n = len(y)
+    finite = np.isfinite(y)
+    n_valid = finite.sum(axis=1)
+    y = np.where(finite, y, 0.0)
+    w = None if finite.all() else finite.astype(float)
+
+    def constrain(p):
+        p[:, 0::3] = np.abs(p[:, 0::3])
+        p[:, 2::3] = np.maximum(np.abs(p[:, 2::3]), min_width)
+        return p
+
+    p = constrain(p0.copy())
+    n_iter = np.zeros(n, dtype=int)
+    converged = np.zeros(n, dtype=bool)
+    chi2 = np.full(n, np.nan)
+
+    def state(y_a, w_a, p_a):
+        model, J = _model_jacobian(vel, p_a, tmpl, w_a, jacobian=True)
+        r = y_a - model
+        Jt = J.transpose(0, 2, 1)
+        return (np.einsum('ij,ij->i', r, r), Jt @ J, (Jt @ r[..., None])[..., 0])
+
+    act = np.flatnonzero(np.all(np.isfinite(p), axis=1) & (n_valid > n_par))
+    y_a, p_a = y[act], p[act]
+    w_a = None if w is None else w[act]
+    lam = np.full(len(act), lam0)
+    chi2_a, JTJ, JTr = state(y_a, w_a, p_a)
+    eye = np.eye(n_par)
+
+    for _ in range(max_iter):
+        if len(act) == 0:
+            break
+
+        H = JTJ + lam[:, None, None] * (JTJ * eye)
+        try:
+            step = np.linalg.solve(H, JTr[..., None])[..., 0]
+        except np.linalg.LinAlgError:
+            step = np.stack([np.linalg.lstsq(h, b, rcond=None)[0]
+                             for h, b in zip(H, JTr)])
+
+        p_new = constrain(p_a + step)
+        chi2_new, JTJ_new, JTr_new = state(y_a, w_a, p_new)
+
+        better = np.isfinite(chi2_new) & (chi2_new <= chi2_a)
+        n_iter[act] += 1
+
+        rel_chi2 = (chi2_a - chi2_new) / np.maximum(chi2_a, 1e-300)
+        rel_step = np.max(np.abs(p_new - p_a) / np.maximum(np.abs(p_new), 1e-12), axis=1)
+        done = better & (rel_chi2 < tol) & (rel_step < np.sqrt(tol))
+
+        p_a[better] = p_new[better]
+        chi2_a[better] = chi2_new[better]
+        JTJ[better] = JTJ_new[better]
+        JTr[better] = JTr_new[better]
+        lam = np.where(better, np.maximum(lam / 10.0, 1e-12), lam * 10.0)
+        done |= ~better & (lam > 1e12)
+
+        if done.any():
+            p[act[done]] = p_a[done]
+            chi2[act[done]] = chi2_a[done]
+            converged[act[done]] = True
+
+            keep = ~done
+            act, y_a, p_a = act[keep], y_a[keep], p_a[keep]
+            w_a = None if w is None else w_a[keep]
+            lam, chi2_a = lam[keep], chi2_a[keep]
+            JTJ, JTr = JTJ[keep], JTr[keep]
+
+    p[act] = p_a
+    chi2[act] = chi2_a
+
+    # Uncertainties from (JᵀJ)⁻¹ at the solution, scaled by reduced chi²
+    err = np.full((n, n_par), np.nan)
+    ok_idx = np.flatnonzero(np.all(np.isfinite(p), axis=1) & (n_valid > n_par))
+    if len(ok_idx):
+        _, JTJ_fin, _ = state(y[ok_idx], None if w is None else w[ok_idx], p[ok_idx])
+        dof = np.maximum(n_valid[ok_idx] - n_par, 1)
+        with np.errstate(invalid='ignore'):
+            cov = np.linalg.pinv(JTJ_fin) * (chi2[ok_idx] / dof)[:, None, None]
+            err[ok_idx] = np.sqrt(np.einsum('ikk->ik', cov))
+
+    # Components must stay inside the band and narrower than it
+    span = np.ptp(vel)
+    inside = (np.all((p[:, 1::3] >= vel.min()) & (p[:, 1::3] <= vel.max()), axis=1)
+              & np.all(p[:, 2::3] < span, axis=1))
+
+    fit_ok = (converged & inside & np.all(np.isfinite(p), axis=1)
+              & np.all(np.isfinite(err), axis=1))
+
+    return {
+        "params": p,
+        "errors": err,
+        "chi2": chi2,
+        "n_valid": n_valid,
+        "n_iter": n_iter,
+        "fit_ok": fit_ok,
+    }
+
+def information_criterion(chi2, n_valid, n_params, kind="bic"):
+    """
+    BIC or AIC of a least-squares fit with unknown (constant) noise
+
+        BIC = N ln(χ²/N) + k ln N,   AIC = N ln(χ²/N) + 2k
+    """
+    n_valid = np.asarray(n_valid, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fit_term = n_valid * np.log(np.asarray(chi2) / n_valid)
+    if kind == "bic":
+        return fit_term + n_params * np.log(n_valid)
+    if kind == "aic":
+        return fit_term + 2.0 * n_params
+    raise ValueError(f"Unknown information criterion '{kind}' (use 'bic' or 'aic')")
+
+def decompose_spectra(vel, spectra, max_components=3, template="gauss",
+                      criterion="bic", width=1.0, **fit_kw):
+    """
+    Fit 1 .. max_components components and keep the best K per spectrum
+
+    K = 1 starts from the peak (gauss_fit.initial_guess); every further
+    component starts at the peak of the residual of the K-1 fit, with
+    the previous components as they were fitted.
+
+    Args:
+        vel: Velocity axis [km/s]
+        spectra: Array (n_spectra, n_chan) or (n_chan,)
+        max_components: Largest K tried
+        template: Template name (see TEMPLATES) or ((δ, r), ...) tuple
+        criterion: "bic" or "aic"
+        width: Initial σ of new components [km/s]
+        **fit_kw: Passed to fit_components
+
+    Returns:
+        dict:
+            n_components (n,): chosen K (0 = no successful fit)
+            amplitude, centroid, width and *_err (n, max_components),
+                sorted by centroid, NaN beyond K
+            ic (n, max_components): criterion of every K (inf = failed)
+            chi2 (n,): chi² of the chosen fit
+    """
+    vel = np.asarray(vel, dtype=float)
+    y = np.atleast_2d(np.asarray(spectra, dtype=float))
+    n = len(y)
+
+    ic = np.full((n, max_components), np.inf)
+    fits = []
+    p0 = initial_guess(vel, y, width=width)
+
+    for K in range(1, max_components + 1):
+        fit = fit_components(vel, y, p0, template=template, **fit_kw)
+        fits.append(fit)
+        crit = information_criterion(fit["chi2"], fit["n_valid"], 3 * K, criterion)
+        ic[:, K - 1] = np.where(fit["fit_ok"] & np.isfinite(crit), crit, np.inf)
+
+        if K == max_components:
+            break
+
+        # Next component at the residual peak
+        p_prev = fit["params"]
+        resid = y - component_model(vel, np.nan_to_num(p_prev), template)
+        p_new = initial_guess(vel, resid, width=width)
+        p0 = np.concatenate([p_prev, p_new], axis=1)
+
+    best = np.argmin(ic, axis=1)
+    found = np.isfinite(ic[np.arange(n), best])
+    n_components = np.where(found, best + 1, 0)
+
+    out = {key: np.full((n, max_components), np.nan) for key in
+           ("amplitude", "centroid", "width", "amplitude_err", "centroid_err", "width_err")}
+    chi2 = np.full(n, np.nan)
+
+    for K in range(1, max_components + 1):
+        sel = n_components == K
+        if not sel.any():
+            continue
+        p = fits[K - 1]["params"][sel].reshape(-1, K, 3)
+        e = fits[K - 1]["errors"][sel].reshape(-1, K, 3)
+        order = np.argsort(p[:, :, 1], axis=1)
+        p = np.take_along_axis(p, order[:, :, None], axis=1)
+        e = np.take_along_axis(e, order[:, :, None], axis=1)
+        for j, key in enumerate(("amplitude", "centroid", "width")):
+            out[key][sel, :K] = p[:, :, j]
+            out[key + "_err"][sel, :K] = e[:, :, j]
+        chi2[sel] = fits[K - 1]["chi2"][sel]
+
+    out["n_components"] = n_components
+    out["ic"] = ic
+    out["chi2"] = chi2
+
+    return out
+
+def rotation_temperature(a11, a22):
+    """
+    NH3 rotational temperature from the (2,2)/(1,1) main-group peak ratio
+
+    Optically thin limit of Ho & Townes (1983):
+        T_rot = -41.5 K / ln(0.282 · T_B(2,2) / T_B(1,1))
+
+    Returns:
+        T_rot [K] (NaN where the ratio is outside (0, 1/0.282))
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.asarray(a22, dtype=float) / np.asarray(a11, dtype=float)
+        t_rot = -41.5 / np.log(0.282 * ratio)
+    return np.where((ratio > 0) & (0.282 * ratio < 1), t_rot, np.nan)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Moment Engine - moment 0/1/2 maps of a cube in one pass over channels
+
+Accumulates Σ T, Σ T·v and Σ T·v² per pixel while streaming over channel
+slabs, so the cube is never held in memory twice (or at all, for a
+memory-mapped file):
+
+    mom0 = Σ T Δv                      [K km/s]   integrated intensity
+    mom1 = Σ T v / Σ T                 [km/s]     intensity-weighted velocity
+    mom2 = sqrt(Σ T (v - mom1)² / Σ T) [km/s]     velocity dispersion σ_v
+
+Channels can be restricted to a velocity window, and voxels to a signal
+mask (threshold and/or boolean mask cube). Velocities are accumulated
+relative to the window center to keep the second moment accurate.
+
+Usage (from another script in scripts/):
+    from moments import moment_maps
+    m = moment_maps("G79_co32_cube.fits", vel, vel_window=(-10, 10), threshold=0.5)
+    m["mom0"], m["mom1"], m["mom2"]
+
+© 2025 Carmen N. Wrede, Lino P. Casu
+Licensed under ANTI-CAPITALIST SOFTWARE LICENSE v1.4
+"""
+import numpy as np
+
+from cube_io import iter_channel_slabs, channel_window
+
+class MomentAccumulator:
+    """
+    Running per-pixel sums for moment maps (slab by slab)
+
+    Attributes:
+        s0, s1, s2: Σ T, Σ T·(v - v_ref), Σ T·(v - v_ref)² per pixel
+        n_chan: Number of channels that entered each pixel
+        v_ref: Reference velocity [km/s]
+        dv: Channel width |Δv| [km/s]
+    """
+
+    def __init__(self, shape, v_ref=0.0, dv=1.0):
+        self.s0 = np.zeros(shape)
+        self.s1 = np.zeros(shape)
+        self.s2 = np.zeros(shape)
+        self.n_chan = np.zeros(shape, dtype=np.int32)
+        self.v_ref = float(v_ref)
+        self.dv = float(abs(dv))
+
+    def update(self, vel, slab, mask=None):
+        """
+        Add a channel slab
+
+        Args:
+            vel: Velocities of the slab channels [km/s]
+            slab: Array (n_chan_slab, ny, nx)
+            mask: Optional boolean array (same shape as slab); False voxels
+                are ignored (signal mask)
+        """
+        good = np.isfinite(slab)
+        if mask is not None:
+            good &= mask
+        T = np.where(good, slab, 0.0)
+
+        u = (np.asarray(vel, dtype=float) - self.v_ref)[:, None, None]
+        self.s0 += T.sum(axis=0)
+        T *= u
+        self.s1 += T.sum(axis=0)
+        T *= u
+        self.s2 += T.sum(axis=0)
+        self.n_chan += good.sum(axis=0, dtype=np.int32)
+
+    def maps(self):
+        """
+        Moment maps from the accumulated sums
+
+        Returns:
+            dict with mom0 [K km/s], mom1 [km/s], mom2 [km/s] and n_chan;
+            mom1/mom2 are NaN where Σ T <= 0, mom0 is NaN where no channel
+            entered
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            m1 = self.s1 / self.s0
+            var = self.s2 / self.s0 - m1 * m1
+
+        pos = self.s0 > 0
+        mom1 = np.where(pos, m1 + self.v_ref, np.nan)
+        mom2 = np.where(pos, np.sqrt(np.maximum(var, 0.0)), np.nan)
+        mom0 = np.where(self.n_chan > 0, self.s0 * self.dv, np.nan)
+
+        return {"mom0": mom0, "mom1": mom1, "mom2": mom2, "n_chan": self.n_chan}
+
+def moment_maps(cube, vel, vel_window=None, threshold=None, mask=None,
+                slab_chans=64):
+    """
+    Moment 0/1/2 maps in one streaming pass over the channels
+
+    Args:
+        cube: FITS path (memory-mapped, see cube_io.py) or array
+            (n_chan, ny, nx)
+        vel: Velocity of every channel [km/s]
+        vel_window: Optional (v_min, v_max) [km/s]; channels outside are
+            never read
+        threshold: Optional signal threshold in data units; voxels with
+            T < threshold are ignored
+        mask: Optional boolean mask cube (n_chan, ny, nx), e.g. a memmap
+        slab_chans: Channels per slab
+
+    Returns:
+        dict with mom0, mom1, mom2 (2D maps), n_chan (channels used per
+        pixel) and channels (c0, c1)
+    """
+    vel = np.asarray(vel, dtype=float)
+    c0, c1 = channel_window(vel, vel_window)
+
+    dv = np.median(np.abs(np.diff(vel))) if len(vel) > 1 else 1.0
+    v_ref = 0.5 * (vel[c0] + vel[c1 - 1])
+
+    if isinstance(cube, np.ndarray):
+        slabs = ((s, min(s + slab_chans, c1), cube[s:min(s + slab_chans, c1)])
+                 for s in range(c0, c1, slab_chans))
+    else:
+        slabs = iter_channel_slabs(cube, slab_chans, chan_range=(c0, c1))
+
+    acc = None
+    for s0, s1, slab in slabs:
+        if acc is None:
+            acc = MomentAccumulator(slab.shape[1:], v_ref=v_ref, dv=dv)
+
+        good = None
+        if threshold is not None:
+            good = slab >= threshold
+        if mask is not None:
+            m = np.asarray(mask[s0:s1], dtype=bool)
+            good = m if good is None else good & m
+
+        acc.update(vel[s0:s1], slab, good)
+
+    result = acc.maps()
+    result["channels"] = (c0, c1)
+
+    return result
@@ -12,6 +12,7 @@ Usage:
 Output:
     - data/telescope/akari_fis_rings.csv
     - data/telescope/allwise_rings.csv
+    - data/telescope/allwise_x_2mass.csv (+ _rings.csv: color profiles)
 
 © 2025 Carmen N. Wrede, Lino P. Casu
 Licensed under ANTI-CAPITALIST SOFTWARE LICENSE v1.4
@@ -57,6 +58,39 @@ def run_catalog_conversion(catalog_file, bands, output_name=None):
     
     return True
 
+def run_crossmatch(catalog1, catalog2, output):
+    """Run crossmatch.py (AllWISE × 2MASS, best match, 3\" per catalog) with color rings"""
+    
+    cmd = [
+        sys.executable,
+        "scripts/crossmatch.py",
+        catalog1,
+        catalog2,
+        "--radius", "3,3",
+        "--columns1", "w1mpro,w2mpro",
+        "--columns2", "j_m,h_m,k_m",
+        "--suffix", "_2mass",
+        "--color", "k_m_2mass-w1mpro",
+        "--color", "w1mpro-w2mpro",
+        "--rings",
+        "--output", output
+    ]
+    
+    print(f"\nRunning: {' '.join(cmd)}")
+    print("="*80)
+    
+    result = subprocess.run(
+        cmd,
+        encoding='utf-8',
+        errors='replace'
+    )
+    
+    if result.returncode != 0:
+        print(f"\n⚠️  WARNING: Command failed with exit code {result.returncode}")
+        return False
+    
+    return True
+
 def main():
     """Process all IR catalogs"""
     
@@ -76,7 +110,7 @@ def main():
     
     # 1. AKARI FIS - All 4 bands
     print("\n" + "="*80)
-    print("[1/2] AKARI FIS (Far-Infrared)")
+    print("[1/3] AKARI FIS (Far-Infrared)")
     print("="*80)
     
     total_count += 1
@@ -90,7 +124,7 @@ def main():
     
     # 2. WISE - All 4 bands (magnitudes)
     print("\n" + "="*80)
-    print("[2/2] WISE AllWISE (Mid-Infrared)")
+    print("[2/3] WISE AllWISE (Mid-Infrared)")
     print("="*80)
     
     total_count += 1
@@ -102,6 +136,23 @@ def main():
         success_count += 1
         print("✓ WISE rings created!")
     
+    # 3. AllWISE × 2MASS cross-match → color rings (K - W1, W1 - W2)
+    print("\n" + "="*80)
+    print("[3/3] AllWISE × 2MASS cross-match (color rings)")
+    print("="*80)
+    
+    if Path("data/telescope/fp_psc_test.csv").exists():
+        total_count += 1
+        if run_crossmatch(
+            "data/telescope/allwise_p3as_psd_test.csv",
+            "data/telescope/fp_psc_test.csv",
+            "data/telescope/allwise_x_2mass.csv"
+        ):
+            success_count += 1
+            print("✓ AllWISE × 2MASS color rings created!")
+    else:
+        print("   Skipped: data/telescope/fp_psc_test.csv not found")
+    
     # Summary
     print("\n" + "="*80)
     print("BATCH PROCESSING COMPLETE")
@@ -114,6 +165,9 @@ def main():
             print("   - data/telescope/akari_fis_rings.csv")
         if Path("data/telescope/allwise_rings.csv").exists():
             print("   - data/telescope/allwise_rings.csv")
+        if Path("data/telescope/allwise_x_2mass_rings.csv").exists():
+            print("   - data/telescope/allwise_x_2mass.csv")
+            print("   - data/telescope/allwise_x_2mass_rings.csv")
         
         print("\n🎯 Next Steps:")
         print("   1. Validate ring profiles visually")
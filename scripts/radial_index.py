@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Radial Index - instant re-binning of an image with arbitrary ring edges
+
+Built once per image: all valid pixels sorted by radius, with prefix
+(cumulative) sums of value and value². The pixel count up to any radius
+is simply the position in the sorted array. Any set of ring edges is
+then a few searchsorted lookups, O(rings · log N), and the pixel data is
+never rescanned.
+
+The index is saved next to the FITS file (<name>.fits.radidx.npz) and
+is rebuilt automatically when the file, WCS, center or distance change.
+
+Usage (Python API):
+    from radial_index import RadialIndex
+    idx = RadialIndex.build(data, r_pc)
+    df = idx.query(np.arange(0, 2.2, 0.2))
+    df_log = idx.query(np.geomspace(0.05, 2.0, 15))
+
+Usage (command line):
+    python fits_to_ring_profile.py G79_akari_90um.fits --index --r-step 0.1
+    python fits_to_ring_profile.py G79_akari_90um.fits --index --edges 0,0.1,0.3,0.7,1.5
+
+© 2025 Carmen N. Wrede, Lino P. Casu
+Licensed under ANTI-CAPITALIST SOFTWARE LICENSE v1.4
+"""
+import os
+from pathlib import Path
+
+import numpy as np
+
+from ring_stats import profile_frame
+
+INDEX_SUFFIX = ".radidx.npz"
+
+class RadialIndex:
+    """
+    Pixels sorted by radius with prefix sums of value and value²
+
+    Attributes:
+        r_sorted: Radii of all valid pixels, ascending [pc]
+        cum_s: Prefix sums of (value - shift), length N+1
+        cum_s2: Prefix sums of (value - shift)², length N+1
+        shift: Common offset (mean of all valid pixels) for accuracy
+        values: Values in radius order (only kept with keep_values=True,
+            needed for exact median/min/max)
+        meta: dict with provenance (source, key, ...)
+    """
+
+    def __init__(self, r_sorted, cum_s, cum_s2, shift, values=None, meta=None):
+        self.r_sorted = r_sorted
+        self.cum_s = cum_s
+        self.cum_s2 = cum_s2
+        self.shift = float(shift)
+        self.values = values
+        self.meta = dict(meta or {})
+
+    @property
+    def n_pixels(self):
+        return len(self.r_sorted)
+
+    @classmethod
+    def build(cls, data, r_pc, keep_values=False, meta=None):
+        """
+        Build the index from an image and its radius map
+
+        Args:
+            data: 2D intensity array
+            r_pc: Radial distance for each pixel [pc]
+            keep_values: Also store values in radius order (exact
+                median/min/max in query(), doubles the index size)
+            meta: Optional provenance dict
+
+        Returns:
+            RadialIndex
+        """
+        vals = np.asarray(data, dtype=float).ravel()
+        r = np.asarray(r_pc, dtype=float).ravel()
+
+        valid = np.isfinite(vals) & np.isfinite(r)
+        vals = vals[valid]
+        r = r[valid]
+
+        order = np.argsort(r, kind='stable')
+        r_sorted = r[order]
+        vals = vals[order]
+
+        shift = float(vals.mean()) if len(vals) else 0.0
+        d = vals - shift
+
+        cum_s = np.concatenate([[0.0], np.cumsum(d)])
+        cum_s2 = np.concatenate([[0.0], np.cumsum(d*d)])
+
+        return cls(r_sorted, cum_s, cum_s2, shift,
+                   values=vals if keep_values else None, meta=meta)
+
+    def query(self, r_edges, keep_empty=False):
+        """
+        Ring profile for arbitrary ring edges (r_min <= r < r_max)
+
+        Args:
+            r_edges: Ring edges [pc], increasing
+            keep_empty: Keep rings without pixels (as NaN rows)
+
+        Returns:
+            DataFrame with ring profile (same columns as
+            ring_stats.ring_statistics; I_median/I_min/I_max are NaN
+            unless the index was built with keep_values=True)
+        """
+        r_edges = np.asarray(r_edges, dtype=float)
+        pos = np.searchsorted(self.r_sorted, r_edges, side='left')
+        a, b = pos[:-1], pos[1:]
+
+        n = (b - a).astype(float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_d = (self.cum_s[b] - self.cum_s[a]) / n
+            var = np.maximum((self.cum_s2[b] - self.cum_s2[a]) / n - mean_d**2, 0.0)
+
+        median = np.full(len(n), np.nan)
+        v_min = np.full(len(n), np.nan)
+        v_max = np.full(len(n), np.nan)
+
+        if self.values is not None:
+            for k in np.flatnonzero(n > 0):
+                seg = self.values[a[k]:b[k]]
+                median[k] = np.median(seg)
+                v_min[k] = seg.min()
+                v_max[k] = seg.max()
+
+        return profile_frame(r_edges, n, mean_d + self.shift, np.sqrt(var),
+                             median, v_min, v_max, keep_empty=keep_empty)
+
+    def save(self, path):
+        """Save index as .npz"""
+        arrays = {
+            "r_sorted": self.r_sorted,
+            "cum_s": self.cum_s,
+            "cum_s2": self.cum_s2,
+            "shift": np.array(self.shift),
+            "meta_keys": np.array(list(self.meta.keys()), dtype=str),
+            "meta_values": np.array([str(v) for v in self.meta.values()], dtype=str),
+        }
+        if self.values is not None:
+            arrays["values"] = self.values
+
+        tmp = Path(str(path) + ".tmp")
+        with open(tmp, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load index saved with save()"""
+        with np.load(path) as z:
+            meta = dict(zip(z["meta_keys"].tolist(), z["meta_values"].tolist()))
+            return cls(
+                z["r_sorted"], z["cum_s"], z["cum_s2"], float(z["shift"]),
+                values=z["values"] if "values" in z.files else None,
+                meta=meta,
+            )
+
+def index_path(fits_file):
+    """Default index location next to the FITS file"""
+    return Path(str(fits_file) + INDEX_SUFFIX)
+
+def source_signature(fits_file, key):
+    """Identifies the FITS file version + geometry an index was built for"""
+    st = Path(fits_file).stat()
+    return f"{key}:{st.st_size}:{int(st.st_mtime)}"
+
+def load_or_build(fits_file, key, build_inputs, keep_values=False):
+    """
+    Load the index next to fits_file, or build and save it
+
+    Args:
+        fits_file: Path of the FITS image
+        key: Geometry key (radius_map.cache_key) of WCS/center/distance
+        build_inputs: Callable returning (data, r_pc); only called when
+            the index has to be (re)built, so a valid index never touches
+            the pixel data
+        keep_values: Store values for exact median/min/max
+
+    Returns:
+        RadialIndex, built (True if newly built)
+    """
+    path = index_path(fits_file)
+    signature = source_signature(fits_file, key)
+
+    if path.exists():
+        try:
+            idx = RadialIndex.load(path)
+            if (idx.meta.get("signature") == signature
+                    and (idx.values is not None or not keep_values)):
+                return idx, False
+        except (OSError, ValueError, KeyError):
+            pass  # Unreadable index: rebuild
+
+    data, r_pc = build_inputs()
+    idx = RadialIndex.build(
+        data, r_pc, keep_values=keep_values,
+        meta={"source": Path(fits_file).name, "signature": signature},
+    )
+
+    try:
+        idx.save(path)
+    except OSError as e:
+        print(f"   WARNING: Could not save radial index: {e}")
+
+    return idx, True
@@ -0,0 +1,482 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Radius Map Builder - pixel → pc distance from the nebula center
+
+Fast path: works in projected pixel space. The center pixel comes from
+wcs.world_to_pixel(), the local pixel scale (a 2x2 Jacobian, rad/pixel)
+from three WCS evaluations around it, and every pixel's offset is turned
+into an angle with the small-angle formula on plain float arrays.
+No SkyCoord is built per pixel.
+
+Exact path (old method): pixel → world over the full grid + SkyCoord
+separation. Used automatically when the WCS has distortion terms
+(SIP, lookup tables), or on request.
+
+The fast map is checked against the exact path on a subsampled grid and
+the maximum deviation [pc] is reported.
+
+Radius maps are cached on disk (.npy, loaded as memmap), keyed by a hash
+of the celestial WCS header, image shape, center and distance, so repeat
+runs on the same tile (other ring widths, other bands) load instantly.
+The cache is size-bounded with LRU eviction.
+
+Usage (from another script in scripts/):
+    from radius_map import cached_radius_map
+    r_pc, info = cached_radius_map(data.shape, wcs, G79_CENTER, 1.7)
+
+Cache maintenance:
+    python scripts/radius_map.py             # list cached maps
+    python scripts/radius_map.py --max-mb 500
+    python scripts/radius_map.py --clear
+
+Environment:
+    G79_RADIUS_CACHE      Cache directory [default: ~/.cache/g79_radius_maps]
+    G79_RADIUS_CACHE_MB   Max. cache size in MB [default: 2048]
+
+© 2025 Carmen N. Wrede, Lino P. Casu
+Licensed under ANTI-CAPITALIST SOFTWARE LICENSE v1.4
+"""
+import sys
+import os
+import json
+import hashlib
+import argparse
+from pathlib import Path
+
+import numpy as np
+import astropy.units as u
+
+# Max. number of samples per axis for the fast-vs-exact deviation check
+CHECK_SAMPLES = 256
+
+# On-disk cache
+CACHE_DIR = Path(os.environ.get(
+    'G79_RADIUS_CACHE', Path.home() / '.cache' / 'g79_radius_maps'
+))
+CACHE_MAX_MB = float(os.environ.get('G79_RADIUS_CACHE_MB', 2048))
+
+def distance_to_pc(distance):
+    """Distance as float [pc]; plain numbers are taken as kpc"""
+    return u.Quantity(distance, u.kpc).to_value(u.pc)
+
+def radius_map_exact(shape, wcs, center, distance, x=None, y=None):
+    """
+    Exact radius map via SkyCoord separation (slow)
+
+    Args:
+        shape: (ny, nx) of the celestial plane
+        wcs: Celestial WCS
+        center: SkyCoord of center
+        distance: Distance (Quantity, or float in kpc)
+        x, y: Optional pixel coordinates to evaluate (default: full grid)
+
+    Returns:
+        r_pc: Radial distance in parsecs
+    """
+    if x is None or y is None:
+        y, x = np.indices(shape)
+
+    coords = wcs.pixel_to_world(x, y)
+    r_ang = coords.separation(center)
+
+    return r_ang.to_value(u.rad) * distance_to_pc(distance)
+
+def local_pixel_scale(wcs, x0, y0, center):
+    """
+    Local Jacobian d(offset)/d(pixel) at the center pixel [rad/pixel]
+
+    Offsets are (Δlon·cos(lat), Δlat) in the center's own frame, so this
+    works for TAN, CAR, SIN, ... and for galactic WCS alike.
+    """
+    px = np.array([x0 + 1.0, x0, x0])
+    py = np.array([y0, y0 + 1.0, y0])
+    pts = wcs.pixel_to_world(px, py).transform_to(center.frame)
+
+    dlon, dlat = center.spherical_offsets_to(pts)
+    dlon = dlon.to_value(u.rad)
+    dlat = dlat.to_value(u.rad)
+
+    # Columns: derivative along x, along y
+    return np.array([
+        [dlon[0] - dlon[2], dlon[1] - dlon[2]],
+        [dlat[0] - dlat[2], dlat[1] - dlat[2]],
+    ])
+
+def pixel_geometry(wcs, center, distance):
+    """
+    Linear pixel geometry around the center (for sub-pixel overlaps)
+
+    Args:
+        wcs: WCS (celestial part is used)
+        center: SkyCoord of center
+        distance: Distance (Quantity, or float in kpc)
+
+    Returns:
+        dict: x0, y0 (center pixel), pc_per_pix (sqrt of pixel area),
+        aspect (x/y pixel size), skew_deg (deviation from 90° axes)
+    """
+    wcs = wcs.celestial
+    x0, y0 = wcs.world_to_pixel(center)
+    J = local_pixel_scale(wcs, float(x0), float(y0), center)
+
+    sx = np.hypot(*J[:, 0])
+    sy = np.hypot(*J[:, 1])
+    cos_axes = np.dot(J[:, 0], J[:, 1]) / (sx * sy)
+
+    return {
+        "x0": float(x0),
+        "y0": float(y0),
+        "pc_per_pix": float(np.sqrt(abs(np.linalg.det(J)))) * distance_to_pc(distance),
+        "aspect": float(sx / sy),
+        "skew_deg": float(90.0 - np.degrees(np.arccos(np.clip(cos_axes, -1, 1)))),
+    }
+
+def offset_maps(shape, wcs, center, rows=None):
+    """
+    Small-angle offsets of every pixel from the center [rad]
+
+    Args:
+        shape: (ny, nx) of the celestial plane
+        wcs: Celestial WCS
+        center: SkyCoord of center
+        rows: Optional (y_start, y_stop) to build only a band of rows
+
+    Returns:
+        xi, eta: Offsets towards east (lon·cos lat) and north [rad]
+    """
+    ny, nx = shape
+    y_start, y_stop = rows if rows is not None else (0, ny)
+    x0, y0 = wcs.world_to_pixel(center)
+    J = local_pixel_scale(wcs, float(x0), float(y0), center)
+
+    dx = (np.arange(nx, dtype=float) - x0)[np.newaxis, :]
+    dy = (np.arange(y_start, y_stop, dtype=float) - y0)[:, np.newaxis]
+
+    xi = J[0, 0]*dx + J[0, 1]*dy
+    eta = J[1, 0]*dx + J[1, 1]*dy
+
+    return xi, eta
+
+def radius_map_fast(shape, wcs, center, distance, rows=None):
+    """
+    Radius map in projected pixel space (small-angle offsets)
+
+    Args:
+        shape: (ny, nx) of the celestial plane
+        wcs: Celestial WCS
+        center: SkyCoord of center
+        distance: Distance (Quantity, or float in kpc)
+        rows: Optional (y_start, y_stop) to build only a band of rows
+
+    Returns:
+        r_pc: Radial distance in parsecs
+    """
+    xi, eta = offset_maps(shape, wcs, center, rows=rows)
+
+    r_pc = np.hypot(xi, eta)
+    r_pc *= distance_to_pc(distance)
+
+    return r_pc
+
+def max_deviation(r_pc, wcs, center, distance):
+    """
+    Max |fast - exact| [pc] on a subsampled pixel grid
+
+    At most CHECK_SAMPLES² pixels are evaluated with the exact method.
+    """
+    ny, nx = r_pc.shape
+    ys = np.unique(np.linspace(0, ny - 1, min(ny, CHECK_SAMPLES)).astype(int))
+    xs = np.unique(np.linspace(0, nx - 1, min(nx, CHECK_SAMPLES)).astype(int))
+    y, x = np.meshgrid(ys, xs, indexing='ij')
+
+    r_exact = radius_map_exact(r_pc.shape, wcs, center, distance, x=x, y=y)
+
+    return float(np.nanmax(np.abs(r_pc[y, x] - r_exact)))
+
+def radius_map(shape, wcs, center, distance, method="auto", check=True):
+    """
+    Radius map [pc] for a celestial plane
+
+    Args:
+        shape: (ny, nx) of the celestial plane
+        wcs: WCS (celestial part is used)
+        center: SkyCoord of center
+        distance: Distance (Quantity, or float in kpc)
+        method: "auto" (fast unless WCS has distortions), "fast" or "exact"
+        check: Report max deviation of the fast map from the exact one
+
+    Returns:
+        r_pc, info (dict: method, max_dev_pc)
+    """
+    wcs = wcs.celestial
+
+    if method == "auto":
+        method = "exact" if wcs.has_distortion else "fast"
+
+    info = {"method": method, "max_dev_pc": 0.0}
+
+    if method == "exact":
+        r_pc = radius_map_exact(shape, wcs, center, distance)
+    elif method == "fast":
+        r_pc = radius_map_fast(shape, wcs, center, distance)
+        if check:
+            info["max_dev_pc"] = max_deviation(r_pc, wcs, center, distance)
+    else:
+        raise ValueError(f"Unknown radius-map method: {method}")
+
+    return r_pc, info
+
+def polar_map(shape, wcs, center, distance, method="auto"):
+    """
+    Radius [pc] and position angle [deg] for every pixel in one pass
+
+    Position angle is measured from north through east, in [0, 360),
+    in the frame of the center coordinate.
+
+    Args:
+        shape, wcs, center, distance, method: as radius_map()
+
+    Returns:
+        r_pc, pa_deg, info (dict: method, max_dev_pc)
+    """
+    wcs = wcs.celestial
+
+    if method == "auto":
+        method = "exact" if wcs.has_distortion else "fast"
+
+    info = {"method": method, "max_dev_pc": 0.0}
+
+    if method == "fast":
+        xi, eta = offset_maps(shape, wcs, center)
+        pa_deg = np.degrees(np.arctan2(xi, eta)) % 360.0
+        r_pc = np.hypot(xi, eta)
+        r_pc *= distance_to_pc(distance)
+        info["max_dev_pc"] = max_deviation(r_pc, wcs, center, distance)
+    elif method == "exact":
+        y, x = np.indices(shape)
+        coords = wcs.pixel_to_world(x, y)
+        r_pc = coords.separation(center).to_value(u.rad) * distance_to_pc(distance)
+        pa_deg = center.position_angle(coords).to_value(u.deg) % 360.0
+    else:
+        raise ValueError(f"Unknown radius-map method: {method}")
+
+    return r_pc, pa_deg, info
+
+def radius_map_rows(shape, wcs, center, distance, y_start, y_stop,
+                    method="auto"):
+    """
+    Radius map for rows y_start:y_stop only (tiled / streaming extraction)
+
+    Memory is bounded by the band of rows, not by the image size.
+    No deviation check is done here.
+
+    Returns:
+        r_pc: (y_stop - y_start, nx) radial distance in parsecs
+    """
+    wcs = wcs.celestial
+
+    if method == "auto":
+        method = "exact" if wcs.has_distortion else "fast"
+
+    if method == "fast":
+        return radius_map_fast(shape, wcs, center, distance,
+                               rows=(y_start, y_stop))
+    elif method == "exact":
+        y, x = np.mgrid[y_start:y_stop, 0:shape[1]]
+        return radius_map_exact(shape, wcs, center, distance, x=x, y=y)
+    else:
+        raise ValueError(f"Unknown radius-map method: {method}")
+
+def cache_key(shape, wcs, center, distance, method="auto"):
+    """
+    Hash of celestial WCS header + shape + center + distance + method
+    """
+    header = wcs.celestial.to_header(relax=True)
+    cards = "\n".join(
+        f"{k}={header[k]!r}" for k in sorted(header)
+        if k not in ('DATE', 'DATE-OBS', 'MJD-OBS', 'DATEREF', 'MJDREF')
+    )
+    icrs = center.icrs
+
+    h = hashlib.sha256()
+    h.update(cards.encode('utf-8'))
+    h.update(repr(tuple(int(n) for n in shape)).encode('utf-8'))
+    h.update(f"{icrs.ra.deg:.10f},{icrs.dec.deg:.10f}".encode('utf-8'))
+    h.update(f"{distance_to_pc(distance):.6f}".encode('utf-8'))
+    h.update(method.encode('utf-8'))
+
+    return h.hexdigest()[:32]
+
+def cache_entries(cache_dir=None):
+    """
+    List cache entries, least recently used first
+
+    Returns:
+        list of dicts (key, path, size_bytes, last_used, info)
+    """
+    cache_dir = Path(cache_dir or CACHE_DIR)
+    if not cache_dir.exists():
+        return []
+
+    entries = []
+    for npy in cache_dir.glob("*.npy"):
+        meta = npy.with_suffix(".json")
+        try:
+            info = json.loads(meta.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            info = {}
+        size = npy.stat().st_size + (meta.stat().st_size if meta.exists() else 0)
+        entries.append({
+            "key": npy.stem,
+            "path": npy,
+            "size_bytes": size,
+            "last_used": npy.stat().st_mtime,
+            "info": info,
+        })
+
+    return sorted(entries, key=lambda e: e["last_used"])
+
+def evict_cache(cache_dir=None, max_mb=None):
+    """
+    Remove least recently used entries until the cache fits max_mb
+
+    Returns:
+        Number of removed entries
+    """
+    max_bytes = (CACHE_MAX_MB if max_mb is None else max_mb) * 1024**2
+    entries = cache_entries(cache_dir)
+    total = sum(e["size_bytes"] for e in entries)
+
+    removed = 0
+    for e in entries:
+        if total <= max_bytes:
+            break
+        e["path"].unlink(missing_ok=True)
+        e["path"].with_suffix(".json").unlink(missing_ok=True)
+        total -= e["size_bytes"]
+        removed += 1
+
+    return removed
+
+def clear_cache(cache_dir=None):
+    """Remove all cache entries; returns number removed"""
+    return evict_cache(cache_dir, max_mb=0)
+
+def cached_radius_map(shape, wcs, center, distance, method="auto",
+                      cache_dir=None, use_cache=True):
+    """
+    radius_map() with persistent on-disk cache
+
+    Cached maps are returned as read-only memmaps.
+
+    Args:
+        shape, wcs, center, distance, method: as radius_map()
+        cache_dir: Cache directory [default: CACHE_DIR]
+        use_cache: False = always recompute, never write
+
+    Returns:
+        r_pc, info (dict: method, max_dev_pc, cached)
+    """
+    if not use_cache:
+        r_pc, info = radius_map(shape, wcs, center, distance, method=method)
+        info["cached"] = False
+        return r_pc, info
+
+    cache_dir = Path(cache_dir or CACHE_DIR)
+    key = cache_key(shape, wcs, center, distance, method)
+    npy = cache_dir / f"{key}.npy"
+    meta = npy.with_suffix(".json")
+
+    if npy.exists() and meta.exists():
+        try:
+            r_pc = np.load(npy, mmap_mode='r')
+            info = json.loads(meta.read_text(encoding='utf-8'))
+            if r_pc.shape == tuple(shape):
+                os.utime(npy)  # LRU: mark as recently used
+                info["cached"] = True
+                return r_pc, info
+        except (OSError, ValueError):
+            pass  # Corrupt entry: recompute and overwrite
+
+    r_pc, info = radius_map(shape, wcs, center, distance, method=method)
+
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = cache_dir / f"{key}.npy.tmp"
+        with open(tmp, 'wb') as f:
+            np.save(f, r_pc)
+        os.replace(tmp, npy)
+        icrs = center.icrs
+        meta.write_text(json.dumps({
+            **info,
+            "shape": [int(n) for n in shape],
+            "center_deg": [icrs.ra.deg, icrs.dec.deg],
+            "distance_pc": distance_to_pc(distance),
+        }, indent=2), encoding='utf-8')
+        evict_cache(cache_dir)
+    except OSError as e:
+        print(f"   WARNING: Could not write radius-map cache: {e}")
+
+    info["cached"] = False
+    return r_pc, info
+
+def main():
+    """Inspect or clear the radius-map cache"""
+    parser = argparse.ArgumentParser(
+        description='Inspect or clear the radius-map cache'
+    )
+    parser.add_argument(
+        '--cache-dir',
+        default=None,
+        help=f'Cache directory [default: {CACHE_DIR}]'
+    )
+    parser.add_argument(
+        '--clear',
+        action='store_true',
+        help='Remove all cached radius maps'
+    )
+    parser.add_argument(
+        '--max-mb',
+        type=float,
+        default=None,
+        help='Evict least recently used maps until the cache fits this size'
+    )
+    args = parser.parse_args()
+
+    cache_dir = Path(args.cache_dir or CACHE_DIR)
+
+    print("="*80)
+    print("RADIUS-MAP CACHE")
+    print("="*80)
+    print(f"\nDirectory: {cache_dir}")
+
+    if args.clear:
+        n = clear_cache(cache_dir)
+        print(f"Removed {n} cached radius maps")
+        return 0
+
+    if args.max_mb is not None:
+        n = evict_cache(cache_dir, args.max_mb)
+        print(f"Evicted {n} cached radius maps (limit {args.max_mb:.0f} MB)")
+
+    entries = cache_entries(cache_dir)
+    total_mb = sum(e["size_bytes"] for e in entries) / 1024**2
+
+    print(f"Entries:   {len(entries)}")
+    print(f"Size:      {total_mb:.1f} MB (limit {CACHE_MAX_MB:.0f} MB)")
+
+    for e in reversed(entries):
+        info = e["info"]
+        used = np.datetime64(int(e["last_used"]), 's')
+        print(f"\n   {e['key']}  {e['size_bytes']/1024**2:8.1f} MB  last used {used}")
+        if info:
+            print(f"      shape={tuple(info.get('shape', ()))}, "
+                  f"method={info.get('method')}, "
+                  f"distance={info.get('distance_pc', float('nan')):.0f} pc, "
+                  f"max_dev={info.get('max_dev_pc', float('nan')):.2e} pc")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
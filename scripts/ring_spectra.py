@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ring Spectrum Engine - all ring-averaged spectra of a cube at once
+
+The cube is read ONCE and viewed as a (n_chan, n_pix) matrix. A sparse
+(n_pix × n_rings) membership matrix M (1 for hard ring edges, or
+sub-pixel overlap weights) turns every ring average into one sparse
+product:
+
+    S = X0 · M          (sum of valid values per channel and ring)
+    C = isfinite(X) · M (number / weight of valid pixels)
+    spectrum = S / C    (NaN-aware mean, identical to np.nanmean per ring)
+
+No per-ring masks, no 3D mask broadcasts and no np.where copies of the
+full cube. Channels are processed in chunks, so the only temporary is
+one chunk of the cube. ring_spectra_stream() does the same for cubes
+larger than RAM, reading memory-mapped channel slabs (see cube_io.py).
+
+Usage (from another script in scripts/):
+    from ring_spectra import ring_spectra
+    from ring_stats import ring_index
+    res = ring_spectra(cube_data, ring_index(r_pc, r_edges), len(r_edges) - 1)
+    res["spectra"]   # (n_rings, n_chan)
+
+© 2025 Carmen N. Wrede, Lino P. Casu
+Licensed under ANTI-CAPITALIST SOFTWARE LICENSE v1.4
+"""
+import time
+
+import numpy as np
+from scipy import sparse
+
+from cube_io import iter_channel_slabs
+
+# Temporary memory per channel chunk (float64 copy of the chunk)
+CHUNK_MB = 256
+
+def ring_membership(idx, n_rings, n_pix=None, pix=None, weights=None, transposed=False):
+    """
+    Sparse (n_pix × n_rings) ring membership / weight matrix
+
+    Args:
+        idx: Ring index per pixel (ring_stats.ring_index, -1 = outside),
+            or per entry of pix for overlap triplets
+        n_rings: Number of rings
+        n_pix: Number of spatial pixels (default: len(idx))
+        pix, weights: Flat pixel index and weight per entry (sub-pixel
+            overlap triplets from ring_stats.annulus_overlap())
+        transposed: Build the (n_rings × n_pix) CSR matrix instead, the
+            layout ring_spectra_sums() multiplies with
+
+    Returns:
+        scipy.sparse.csr_matrix of shape (n_pix, n_rings), or
+        (n_rings, n_pix) if transposed
+    """
+    idx = np.asarray(idx).ravel()
+    if pix is None:
+        pix = np.arange(len(idx))
+    if n_pix is None:
+        n_pix = len(idx)
+    w = np.ones(len(idx)) if weights is None else np.asarray(weights, dtype=float).ravel()
+
+    keep = (idx >= 0) & (w > 0)
+
+    if transposed:
+        return sparse.csr_matrix((w[keep], (idx[keep], pix[keep])),
+                                 shape=(n_rings, n_pix))
+    return sparse.csr_matrix((w[keep], (pix[keep], idx[keep])),
+                             shape=(n_pix, n_rings))
+
+def _chunk_channels(n_pix, chunk_mb=CHUNK_MB):
+    """Channels per chunk so that one float64 chunk stays below chunk_mb"""
+    return max(1, int(chunk_mb * 1024**2 // (8 * max(n_pix, 1))))
+
+def ring_spectra_sums(block, membership_t):
+    """
+    Ring sums and valid counts for a block of channels
+
+    Args:
+        block: Array (n_chan_block, ny, nx) or (n_chan_block, n_pix)
+        membership_t: Sparse (n_rings × n_pix) CSR matrix from
+            ring_membership(..., transposed=True), built once per cube
+
+    Returns:
+        S, C: Arrays (n_rings, n_chan_block) with sum of valid values and
+        summed weight of valid pixels
+    """
+    X = np.asarray(block, dtype=float).reshape(len(block), -1)
+    finite = np.isfinite(X)
+    X = np.where(finite, X, 0.0)
+
+    # dense (n_chan × n_pix) · sparse (n_pix × n_rings), transposed
+    S = membership_t @ X.T
+    C = membership_t @ finite.T.astype(float)
+
+    return np.asarray(S), np.asarray(C)
+
+def ring_spectra(cube_data, idx, n_rings, pix=None, weights=None,
+                 chunk_mb=CHUNK_MB):
+    """
+    All ring-averaged spectra of a cube in one sparse product per chunk
+
+    Args:
+        cube_data: Array (n_chan, ny, nx); NaN = blanked
+        idx: Ring index per spatial pixel (ny, nx), or per entry of pix
+        n_rings: Number of rings
+        pix, weights: Overlap triplets (see ring_membership())
+        chunk_mb: Temporary memory per channel chunk [MB]
+
+    Returns:
+        dict with
+            spectra: (n_rings, n_chan) NaN-aware mean spectra
+            counts: (n_rings, n_chan) valid pixels (or weight) per channel
+            n_pixels: (n_rings,) pixels (or summed weight) per ring
+    """
+    n_chan = cube_data.shape[0]
+    n_pix = int(np.prod(cube_data.shape[1:]))
+
+    MT = ring_membership(idx, n_rings, n_pix=n_pix, pix=pix, weights=weights,
+                         transposed=True)
+
+    S = np.zeros((n_rings, n_chan))
+    C = np.zeros((n_rings, n_chan))
+
+    step = _chunk_channels(n_pix, chunk_mb)
+    for c0 in range(0, n_chan, step):
+        c1 = min(c0 + step, n_chan)
+        S[:, c0:c1], C[:, c0:c1] = ring_spectra_sums(cube_data[c0:c1], MT)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        spectra = S / C
+    spectra[C == 0] = np.nan
+
+    return {
+        "spectra": spectra,
+        "counts": C,
+        "n_pixels": np.asarray(MT.sum(axis=1)).ravel(),
+    }
+
+def ring_spectra_stream(fits_file, idx, n_rings, slab_chans=64, pix=None,
+                        weights=None, progress=True, chan_range=None):
+    """
+    Ring-averaged spectra of a memory-mapped cube, slab by slab
+
+    Same result as ring_spectra(), but the cube is never loaded: channel
+    slabs of slab_chans channels are read from the memory-mapped file
+    and reduced into per-ring sums immediately. Peak memory is about one
+    float64 slab (slab_chans · ny · nx · 8 bytes, plus the finite mask).
+
+    Args:
+        fits_file: Path to FITS cube
+        idx: Ring index per spatial pixel (ny, nx), or per entry of pix
+        n_rings: Number of rings
+        slab_chans: Channels per slab
+        pix, weights: Overlap triplets (see ring_membership())
+        progress: Print progress and throughput per slab
+        chan_range: Optional (first, stop) channel range; channels outside
+            are never read (see cube_io.velocity_channel_range)
+
+    Returns:
+        dict as ring_spectra() (spectra cover chan_range only), plus
+            seconds: Wall time
+            chan_per_s: Throughput [channels/s]
+    """
+    MT = None
+    S, C = [], []
+    n_done = 0
+    t0 = time.perf_counter()
+
+    for c0, c1, slab in iter_channel_slabs(fits_file, slab_chans, chan_range=chan_range):
+        if MT is None:
+            # Built once, in the layout every slab product uses
+            n_pix = int(np.prod(slab.shape[1:]))
+            MT = ring_membership(idx, n_rings, n_pix=n_pix, pix=pix, weights=weights,
+                                 transposed=True)
+
+        s, c = ring_spectra_sums(slab, MT)
+        S.append(s)
+        C.append(c)
+        n_done += c1 - c0
+
+        if progress:
+            dt = time.perf_counter() - t0
+            print(f"   Channels {c0}-{c1-1}: {n_done/dt:.1f} channels/s")
+
+    seconds = time.perf_counter() - t0
+    S = np.concatenate(S, axis=1)
+    C = np.concatenate(C, axis=1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        spectra = S / C
+    spectra[C == 0] = np.nan
+
+    return {
+        "spectra": spectra,
+        "counts": C,
+        "n_pixels": np.asarray(MT.sum(axis=1)).ravel(),
+        "seconds": seconds,
+        "chan_per_s": n_done / seconds if seconds > 0 else np.inf,
+    }
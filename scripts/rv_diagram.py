@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Radius–Velocity Diagram - (ring × channel) intensity matrix of a cube
+
+Keeps the full ring-averaged spectra instead of only their fitted
+centroids: row i of the r–v matrix is the mean spectrum of ring i. All
+rows come from one sparse ring operator per channel slab (see
+ring_spectra.py), so the cost does not grow with the number of rings -
+0.02 pc sampling (100 rings out to 2 pc) is as fast as 10 rings.
+
+Usage:
+    python rv_diagram.py G79_iram_co21_cube.fits
+    python rv_diagram.py G79_co21.fits G79_co32.fits G79_13co21.fits --r-step 0.02 --r-max 3
+    python rv_diagram.py G79_co32_cube.fits --edges 0,0.1,0.3,0.7,1.5 --centroids
+    python rv_diagram.py G79_co32_cube.fits --vel-range=-10,10
+
+Output (per cube, in --output-dir):
+    <cube>_rv.fits - Primary: mean intensity, axis 1 = velocity [km/s],
+                     axis 2 = radius [pc]; N_PIXELS and EDGES extensions
+    <cube>_rv.png  - Rendered diagram (optionally with Gaussian centroids)
+
+From another script in scripts/:
+    from rv_diagram import save_rv_fits, plot_rv
+    save_rv_fits(res["spectra"], vel, r_edges, "G79_co_rv.fits", res["n_pixels"])
+
+© 2025 Carmen N. Wrede, Lino P. Casu
+Licensed under ANTI-CAPITALIST SOFTWARE LICENSE v1.4
+"""
+import sys
+import os
+import argparse
+from pathlib import Path
+
+# UTF-8 for Windows
+os.environ['PYTHONIOENCODING'] = 'utf-8:replace'
+if sys.platform == 'win32':
+    try:
+        sys.stdout.reconfigure(encoding='utf-8', errors='replace')
+    except:
+        pass
+
+try:
+    import numpy as np
+    from astropy.io import fits
+    from astropy.coordinates import SkyCoord
+    import astropy.units as u
+except ImportError as e:
+    print(f"ERROR: Required packages missing: {e}")
+    print("\nInstall with:")
+    print("  pip install astropy numpy")
+    sys.exit(1)
+
+from cube_io import cube_header, spectral_axis_kms, channel_window, parse_vel_range
+from radius_map import cached_radius_map
+from ring_stats import ring_index
+from ring_spectra import ring_spectra_stream
+
+# G79.29+0.46 center (same as fits_to_ring_profile.py)
+G79_CENTER = SkyCoord("20h31m41s", "+40d21m07s", frame="icrs")
+
+def rv_matrix(fits_file, r_edges, center, distance, slab_chans=64,
+              method="auto", use_cache=True, vel_range=None):
+    """
+    Ring × channel matrix of mean intensities
+
+    Args:
+        fits_file: Path to FITS cube (memory-mapped, read in channel slabs)
+        r_edges: Ring edges [pc]
+        center: SkyCoord of center
+        distance: Distance to source
+        slab_chans: Channels per slab
+        method: Radius method ("auto", "fast", "exact")
+        use_cache: Use the on-disk radius-map cache
+        vel_range: Optional (v_min, v_max) [km/s]; only these channels
+            are read
+
+    Returns:
+        dict: spectra (n_rings, n_chan), n_pixels, vel [km/s], header,
+        seconds
+    """
+    header, shape, wcs = cube_header(fits_file)
+    vel = spectral_axis_kms(header, shape[0], strict=vel_range is not None)
+    c0, c1 = channel_window(vel, vel_range)
+
+    r_pc, _ = cached_radius_map(shape[1:], wcs.celestial, center, distance,
+                                method=method, use_cache=use_cache)
+    n_rings = len(r_edges) - 1
+    res = ring_spectra_stream(fits_file, ring_index(r_pc, r_edges), n_rings,
+                              slab_chans=slab_chans, progress=False,
+                              chan_range=(c0, c1))
+
+    return {
+        "spectra": res["spectra"],
+        "n_pixels": res["n_pixels"],
+        "vel": vel[c0:c1],
+        "header": header,
+        "seconds": res["seconds"],
+    }
+
+def save_rv_fits(spectra, vel, r_edges, output, n_pixels=None, bunit="", source=""):
+    """
+    Save an r–v matrix as FITS
+
+    Primary HDU: (n_rings, n_chan) mean intensity; axis 1 = velocity
+    [km/s], axis 2 = radius [pc]. Extensions: N_PIXELS (pixels per ring)
+    and EDGES (ring edges, needed when the rings are not evenly spaced).
+    """
+    vel = np.asarray(vel, dtype=float)
+    dv = float(np.median(np.diff(vel))) if len(vel) > 1 else 1.0
+
+    hdr = fits.Header()
+    hdr['CTYPE1'] = 'VRAD'
+    hdr['CUNIT1'] = 'km/s'
+    hdr['CRPIX1'] = 1.0
+    hdr['CRVAL1'] = vel[0]
+    hdr['CDELT1'] = dv
+    hdr['CTYPE2'] = 'RADIUS'
+    hdr['CUNIT2'] = 'pc'
+    hdr['CRPIX2'] = 1.0
+    hdr['CRVAL2'] = 0.5 * (r_edges[0] + r_edges[1])
+    hdr['CDELT2'] = r_edges[1] - r_edges[0]
+    hdr['BUNIT'] = bunit
+    hdr['SOURCE'] = source
+    if not np.allclose(np.diff(r_edges), r_edges[1] - r_edges[0]):
+        hdr['COMMENT'] = 'Uneven ring edges: use EDGES table, not CDELT2'
+    if len(vel) > 2 and not np.allclose(np.diff(vel), dv, rtol=1e-4):
+        hdr['COMMENT'] = 'Velocity axis is not linear in km/s: CDELT1 is the median step'
+
+    hdus = [fits.PrimaryHDU(np.asarray(spectra, dtype=np.float32), header=hdr)]
+    if n_pixels is not None:
+        hdus.append(fits.ImageHDU(np.asarray(n_pixels, dtype=np.int64), name='N_PIXELS'))
+    hdus.append(fits.BinTableHDU.from_columns(
+        [fits.Column(name='r_edge_pc', format='D', array=np.asarray(r_edges, dtype=float))],
+        name='EDGES'
+    ))
+    fits.HDUList(hdus).writeto(output, overwrite=True)
+
+def plot_rv(spectra, vel, r_edges, output, title="", bunit="", centroids=None):
+    """
+    Render an r–v matrix (radius vertical, velocity horizontal)
+
+    Cells are drawn at their true ring edges, so uneven rings are shown
+    correctly. centroids: optional velocity per ring, drawn as points.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    vel = np.asarray(vel, dtype=float)
+    v_edges = np.concatenate([[1.5 * vel[0] - 0.5 * vel[1]],
+                              0.5 * (vel[1:] + vel[:-1]),
+                              [1.5 * vel[-1] - 0.5 * vel[-2]]])
+    order = np.argsort(vel)
+    if vel[-1] < vel[0]:
+        v_edges = v_edges[::-1]
+
+    fig, ax = plt.subplots(figsize=(8, 6))
+    finite = spectra[np.isfinite(spectra)]
+    vmin, vmax = np.percentile(finite, [1, 99.5]) if finite.size else (None, None)
+    mesh = ax.pcolormesh(v_edges, r_edges, spectra[:, order], shading='flat',
+                         cmap='viridis', vmin=vmin, vmax=vmax)
+    fig.colorbar(mesh, ax=ax, label=f"Mean intensity [{bunit}]" if bunit else "Mean intensity")
+
+    if centroids is not None:
+        r_mid = 0.5 * (np.asarray(r_edges[:-1]) + np.asarray(r_edges[1:]))
+        ax.plot(centroids, r_mid, 'w.', ms=4, label='Gaussian centroid')
+        ax.legend(loc='upper right', fontsize=9)
+
+    ax.set_xlabel('Velocity [km/s]', fontsize=12)
+    ax.set_ylabel('Radius [pc]', fontsize=12)
+    ax.set_title(title, fontsize=13)
+    fig.tight_layout()
+    fig.savefig(output, dpi=150, bbox_inches='tight')
+    plt.close(fig)
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(
+        description='Radius–velocity diagrams (ring × channel matrices) from cubes'
+    )
+    parser.add_argument(
+        'fits_file',
+        nargs='+',
+        help='Input FITS cube(s)'
+    )
+    parser.add_argument(
+        '--output-dir',
+        default='.',
+        help='Output directory [default: current]'
+    )
+    parser.add_argument(
+        '--r-min',
+        type=float,
+        default=0.0,
+        help='Minimum radius [pc]'
+    )
+    parser.add_argument(
+        '--r-max',
+        type=float,
+        default=2.0,
+        help='Maximum radius [pc]'
+    )
+    parser.add_argument(
+        '--r-step',
+        type=float,
+        default=0.02,
+        help='Ring width [pc] [default: 0.02]'
+    )
+    parser.add_argument(
+        '--edges',
+        help='Explicit comma-separated ring edges [pc] (overrides --r-min/--r-max/--r-step)'
+    )
+    parser.add_argument(
+        '--center',
+        help='Center coordinates (e.g., "20h31m41s +40d21m07s")'
+    )
+    parser.add_argument(
+        '--distance',
+        type=float,
+        default=1.7,
+        help='Distance to source [kpc]'
+    )
+    parser.add_argument(
+        '--vel-range',
+        help='Only read channels in "VMIN,VMAX" [km/s] (use --vel-range=-10,10 for negative values)'
+    )
+    parser.add_argument(
+        '--slab-chans',
+        type=int,
+        default=64,
+        help='Channels per slab [default: 64]'
+    )
+    parser.add_argument(
+        '--centroids',
+        action='store_true',
+        help='Overlay Gaussian centroids of the ring spectra (gauss_fit.py)'
+    )
+    parser.add_argument(
+        '--no-plot',
+        action='store_true',
+        help='Only write the FITS images'
+    )
+
+    args = parser.parse_args()
+
+    print("="*80)
+    print("RADIUS-VELOCITY DIAGRAMS - G79.29+0.46")
+    print("="*80)
+
+    center = SkyCoord(args.center, frame="icrs") if args.center else G79_CENTER
+    distance = args.distance * u.kpc
+
+    if args.edges:
+        r_edges = np.array([float(e) for e in args.edges.split(',')])
+        if np.any(np.diff(r_edges) <= 0):
+            print("\nERROR: --edges must be strictly increasing")
+            return 1
+    else:
+        r_edges = np.arange(args.r_min, args.r_max + 0.5 * args.r_step, args.r_step)
+
+    out_dir = Path(args.output_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    print(f"\nRings: {len(r_edges)-1} ({r_edges[0]:.2f} - {r_edges[-1]:.2f} pc)")
+
+    for i, fits_file in enumerate(args.fits_file, 1):
+        fits_path = Path(fits_file)
+        print(f"\n[{i}/{len(args.fits_file)}] {fits_path.name}")
+        if not fits_path.exists():
+            print(f"   ERROR: File not found: {fits_path}")
+            return 1
+
+        try:
+            rv = rv_matrix(str(fits_path), r_edges, center, distance,
+                           slab_chans=args.slab_chans,
+                           vel_range=parse_vel_range(args.vel_range))
+        except ValueError as e:
+            print(f"   ERROR: {e}")
+            return 1
+        bunit = rv["header"].get('BUNIT', '')
+        print(f"   Matrix: {rv['spectra'].shape[0]} rings × {rv['spectra'].shape[1]} channels "
+              f"in {rv['seconds']:.2f} s")
+
+        fits_out = out_dir / f"{fits_path.stem}_rv.fits"
+        save_rv_fits(rv["spectra"], rv["vel"], r_edges, fits_out,
+                     n_pixels=rv["n_pixels"], bunit=bunit, source=fits_path.name)
+        print(f"   Saved: {fits_out}")
+
+        if not args.no_plot:
+            centroids = None
+            if args.centroids:
+                from gauss_fit import fit_gaussians
+                fit = fit_gaussians(rv["vel"], rv["spectra"])
+                centroids = np.where(fit["fit_ok"], fit["centroid"], np.nan)
+
+            png_out = out_dir / f"{fits_path.stem}_rv.png"
+            plot_rv(rv["spectra"], rv["vel"], r_edges, png_out,
+                    title=f"r–v diagram: {fits_path.name}", bunit=bunit,
+                    centroids=centroids)
+            print(f"   Saved: {png_out}")
+
+    print("\n" + "="*80)
+    print("DONE!")
+    print("="*80)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
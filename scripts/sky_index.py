@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Sky Index - persistent KD-tree for cone/annulus queries on catalogs
+
+Source positions are stored as 3D unit vectors in a KD-tree
+(scipy.spatial.cKDTree). A cone of angular radius θ is a ball of chord
+radius 2·sin(θ/2), so a query only touches the sources near the center
+instead of computing the separation of every source. Exact separations
+(atan2(|a×b|, a·b), accurate at all angles) are computed for the
+candidates only.
+
+The index is saved next to the catalog (<catalog>.skyidx.pkl) and is
+rebuilt automatically when the catalog or the ra/dec columns change.
+Loading a saved tree is several times faster than building it, so ring
+binning around dozens of Cygnus-X targets from one regional catalog
+costs one load plus one small query per target.
+
+Usage (Python API):
+    from sky_index import load_or_build
+    index, built = load_or_build("data/telescope/allwise_p3as_psd_test.csv")
+    rows, sep_deg = index.cone(G79_CENTER, 0.1)
+    rows, sep_deg = index.annulus(G79_CENTER, 0.02, 0.1)
+
+Usage (command line):
+    # Build the index and time a cone query
+    python sky_index.py data/telescope/allwise_p3as_psd_test.csv --radius 0.1
+
+    # Benchmark against a full SkyCoord separation on a synthetic catalog
+    python sky_index.py --benchmark 3000000
+
+© 2025 Carmen N. Wrede, Lino P. Casu
+Licensed under ANTI-CAPITALIST SOFTWARE LICENSE v1.4
+"""
+import sys
+import os
+import time
+import pickle
+import argparse
+from pathlib import Path
+
+# UTF-8 for Windows
+os.environ['PYTHONIOENCODING'] = 'utf-8:replace'
+if sys.platform == 'win32':
+    try:
+        sys.stdout.reconfigure(encoding='utf-8', errors='replace')
+    except:
+        pass
+
+try:
+    import numpy as np
+    from scipy.spatial import cKDTree
+    from astropy.coordinates import SkyCoord
+    import astropy.units as u
+except ImportError as e:
+    print(f"ERROR: Required packages missing: {e}")
+    print("\nInstall with:")
+    print("  pip install numpy scipy astropy")
+    sys.exit(1)
+
+INDEX_SUFFIX = ".skyidx.pkl"
+
+# Bump when the pickled layout changes (old indexes are rebuilt)
+INDEX_VERSION = 1
+
+# G79.29+0.46 center (same as catalog_to_rings.py)
+G79_CENTER = SkyCoord("20h31m41s +40d21m07s", frame="icrs")
+
+def unit_vectors(ra_deg, dec_deg):
+    """(N, 3) unit vectors of ICRS positions [deg]"""
+    ra = np.radians(np.asarray(ra_deg, dtype=float))
+    dec = np.radians(np.asarray(dec_deg, dtype=float))
+    cos_dec = np.cos(dec)
+    return np.column_stack([cos_dec * np.cos(ra), cos_dec * np.sin(ra), np.sin(dec)])
+
+def center_vector(center):
+    """Unit vector of a SkyCoord (any frame) or an (ra, dec) pair [deg]"""
+    if isinstance(center, SkyCoord):
+        icrs = center.icrs
+        return unit_vectors([icrs.ra.deg], [icrs.dec.deg])[0]
+    return unit_vectors([center[0]], [center[1]])[0]
+
+def chord_radius(theta_deg):
+    """Chord length of an angular radius on the unit sphere"""
+    return 2.0 * np.sin(0.5 * np.radians(min(theta_deg, 180.0)))
+
+def angular_separation(xyz, c):
+    """Separation [deg] between unit vectors xyz (N, 3) and c (3,)"""
+    cross = np.linalg.norm(np.cross(xyz, c), axis=1)
+    return np.degrees(np.arctan2(cross, xyz @ c))
+
+class SkyIndex:
+    """
+    KD-tree over the unit vectors of catalog positions
+
+    Attributes:
+        tree: cKDTree of the unit vectors (tree.data: (N, 3) array)
+        meta: dict with provenance (source, signature, ...)
+    """
+
+    def __init__(self, tree, meta=None):
+        self.tree = tree
+        self.meta = dict(meta or {})
+
+    @property
+    def n_sources(self):
+        return self.tree.n
+
+    @classmethod
+    def build(cls, ra_deg, dec_deg, meta=None):
+        """
+        Build the index from positions [deg]
+
+        Sources with non-finite positions are kept out of the tree but
+        keep their row numbers (queries return catalog row indices).
+        """
+        xyz = unit_vectors(ra_deg, dec_deg)
+        # Far off the unit sphere: never inside a query ball (chord <= 2)
+        xyz[~np.isfinite(xyz).all(axis=1)] = 1e3
+        tree = cKDTree(xyz, leafsize=32, balanced_tree=False, compact_nodes=False)
+        return cls(tree, meta=meta)
+
+    def cone(self, center, radius_deg):
+        """
+        Sources within radius_deg of center
+
+        Returns:
+            rows: Catalog row indices (ascending)
+            sep_deg: Their separations from center [deg]
+        """
+        c = center_vector(center)
+        rows = np.asarray(self.tree.query_ball_point(c, chord_radius(radius_deg) * (1 + 1e-12)),
+                          dtype=np.int64)
+        rows.sort()
+        sep = angular_separation(self.tree.data[rows], c)
+        keep = sep <= radius_deg
+        return rows[keep], sep[keep]
+
+    def annulus(self, center, r_in_deg, r_out_deg):
+        """Sources with r_in_deg <= separation < r_out_deg (rows, sep_deg)"""
+        rows, sep = self.cone(center, r_out_deg)
+        keep = (sep >= r_in_deg) & (sep < r_out_deg)
+        return rows[keep], sep[keep]
+
+    def cones(self, centers, radius_deg):
+        """
+        Cone queries around many centers in one tree traversal
+
+        Args:
+            centers: SkyCoord array (or list of (ra, dec) [deg])
+            radius_deg: Common radius [deg]
+
+        Returns:
+            List of (rows, sep_deg) per center
+        """
+        if isinstance(centers, SkyCoord):
+            icrs = centers.icrs
+            c_xyz = unit_vectors(np.atleast_1d(icrs.ra.deg), np.atleast_1d(icrs.dec.deg))
+        else:
+            c_xyz = unit_vectors(*np.asarray(centers, dtype=float).T)
+
+        hits = self.tree.query_ball_point(c_xyz, chord_radius(radius_deg) * (1 + 1e-12))
+        out = []
+        for c, rows in zip(c_xyz, hits):
+            rows = np.sort(np.asarray(rows, dtype=np.int64))
+            sep = angular_separation(self.tree.data[rows], c)
+            keep = sep <= radius_deg
+            out.append((rows[keep], sep[keep]))
+        return out
+
+    def save(self, path):
+        """Save the index (pickled tree + meta)"""
+        tmp = Path(str(path) + ".tmp")
+        with open(tmp, 'wb') as f:
+            pickle.dump({"version": INDEX_VERSION, "meta": self.meta, "tree": self.tree},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load an index saved with save()"""
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        if state.get("version") != INDEX_VERSION:
+            raise ValueError(f"Sky index version {state.get('version')} != {INDEX_VERSION}")
+        return cls(state["tree"], meta=state["meta"])
+
+def index_path(catalog_file):
+    """Default index location next to the catalog"""
+    return Path(str(catalog_file) + INDEX_SUFFIX)
+
+def source_signature(catalog_file, ra_col, dec_col):
+    """Identifies the catalog version + position columns an index was built for"""
+    st = Path(catalog_file).stat()
+    return f"{ra_col}:{dec_col}:{st.st_size}:{st.st_mtime_ns}"
+
+def load_or_build(catalog_file, ra_col="ra", dec_col="dec", positions=None):
+    """
+    Load the index next to catalog_file, or build and save it
+
+    Args:
+        catalog_file: Catalog CSV
+        ra_col, dec_col: Position columns [deg]
+        positions: Optional (ra, dec) arrays already in memory; only used
+            when the index has to be (re)built
+
+    Returns:
+        SkyIndex, built (True if newly built)
+    """
+    path = index_path(catalog_file)
+    signature = source_signature(catalog_file, ra_col, dec_col)
+
+    if path.exists():
+        try:
+            index = SkyIndex.load(path)
+            if index.meta.get("signature") == signature:
+                return index, False
+        except (OSError, ValueError, KeyError, pickle.UnpicklingError, EOFError):
+            pass  # Unreadable or outdated index: rebuild
+
+    if positions is None:
+        from catalog_cache import load_catalog
+        df = load_catalog(catalog_file, columns=[ra_col, dec_col])
+        positions = (df[ra_col].to_numpy(dtype=float), df[dec_col].to_numpy(dtype=float))
+
+    index = SkyIndex.build(
+        *positions,
+        meta={"source": Path(catalog_file).name, "signature": signature},
+    )
+
+    try:
+        index.save(path)
+    except OSError as e:
+        print(f"   WARNING: Could not save sky index: {e}")
+
+    return index, True
+
+def benchmark(n_sources, radius_deg, n_targets=30, seed=42):
+    """
+    Index vs. full SkyCoord separation on a synthetic Cygnus-X catalog
+
+    Returns:
+        dict of timings [s] and the largest separation difference [deg]
+    """
+    rng = np.random.default_rng(seed)
+    ra = rng.uniform(303.0, 312.0, n_sources)
+    dec = rng.uniform(37.0, 44.0, n_sources)
+    targets = SkyCoord(rng.uniform(305.0, 310.0, n_targets) * u.deg,
+                       rng.uniform(39.0, 42.0, n_targets) * u.deg)
+
+    t0 = time.perf_counter()
+    coords = SkyCoord(ra * u.deg, dec * u.deg)
+    full = [coords.separation(t).deg for t in targets]
+    t_full = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    index = SkyIndex.build(ra, dec)
+    t_build = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    hits = index.cones(targets, radius_deg)
+    t_query = time.perf_counter() - t0
+
+    max_diff = 0.0
+    for sep_all, (rows, sep) in zip(full, hits):
+        expected = np.flatnonzero(sep_all <= radius_deg)
+        if not np.array_equal(expected, rows):
+            raise RuntimeError("Index cone differs from the full separation")
+        if len(rows):
+            max_diff = max(max_diff, float(np.max(np.abs(sep_all[rows] - sep))))
+
+    return {"t_full": t_full, "t_build": t_build, "t_query": t_query,
+            "max_diff_deg": max_diff, "n_targets": n_targets}
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(
+        description='Build a persistent KD-tree sky index for a catalog and time cone queries'
+    )
+    parser.add_argument(
+        'catalog_file',
+        nargs='?',
+        help='Catalog CSV'
+    )
+    parser.add_argument(
+        '--ra-col',
+        default='ra',
+        help='RA column [deg] (default: ra)'
+    )
+    parser.add_argument(
+        '--dec-col',
+        default='dec',
+        help='Dec column [deg] (default: dec)'
+    )
+    parser.add_argument(
+        '--radius',
+        type=float,
+        default=4.0 / 60.0,
+        help='Cone radius [deg] around G79 [default: 4 arcmin ≈ 2 pc at 1.7 kpc]'
+    )
+    parser.add_argument(
+        '--benchmark',
+        type=int,
+        metavar='N',
+        help='Benchmark on a synthetic catalog with N sources (30 targets)'
+    )
+
+    args = parser.parse_args()
+
+    print("="*80)
+    print("SKY INDEX - KD-TREE CONE QUERIES")
+    print("="*80)
+
+    if args.benchmark:
+        print(f"\nSynthetic catalog: {args.benchmark} sources, radius {args.radius*60:.1f} arcmin")
+        res = benchmark(args.benchmark, args.radius)
+        print(f"   Full SkyCoord separation ({res['n_targets']} targets): {res['t_full']:.2f} s")
+        print(f"   Index build (once):                 {res['t_build']:.2f} s")
+        print(f"   Index queries ({res['n_targets']} targets):         {res['t_query']*1e3:.1f} ms")
+        print(f"   Same sources, max. separation difference {res['max_diff_deg']*3.6e6:.2e} mas")
+    elif args.catalog_file:
+        catalog = Path(args.catalog_file)
+        if not catalog.exists():
+            print(f"\nERROR: File not found: {catalog}")
+            return 1
+
+        t0 = time.perf_counter()
+        index, built = load_or_build(catalog, args.ra_col, args.dec_col)
+        t_load = time.perf_counter() - t0
+        print(f"\nIndex: {index_path(catalog)} ({'built' if built else 'loaded'} "
+              f"in {t_load*1e3:.1f} ms, {index.n_sources} sources)")
+
+        t0 = time.perf_counter()
+        rows, sep = index.cone(G79_CENTER, args.radius)
+        t_query = time.perf_counter() - t0
+        print(f"   G79 cone ({args.radius*60:.2f} arcmin): {len(rows)} sources "
+              f"in {t_query*1e3:.2f} ms")
+    else:
+        parser.error("catalog_file or --benchmark required")
+
+    print("\n" + "="*80)
+    print("DONE!")
+    print("="*80)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())